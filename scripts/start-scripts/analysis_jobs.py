@@ -0,0 +1,296 @@
+"""
+Background analysis results for the Urbantz AI Document Scanner servers
+"""
+
+import hashlib
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# How long finished results stay available for polling (seconds)
+RESULT_TTL_SECONDS = int(os.environ.get('ANALYSIS_RESULT_TTL', '3600'))
+
+# Default deadline for the LLM in hedged mode (seconds)
+HEDGE_DEADLINE_SECONDS = float(os.environ.get('HEDGE_DEADLINE_SECONDS', '5'))
+# Longest deadline a request may ask for; the request thread waits that long
+MAX_HEDGE_DEADLINE_SECONDS = float(os.environ.get('MAX_HEDGE_DEADLINE_SECONDS', '60'))
+
+# Background workers for refinement jobs, prefetches and late hedged AI calls, shared by all request threads
+JOB_WORKERS = int(os.environ.get('ANALYSIS_JOB_WORKERS', '4'))
+_job_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='analysis-job')
+
+# Workers that run hedged AI calls right away; a hedge never waits behind background jobs
+HEDGE_WORKERS = int(os.environ.get('HEDGE_WORKERS', '4'))
+_hedge_executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix='analysis-hedge')
+_hedge_slots = threading.BoundedSemaphore(HEDGE_WORKERS)
+
+# Content keys remembered by the prefetcher; the oldest are forgotten first
+PREFETCH_MAX_ENTRIES = int(os.environ.get('PREFETCH_MAX_ENTRIES', '1000'))
+
+
+class ResultStore:
+    """Thread-safe in-memory store for results that finish after the response was sent"""
+
+    def __init__(self, ttl=RESULT_TTL_SECONDS):
+        self.ttl = ttl
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def create(self, **fields):
+        """Register a new pending result and return its id"""
+        result_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._purge(now)
+            self._results[result_id] = dict(fields, resultId=result_id, status='pending',
+                                            createdAt=now, updatedAt=now)
+        return result_id
+
+    def update(self, result_id, **fields):
+        """Merge fields into an existing result"""
+        with self._lock:
+            result = self._results.get(result_id)
+            if result is None:
+                return
+            result.update(fields)
+            result['updatedAt'] = time.time()
+
+    def get(self, result_id):
+        """Return a copy of the result, or None when unknown or expired"""
+        with self._lock:
+            self._purge(time.time())
+            result = self._results.get(result_id)
+            return dict(result) if result else None
+
+    def _purge(self, now):
+        """Drop results older than the TTL (caller holds the lock)"""
+        expired = [rid for rid, r in self._results.items() if now - r['updatedAt'] > self.ttl]
+        for rid in expired:
+            del self._results[rid]
+
+
+def run_hedged(fast_fn, slow_fn, deadline, store):
+    """Race slow_fn against a deadline, falling back to the fast_fn result
+
+    Returns (deliveries, method, result_id). When slow_fn misses the deadline the
+    fast result is returned with a result_id under which the slow result will
+    appear in the store once it finishes; otherwise result_id is None. When all
+    hedge workers are busy, slow_fn could not start before the deadline, so it
+    is queued as a background job and the fast result is returned right away.
+    """
+    started = time.monotonic()
+    done = threading.Event()
+    lock = threading.Lock()
+    outcome = {}
+
+    def worker():
+        try:
+            deliveries = slow_fn()
+            if deliveries:
+                fields = dict(status='done', deliveries=deliveries, deliveryCount=len(deliveries))
+            else:
+                fields = dict(status='failed', error='AI returned no deliveries')
+        except Exception as e:
+            fields = dict(status='failed', error=str(e))
+        with lock:
+            outcome.update(fields)
+            # Only a call that missed the deadline has a store entry to fill in
+            if 'resultId' in outcome:
+                store.update(outcome['resultId'], **fields)
+        done.set()
+
+    def hedge():
+        try:
+            worker()
+        finally:
+            _hedge_slots.release()
+
+    if not _hedge_slots.acquire(blocking=False):
+        outcome['resultId'] = store.create(method='ai_extraction')
+        _job_executor.submit(worker)
+        return fast_fn(), 'pattern_matching', outcome['resultId']
+    _hedge_executor.submit(hedge)
+
+    fast_deliveries = fast_fn()
+
+    remaining = deadline - (time.monotonic() - started)
+    done.wait(max(remaining, 0))
+    with lock:
+        if 'status' not in outcome:
+            outcome['resultId'] = store.create(method='ai_extraction')
+            return fast_deliveries, 'pattern_matching', outcome['resultId']
+
+    if outcome['status'] == 'done':
+        return outcome['deliveries'], 'ai_extraction', None
+    return fast_deliveries, 'pattern_matching', None
+
+
+def start_refinement_job(store, deliveries, method, stages):
+    """Register a job seeded with a fast result and refine it in the background
+
+    stages is a list of (name, fn) pairs run in order on a worker thread. Each
+    stage that returns deliveries replaces the current result, so polling
+    clients see the result improve as slower extractors finish.
+    """
+    stage_status = [{"name": method, "status": "done"}]
+    stage_status += [{"name": name, "status": "pending"} for name, _ in stages]
+    job_id = store.create(method=method, deliveries=deliveries,
+                          deliveryCount=len(deliveries), stages=stage_status)
+
+    if not stages:
+        store.update(job_id, status='done')
+        return job_id
+
+    store.update(job_id, status='refining')
+    _job_executor.submit(_run_stages, store, job_id, stages)
+    return job_id
+
+
+def _run_stages(store, job_id, stages):
+    """Run refinement stages in order and publish each improvement"""
+    for index, (name, fn) in enumerate(stages, start=1):
+        job = store.get(job_id)
+        if job is None:
+            return
+        stage_status = [dict(stage) for stage in job['stages']]
+        try:
+            started = time.monotonic()
+            deliveries = fn()
+            stage_status[index].update(status='done' if deliveries else 'empty',
+                                       durationMs=int((time.monotonic() - started) * 1000))
+            if deliveries:
+                store.update(job_id, method=name, deliveries=deliveries,
+                             deliveryCount=len(deliveries), stages=stage_status)
+            else:
+                store.update(job_id, stages=stage_status)
+        except Exception as e:
+            stage_status[index].update(status='failed', error=str(e))
+            store.update(job_id, stages=stage_status)
+
+    store.update(job_id, status='done')
+
+
+def content_key(*parts):
+    """Stable key for the content an analysis runs on"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part or '').encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class Prefetcher:
+    """Runs analyses speculatively, before the request that needs them arrives
+
+    Each content key gets one result in the store. A request for content that was
+    prefetched gets the finished result (a hit), waits for the run in progress
+    (joined), or, when the run has not left the queue yet, takes it over and runs
+    it inline (a miss), so the work is never done twice. Results whose fields say
+    status 'partial' are returned but not reused.
+    """
+
+    def __init__(self, store, executor=_job_executor, max_entries=PREFETCH_MAX_ENTRIES):
+        self.store = store
+        self.executor = executor
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.counts = {"prefetched": 0, "hits": 0, "joined": 0, "misses": 0}
+
+    def _lookup(self, key):
+        """The live entry for key (caller holds the lock)"""
+        entry = self._entries.get(key)
+        if entry and entry["state"] == 'done' and self.store.get(entry["id"]) is None:
+            # The result expired from the store
+            del self._entries[key]
+            return None
+        return entry
+
+    def _register(self, key, **fields):
+        """A new queued entry for key (caller holds the lock)"""
+        entry = {"id": self.store.create(**fields), "state": 'queued', "event": threading.Event(), "fields": fields}
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    def submit(self, key, fn, **fields):
+        """Start fn in the background unless key is known; returns (result id, started)"""
+        with self._lock:
+            entry = self._lookup(key)
+            if entry and entry["state"] != 'failed':
+                return entry["id"], False
+            entry = self._register(key, prefetched=True, **fields)
+            self.counts["prefetched"] += 1
+        self.executor.submit(self._run_queued, entry, fn)
+        return entry["id"], True
+
+    def in_flight(self, field):
+        """Values of a submit() field across entries that are queued or running"""
+        with self._lock:
+            return {entry["fields"][field] for entry in self._entries.values()
+                    if entry["state"] in ('queued', 'running') and field in entry["fields"]}
+
+    def peek(self, key):
+        """The finished result for key, or None"""
+        with self._lock:
+            entry = self._lookup(key)
+            if entry and entry["state"] == 'done':
+                self.counts["hits"] += 1
+                return self.store.get(entry["id"])
+        return None
+
+    def take(self, key, fn, timeout=None):
+        """(result, outcome) for key: a finished prefetch, the one in progress, or fn run inline"""
+        with self._lock:
+            entry = self._lookup(key)
+            state = entry["state"] if entry else None
+            if state == 'done':
+                self.counts["hits"] += 1
+                return self.store.get(entry["id"]), 'hit'
+            if state in (None, 'failed'):
+                entry = self._register(key)
+            if state != 'running':
+                # Claimed here, so a queued background run skips it
+                entry["state"] = 'running'
+                self.counts["misses"] += 1
+        if state != 'running':
+            return self._execute(entry, fn, reraise=True), 'miss'
+
+        result = self.store.get(entry["id"]) if entry["event"].wait(timeout) else None
+        if result and result["status"] in ('done', 'partial'):
+            with self._lock:
+                self.counts["joined"] += 1
+            return result, 'joined'
+        with self._lock:
+            self.counts["misses"] += 1
+        # The prefetch failed or is taking too long
+        fields = fn()
+        fields.pop('status', None)
+        return dict(fields, resultId=entry["id"]), 'miss'
+
+    def _run_queued(self, entry, fn):
+        with self._lock:
+            if entry["state"] != 'queued':
+                return
+            entry["state"] = 'running'
+        self._execute(entry, fn, reraise=False)
+
+    def _execute(self, entry, fn, reraise):
+        try:
+            fields = fn()
+            status = fields.pop('status', 'done')
+            self.store.update(entry["id"], status=status, **fields)
+            entry["state"] = 'done' if status == 'done' else 'failed'
+            return dict(fields, status=status, resultId=entry["id"])
+        except Exception as e:
+            self.store.update(entry["id"], status='failed', error=str(e))
+            entry["state"] = 'failed'
+            if reraise:
+                raise
+        finally:
+            entry["event"].set()
@@ -0,0 +1,239 @@
+"""
+Minimal Anthropic Messages API client with structured delivery output
+"""
+
+import gzip
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+
+ANTHROPIC_BASE_URL = os.environ.get('ANTHROPIC_BASE_URL', 'https://api.anthropic.com').rstrip('/')
+ANTHROPIC_VERSION = '2023-06-01'
+CLAUDE_MODEL = os.environ.get('CLAUDE_MODEL', 'claude-3-5-sonnet-20241022')
+
+# Traffic capture: 'off', 'record' (log every call) or 'replay' (serve calls from the log)
+CLAUDE_TRAFFIC_MODE = os.environ.get('CLAUDE_TRAFFIC_MODE', 'off').lower()
+CLAUDE_TRAFFIC_LOG = os.environ.get('CLAUDE_TRAFFIC_LOG', 'claude-traffic.jsonl.gz')
+# Replayed latency = recorded latency * scale (0 replays as fast as possible)
+CLAUDE_REPLAY_LATENCY_SCALE = float(os.environ.get('CLAUDE_REPLAY_LATENCY_SCALE', '1'))
+
+# Announce payload fields as documented in src/clients/urbantz.ts
+DELIVERY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "customerRef": {"type": "string", "description": "Referentie nummer (ORD-XXX, REF:, ...)"},
+        "deliveryAddress": {
+            "type": "object",
+            "properties": {
+                "line1": {"type": "string", "description": "Volledig adres (straat, nummer, postcode, stad)"},
+                "contactName": {"type": "string", "description": "Naam klant/bedrijf"},
+                "contactPhone": {"type": "string", "description": "Telefoonnummer"}
+            },
+            "required": ["line1"]
+        },
+        "serviceDate": {"type": "string", "description": "Leverdatum in YYYY-MM-DD"},
+        "timeWindowStart": {"type": "string", "description": "Start tijd (HH:MM)"},
+        "timeWindowEnd": {"type": "string", "description": "Eind tijd (HH:MM)"},
+        "items": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "description": {"type": "string"},
+                    "quantity": {"type": "integer"},
+                    "tempClass": {"type": "string", "enum": ["ambient", "chilled", "frozen"]}
+                },
+                "required": ["description", "quantity"]
+            }
+        },
+        "notes": {"type": "string"},
+        "priority": {"type": "string", "enum": ["low", "normal", "high"]}
+    },
+    "required": ["customerRef", "deliveryAddress"]
+}
+
+DELIVERY_TOOL = {
+    "name": "record_deliveries",
+    "description": "Registreer alle leveringen die in het document gevonden zijn, één object per levering.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "deliveries": {"type": "array", "items": DELIVERY_SCHEMA}
+        },
+        "required": ["deliveries"]
+    }
+}
+
+
+class TruncatedResponse(RuntimeError):
+    """Claude reached max_tokens before the tool call was complete"""
+
+
+def build_delivery_request(prompt, model=CLAUDE_MODEL, max_tokens=8000):
+    """Build a Messages API body that forces the record_deliveries tool"""
+    return {
+        "model": model,
+        "max_tokens": max_tokens,
+        "tools": [DELIVERY_TOOL],
+        "tool_choice": {"type": "tool", "name": DELIVERY_TOOL["name"]},
+        "messages": [
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+    }
+
+
+class TrafficLog:
+    """Append-only log of Messages API calls that can be replayed later
+
+    Each line holds the request hash, a hash of the prompt text (the prompt itself
+    is not stored), the model, the observed latency and the response status and
+    body. Paths ending in .gz are written gzip-compressed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._replay = None
+
+    def _open(self, mode):
+        if self.path.endswith('.gz'):
+            return gzip.open(self.path, mode + 't', encoding='utf-8')
+        return open(self.path, mode, encoding='utf-8')
+
+    def record(self, request_data, latency, status, body):
+        entry = {
+            "key": request_key(request_data),
+            "promptHash": _sha256(json.dumps(request_data.get('messages'), sort_keys=True)),
+            "model": request_data.get('model'),
+            "latencyMs": int(latency * 1000),
+            "status": status,
+            "body": body,
+            "recordedAt": int(time.time())
+        }
+        line = json.dumps(entry, ensure_ascii=False, separators=(',', ':'))
+        with self._lock:
+            with self._open('a') as f:
+                f.write(line + '\n')
+
+    def replay(self, request_data, url):
+        """Serve a recorded call, sleeping for its (scaled) original latency"""
+        with self._lock:
+            if self._replay is None:
+                self._replay = self._load()
+            entries = self._replay.get(request_key(request_data))
+            if not entries:
+                raise LookupError(f"No recorded Claude response for request {request_key(request_data)[:12]}")
+            # Rotate so repeated identical requests replay every recorded variant in turn
+            entry = entries.pop(0)
+            entries.append(entry)
+
+        time.sleep(entry['latencyMs'] / 1000 * CLAUDE_REPLAY_LATENCY_SCALE)
+
+        if entry['status'] != 200:
+            raise urllib.error.HTTPError(url, entry['status'], 'Replayed error', {},
+                                         io.BytesIO(json.dumps(entry['body']).encode('utf-8')))
+        return entry['body']
+
+    def _load(self):
+        recorded = {}
+        with self._open('r') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    recorded.setdefault(entry['key'], []).append(entry)
+        print(f"📼 Loaded {sum(len(v) for v in recorded.values())} recorded Claude calls from {self.path}")
+        return recorded
+
+
+def _sha256(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def request_key(request_data):
+    """Stable hash of a Messages API request body"""
+    return _sha256(json.dumps(request_data, sort_keys=True, ensure_ascii=False))
+
+
+TRAFFIC_LOG = TrafficLog(CLAUDE_TRAFFIC_LOG) if CLAUDE_TRAFFIC_MODE in ('record', 'replay') else None
+
+
+def post_messages(request_data, api_key, timeout=30):
+    """POST a body to /v1/messages and return the decoded JSON response
+
+    In record mode every call is appended to the traffic log; in replay mode the
+    call is answered from the log without touching the network.
+    """
+    url = f'{ANTHROPIC_BASE_URL}/v1/messages'
+    if CLAUDE_TRAFFIC_MODE == 'replay':
+        return TRAFFIC_LOG.replay(request_data, url)
+
+    started = time.monotonic()
+    try:
+        result = _post_messages(url, request_data, api_key, timeout)
+    except urllib.error.HTTPError as e:
+        if CLAUDE_TRAFFIC_MODE == 'record':
+            error_body = e.read()
+            try:
+                body = json.loads(error_body.decode('utf-8'))
+            except ValueError:
+                body = {"raw": error_body.decode('utf-8', 'replace')}
+            TRAFFIC_LOG.record(request_data, time.monotonic() - started, e.code, body)
+            raise urllib.error.HTTPError(url, e.code, e.msg, e.headers, io.BytesIO(error_body))
+        raise
+
+    if CLAUDE_TRAFFIC_MODE == 'record':
+        TRAFFIC_LOG.record(request_data, time.monotonic() - started, 200, result)
+    return result
+
+
+def _post_messages(url, request_data, api_key, timeout):
+    req = urllib.request.Request(
+        url,
+        data=json.dumps(request_data).encode('utf-8'),
+        headers={
+            'x-api-key': api_key,
+            'Content-Type': 'application/json',
+            'anthropic-version': ANTHROPIC_VERSION
+        }
+    )
+
+    with urllib.request.urlopen(req, timeout=timeout) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+
+def parse_delivery_response(result):
+    """Return the deliveries from a record_deliveries tool call, or None"""
+    for block in result.get('content') or []:
+        if block.get('type') == 'tool_use' and block.get('name') == DELIVERY_TOOL["name"]:
+            deliveries = (block.get('input') or {}).get('deliveries')
+            if isinstance(deliveries, list):
+                return deliveries
+    return None
+
+
+def extract_deliveries(prompt, api_key, timeout=30):
+    """Send a delivery extraction prompt and return the structured deliveries
+
+    Raises TruncatedResponse when the output hit max_tokens: the tool input is then
+    cut off and its delivery list is incomplete.
+    """
+    result = post_messages(build_delivery_request(prompt), api_key, timeout=timeout)
+    deliveries = parse_delivery_response(result)
+
+    usage = result.get('usage') or {}
+    print(f"🤖 Claude tool output: {len(deliveries) if deliveries is not None else 'no'} deliveries "
+          f"({usage.get('input_tokens', '?')} in / {usage.get('output_tokens', '?')} out tokens, "
+          f"stop_reason={result.get('stop_reason')})")
+
+    if result.get('stop_reason') == 'max_tokens':
+        raise TruncatedResponse(f"Claude output truncated at {usage.get('output_tokens', '?')} tokens "
+                                f"({len(deliveries or [])} deliveries received)")
+    return deliveries
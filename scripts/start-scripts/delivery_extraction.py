@@ -0,0 +1,393 @@
+"""
+Delivery extraction from document text: Claude with a pattern matching fallback
+
+Holds no server state, so the server, the mailbox and watch-folder workers and
+any spawned process can import it without side effects. Text is slimmed by the
+prompt diet before it goes to Claude.
+"""
+
+import datetime
+import json
+import os
+import re
+import time
+
+import claude_client
+import prompt_diet
+
+# Strip signatures, quoted replies and footers before text goes to Claude (PROMPT_DIET=0 disables)
+PROMPT_DIET_ENABLED = os.environ.get('PROMPT_DIET', '1') != '0'
+
+
+def extract_deliveries(text, html_content='', sections=None):
+    """Improved delivery extraction using Anthropic Claude API with few-shot learning
+
+    Returns {"deliveries", "promptDiet", "claudeFailed"}; promptDiet holds the token savings when
+    Claude was called, claudeFailed is set when a Claude error made it fall back to pattern matching.
+    """
+    # Try to use Anthropic Claude API first
+    anthropic_api_key = os.environ.get('ANTHROPIC_API_KEY')
+    diet_stats = None
+    claude_failed = False
+
+    if anthropic_api_key:
+        try:
+            print("🤖 Using Anthropic Claude API for AI analysis...")
+
+            # DEBUG: Log the prompt being sent
+            print("\n📤 SENDING TO AI:")
+            print(f"Text to analyze (first 300 chars): {text[:300]}...")
+
+            deliveries, diet_stats = extract_deliveries_with_claude(text, api_key=anthropic_api_key)
+
+            # DEBUG: Log what we got back
+            print(f"\n📨 AI RESPONSE:")
+            print(f"Number of deliveries: {len(deliveries) if deliveries else 0}")
+            if deliveries:
+                print(f"First delivery: {json.dumps(deliveries[0], indent=2)}")
+
+            if deliveries:
+                print(f"✅ Claude API extracted {len(deliveries)} delivery(ies)")
+                return {"deliveries": deliveries, "promptDiet": diet_stats, "claudeFailed": False}
+        except Exception as e:
+            print(f"⚠️ Claude API error: {e}")
+            claude_failed = True
+            import traceback
+            traceback.print_exc()
+            print("   Falling back to pattern matching...")
+    else:
+        print("⚠️ ANTHROPIC_API_KEY not found, using pattern matching")
+
+    # Fallback to pattern matching
+    return {"deliveries": extract_deliveries_with_patterns(text, sections), "promptDiet": diet_stats,
+            "claudeFailed": claude_failed}
+
+
+def extract_deliveries_with_claude(text, api_key):
+    """Extract deliveries using Anthropic Claude API with structured tool output
+
+    Returns (deliveries, prompt diet stats); the stats are None with PROMPT_DIET=0.
+    """
+    diet_stats = None
+    if PROMPT_DIET_ENABLED:
+        text, diet_stats = prompt_diet.slim_text(text)
+        print(f"✂️ Prompt diet: ~{diet_stats['tokensSaved']} tokens saved "
+              f"({diet_stats['tokensBefore']} → {diet_stats['tokensAfter']})")
+
+    prompt = f"""
+Je bent een expert in het analyseren van leveringsdocumenten, emails en tabellen. 
+
+=== STAP 1: ANALYSE VAN HET DOCUMENT ===
+Analyseer eerst het document en bepaal:
+1. Wat is het FORMAT? (tabel, genummerde lijst, paragrafen, enkele levering, etc.)
+2. Hoeveel LEVERINGEN zijn er? (tel zorgvuldig alle aparte leveringen)
+3. Hoe is de DATA GESTRUCTUREERD? (kolommen, bullets, tekst)
+
+=== VOORBEELDEN VAN VERSCHILLENDE FORMATEN ===
+
+VOORBEELD A - TABEL FORMAT (meerdere leveringen):
+```
+| Ref | Klant | Adres | Tijdslot | Contact |
+| ORD-001 | Bakkerij Jan | Hoofdstraat 1, Brussel | 08:00–10:00 | +32 2 123 45 67 |
+| ORD-002 | Café Marie | Kerkstraat 5, Antwerpen | 09:00–11:00 | +32 3 234 56 78 |
+```
+→ Format: TABEL
+→ Aantal leveringen: 2 (één per rij)
+→ Output: Array met 2 objecten
+
+VOORBEELD B - GENUMMERDE LIJST (meerdere leveringen):
+```
+1. REF: ORD-001
+   Klant: Bakkerij Jan
+   Adres: Hoofdstraat 1, Brussel
+   Tijd: 08:00 - 10:00
+
+2. REF: ORD-002
+   Klant: Café Marie
+   Adres: Kerkstraat 5, Antwerpen
+   Tijd: 09:00 - 11:00
+```
+→ Format: GENUMMERDE LIJST
+→ Aantal leveringen: 2 (één per nummer)
+→ Output: Array met 2 objecten
+
+VOORBEELD C - ENKELE LEVERING (één levering):
+```
+Levering: BXL2501
+Adres: Fleur du Jour, Vlaanderenstraat 16, 9000 Gent
+Contact: +32 497 30 52 10
+Tijd: 10:00 - 13:00
+```
+→ Format: ENKELE LEVERING
+→ Aantal leveringen: 1
+→ Output: Array met 1 object
+
+=== STAP 2: EXTRACTIE REGELS ===
+
+Voor TABEL format:
+- Elke DATA RIJ (niet de header) = 1 levering
+- Map kolommen naar velden (Ref→customerRef, Klant→contactName, etc.)
+
+Voor GENUMMERDE LIJST:
+- Elk genummerd item = 1 levering
+- Extraheer velden uit elk item
+
+Voor ENKELE LEVERING:
+- Alle info behoort tot 1 levering
+- Extraheer alle beschikbare velden
+
+Voor PARAGRAFEN/VRIJE TEKST:
+- Zoek naar scheiding tussen leveringen (nummering, witruimte, "levering X", etc.)
+- Elke aparte levering sectie = 1 levering
+
+=== STAP 3: VELD EXTRACTIE ===
+Voor elke levering:
+- customerRef: Referentie nummer (ORD-XXX, REF:, etc.)
+- deliveryAddress:
+  - line1: Volledig adres (straat, nummer, postcode, stad)
+  - contactName: Naam klant/bedrijf
+  - contactPhone: Telefoonnummer
+- serviceDate: Leverdatum in YYYY-MM-DD (haal uit email tekst, gebruik voor alle leveringen)
+- timeWindowStart: Start tijd (HH:MM)
+- timeWindowEnd: Eind tijd (HH:MM)
+- items: [{{description: "Standaard levering", quantity: 1, tempClass: "ambient"}}]
+- notes: Relevante extra info
+- priority: "normal" (tenzij urgent/spoed vermeld)
+
+=== TEKST OM TE ANALYSEREN ===
+{text}
+
+=== OUTPUT FORMAT ===
+Roep de tool record_deliveries aan met EXACT het aantal leveringen dat je hebt gevonden.
+- Als het een tabel is met 10 rijen → 10 leveringen
+- Als het een lijst is met 5 items → 5 leveringen  
+- Als het 1 enkele levering is → 1 levering
+
+Schrijf geen uitleg, gebruik alleen de tool.
+"""
+
+    return claude_client.extract_deliveries(prompt, api_key), diet_stats
+
+
+def extract_deliveries_with_patterns(text, sections=None):
+    """Fallback: Extract deliveries using pattern matching"""
+    deliveries = []
+
+    # Improved pattern matching; multi-page PDFs arrive already split and stitched
+    sections = sections or detect_delivery_sections(text)
+
+    for i, section in enumerate(sections):
+        delivery = {
+            "taskId": f"TASK-{int(time.time() * 1000)}-{i + 1}",
+            "customerRef": extract_customer_ref(section),
+            "deliveryAddress": extract_address(section),
+            "serviceDate": extract_date(section),
+            "timeWindowStart": extract_time_start(section),
+            "timeWindowEnd": extract_time_end(section),
+            "items": extract_items(section),
+            "notes": f"Geëxtraheerd uit sectie {i + 1}",
+            "priority": "normal"
+        }
+
+        # Only add if we found meaningful data
+        if delivery["customerRef"] != "AUTO-NOTFOUND" or delivery["deliveryAddress"]["line1"] != "Adres niet gevonden":
+            deliveries.append(delivery)
+
+    return deliveries
+
+
+def detect_delivery_sections(text):
+    """Detect delivery sections in text"""
+    # Look for clear section separators
+    sections = []
+
+    # Try to split by REF: patterns
+    ref_sections = re.split(r'(?=REF:\s*[A-Z0-9-]+)', text, flags=re.IGNORECASE)
+    if len(ref_sections) > 1:
+        sections.extend([s for s in ref_sections if s.strip()])
+
+    # If no REF sections, try other patterns
+    if not sections:
+        section_patterns = [
+            r'(?=Klant:\s*)',
+            r'(?=Adres:\s*)',
+            r'(?=lever|delivery)'
+        ]
+
+        for pattern in section_patterns:
+            parts = re.split(pattern, text, flags=re.IGNORECASE)
+            if len(parts) > 1:
+                sections.extend([p for p in parts if p.strip() and len(p.strip()) > 50])
+                break
+
+    # Fallback to full text
+    if not sections:
+        sections = [text]
+
+    return sections
+
+
+def extract_customer_ref(text):
+    """Extract customer reference with improved patterns"""
+    patterns = [
+        r'REF:\s*([A-Z0-9-]+)',
+        r'Klant:\s*([A-Z0-9-]+)',
+        r'Customer:\s*([A-Z0-9-]+)',
+        r'Order:\s*([A-Z0-9-]+)',
+        r'([A-Z]{2,}\d{3,})'
+    ]
+
+    for pattern in patterns:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            return match.group(1).strip()
+
+    return "AUTO-NOTFOUND"
+
+
+def extract_address(text):
+    """Extract address with improved patterns"""
+    patterns = [
+        r'Adres:\s*([^\n\r]+)',
+        r'Address:\s*([^\n\r]+)',
+        r'([A-Za-z\s]+(?:straat|street|laan|avenue|plein|square|weg|road)\s+\d+[^\n\r]*)',
+        r'([A-Za-z\s]+\d+[A-Za-z]?\s*,\s*\d{4}\s+[A-Za-z\s]+)'
+    ]
+
+    for pattern in patterns:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            address = match.group(1).strip()
+            return {
+                "line1": address,
+                "contactName": extract_contact_name(text),
+                "contactPhone": extract_phone(text)
+            }
+
+    return {
+        "line1": "Adres niet gevonden",
+        "contactName": "Onbekend",
+        "contactPhone": "+32 000 000 000"
+    }
+
+
+def extract_contact_name(text):
+    """Extract contact name"""
+    patterns = [
+        r'Klant:\s*([^\n\r]+)',
+        r'Contact:\s*([^\n\r]+)',
+        r'Naam:\s*([^\n\r]+)',
+        r'([A-Z][a-z]+\s+[A-Z][a-z]+)'
+    ]
+
+    for pattern in patterns:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            return match.group(1).strip()
+
+    return "Contact persoon"
+
+
+def extract_phone(text):
+    """Extract phone number"""
+    patterns = [
+        r'Nummer:\s*(\+32\s?\d{2,3}\s?\d{2,3}\s?\d{2,3})',
+        r'(\+32\s?\d{2,3}\s?\d{2,3}\s?\d{2,3})',
+        r'(0\d{2,3}\s?\d{2,3}\s?\d{2,3})'
+    ]
+
+    for pattern in patterns:
+        match = re.search(pattern, text)
+        if match:
+            return match.group(1)
+
+    return "+32 000 000 000"
+
+
+def extract_date(text):
+    """Extract date with improved patterns"""
+    patterns = [
+        r'Datum:\s*(\d{1,2}[-\/]\d{1,2}[-\/]\d{2,4})',
+        r'Date:\s*(\d{1,2}[-\/]\d{1,2}[-\/]\d{2,4})',
+        r'(\d{4}-\d{2}-\d{2})',
+        r'(\d{1,2}[-\/]\d{1,2}[-\/]\d{2,4})'
+    ]
+
+    for pattern in patterns:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            date_str = match.group(1)
+            # Convert to ISO format
+            if '/' in date_str:
+                parts = date_str.split('/')
+                if len(parts[2]) == 2:
+                    parts[2] = '20' + parts[2]
+                return f"{parts[2]}-{parts[1].zfill(2)}-{parts[0].zfill(2)}"
+            elif '-' in date_str:
+                return date_str
+
+    # Default to tomorrow
+    tomorrow = datetime.datetime.now() + datetime.timedelta(days=1)
+    return tomorrow.strftime('%Y-%m-%d')
+
+
+def extract_time_start(text):
+    """Extract start time"""
+    patterns = [
+        r'Tijd:\s*(\d{1,2}:\d{2})\s*(?:-|tot)',
+        r'Time:\s*(\d{1,2}:\d{2})\s*(?:-|tot)',
+        r'(\d{1,2}:\d{2})\s*(?:tot|-)'
+    ]
+
+    for pattern in patterns:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            return match.group(1)
+
+    return "09:00"
+
+
+def extract_time_end(text):
+    """Extract end time"""
+    patterns = [
+        r'Tijd:\s*\d{1,2}:\d{2}\s*(?:-|tot)\s*(\d{1,2}:\d{2})',
+        r'Time:\s*\d{1,2}:\d{2}\s*(?:-|tot)\s*(\d{1,2}:\d{2})',
+        r'(\d{1,2}:\d{2})\s*(?:einde|end)'
+    ]
+
+    for pattern in patterns:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            return match.group(1)
+
+    return "17:00"
+
+
+def extract_items(text):
+    """Extract items"""
+    items = []
+
+    # Look for item patterns
+    patterns = [
+        r'Items:\s*([^\n\r]+)',
+        r'Pakketten:\s*([^\n\r]+)',
+        r'(\d+\s*(?:x|stuks?|pakketten?))'
+    ]
+
+    for pattern in patterns:
+        matches = re.findall(pattern, text, re.IGNORECASE)
+        for match in matches:
+            items.append({
+                "description": match.strip(),
+                "quantity": 1,
+                "tempClass": "ambient"
+            })
+
+    if not items:
+        items.append({
+            "description": "Pakket uit document",
+            "quantity": 1,
+            "tempClass": "ambient"
+        })
+
+    return items
@@ -0,0 +1,256 @@
+"""
+Batch validation of deliveries against the /v2/announce request schema
+
+The schema is read once from docs/urbantz/openapi.yaml and compiled into nested
+check functions, so validating a batch is a single pass without re-interpreting
+the schema per delivery. Run this file directly to benchmark it.
+"""
+
+import copy
+import os
+import re
+import sys
+import time
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+OPENAPI_PATH = os.environ.get(
+    'URBANTZ_OPENAPI_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'docs', 'urbantz', 'openapi.yaml'))
+
+# Used when PyYAML is missing or the spec has no /v2/announce body; mirrors docs/urbantz/openapi.yaml
+FALLBACK_ANNOUNCE_SCHEMA = {
+    "type": "object",
+    "required": ["customerRef", "deliveryAddress", "serviceDate"],
+    "properties": {
+        "customerRef": {"type": "string"},
+        "deliveryAddress": {"type": "object", "properties": {"line1": {"type": "string"}}},
+        "serviceDate": {"type": "string", "format": "date"}
+    }
+}
+
+# Checks done by api/urbantz.js that the spec does not declare; spec definitions win
+API_RULES = {
+    "properties": {
+        "deliveryAddress": {"required": ["line1"]},
+        "timeWindowStart": {"type": "string", "format": "time"},
+        "timeWindowEnd": {"type": "string", "format": "time"},
+        "items": {"type": "array", "items": {"type": "object"}},
+        "notes": {"type": "string"}
+    }
+}
+
+FORMAT_PATTERNS = {
+    "date": (r"^\d{4}-(0[1-9]|1[0-2])-(0[1-9]|[12]\d|3[01])$", "a date in YYYY-MM-DD format"),
+    "date-time": (r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}", "an ISO 8601 date-time"),
+    # Time windows are HH:MM in api/urbantz.js rather than the HH:MM:SS of JSON Schema
+    "time": (r"^\d{2}:\d{2}$", "a time in HH:MM format")
+}
+
+# Invalid rows listed in a batch report; the counts always cover the whole batch
+MAX_REPORTED_ROWS = 1000
+
+_INDEX = re.compile(r'\[\d+\]')
+
+
+def load_announce_schema(path=OPENAPI_PATH):
+    """Request body schema of POST /v2/announce, merged with the api/urbantz.js rules"""
+    schema = None
+    if yaml is None:
+        print("⚠️  PyYAML not installed, validating against the built-in announce schema")
+    elif os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            spec = yaml.safe_load(f) or {}
+        try:
+            schema = spec['paths']['/v2/announce']['post']['requestBody']['content']['application/json']['schema']
+        except (KeyError, TypeError):
+            print(f"⚠️  No /v2/announce request schema in {path}, using the built-in one")
+    return _merge(copy.deepcopy(schema or FALLBACK_ANNOUNCE_SCHEMA), API_RULES)
+
+
+def _merge(schema, rules):
+    """Add rules to a schema without overriding what the schema already defines"""
+    for key, value in rules.items():
+        if key == 'properties':
+            properties = schema.setdefault('properties', {})
+            for name, sub in value.items():
+                properties[name] = _merge(properties[name], sub) if name in properties else copy.deepcopy(sub)
+        elif key == 'required':
+            required = list(schema.get('required') or [])
+            schema['required'] = required + [name for name in value if name not in required]
+        else:
+            schema.setdefault(key, value)
+    return schema
+
+
+def _join(path, name):
+    return f"{path}.{name}" if path else name
+
+
+def _compile(schema, path):
+    """Compile a schema node into check(value, errors); absent and null values are not checked"""
+    kind = schema.get('type')
+    enum = tuple(schema['enum']) if 'enum' in schema else None
+
+    if kind == 'object' or 'properties' in schema:
+        properties = tuple((name, _compile(sub, _join(path, name)))
+                           for name, sub in (schema.get('properties') or {}).items())
+        required = tuple((name, f"{_join(path, name)}: is required") for name in schema.get('required') or ())
+        not_object = f"{path or 'delivery'}: must be an object"
+
+        def check(value, errors):
+            if not isinstance(value, dict):
+                errors.append(not_object)
+                return
+            for name, message in required:
+                # Like api/urbantz.js, an empty string does not count as present
+                if value.get(name) in (None, ''):
+                    errors.append(message)
+            for name, check_property in properties:
+                item = value.get(name)
+                if item is not None:
+                    check_property(item, errors)
+        return check
+
+    if kind == 'array':
+        check_item = _compile(schema.get('items') or {}, f"{path}[]")
+        not_array = f"{path}: must be an array"
+        marker = f"{path}[]"
+
+        def check(value, errors):
+            if not isinstance(value, list):
+                errors.append(not_array)
+                return
+            for i, item in enumerate(value):
+                before = len(errors)
+                check_item(item, errors)
+                # Only failing items pay for putting the index into the message
+                for j in range(before, len(errors)):
+                    errors[j] = errors[j].replace(marker, f"{path}[{i}]", 1)
+        return check
+
+    if kind == 'string':
+        pattern, description = None, None
+        if schema.get('format') in FORMAT_PATTERNS:
+            pattern, description = FORMAT_PATTERNS[schema['format']]
+        elif schema.get('pattern'):
+            pattern, description = schema['pattern'], f"text matching {schema['pattern']}"
+        match = re.compile(pattern).match if pattern else None
+        not_string = f"{path}: must be a string"
+        bad_format = f"{path}: must be {description}"
+        bad_enum = f"{path}: must be one of {', '.join(map(str, enum))}" if enum else None
+
+        def check(value, errors):
+            if not isinstance(value, str):
+                errors.append(not_string)
+            elif match and not match(value):
+                errors.append(bad_format)
+            elif enum and value not in enum:
+                errors.append(bad_enum)
+        return check
+
+    if kind in ('integer', 'number', 'boolean'):
+        types = {'integer': int, 'number': (int, float), 'boolean': bool}[kind]
+        wrong_type = f"{path}: must be {'an' if kind == 'integer' else 'a'} {kind}"
+        minimum = schema.get('minimum')
+        too_small = f"{path}: must be at least {minimum}"
+
+        def check(value, errors):
+            # bool is a subclass of int, but true is not a valid quantity
+            if not isinstance(value, types) or (kind != 'boolean' and isinstance(value, bool)):
+                errors.append(wrong_type)
+            elif minimum is not None and value < minimum:
+                errors.append(too_small)
+        return check
+
+    return lambda value, errors: None
+
+
+class DeliveryValidator:
+    """Validates deliveries against a schema compiled once"""
+
+    def __init__(self, schema=None):
+        self.schema = schema if schema is not None else load_announce_schema()
+        self._check = _compile(self.schema, '')
+
+    def errors(self, delivery):
+        """All problems with one delivery; an empty list means it is valid"""
+        errors = []
+        self._check(delivery, errors)
+        return errors
+
+    def validate_batch(self, deliveries, max_rows=MAX_REPORTED_ROWS):
+        """Validate a whole batch in one pass and aggregate the errors
+
+        deliveries may be any iterable. The report counts every error message
+        (array indexes folded into []) and lists at most max_rows invalid rows.
+        """
+        check = self._check
+        total = invalid = 0
+        counts = {}
+        rows = []
+        for index, delivery in enumerate(deliveries):
+            total += 1
+            errors = []
+            check(delivery, errors)
+            if not errors:
+                continue
+            invalid += 1
+            for message in errors:
+                key = _INDEX.sub('[]', message)
+                counts[key] = counts.get(key, 0) + 1
+            if len(rows) < max_rows:
+                rows.append({
+                    "index": index,
+                    "customerRef": delivery.get('customerRef') if isinstance(delivery, dict) else None,
+                    "errors": errors
+                })
+        return {
+            "total": total,
+            "valid": total - invalid,
+            "invalid": invalid,
+            "errorCounts": dict(sorted(counts.items(), key=lambda kv: -kv[1])),
+            "rows": rows,
+            "truncated": invalid > len(rows)
+        }
+
+
+ANNOUNCE_VALIDATOR = DeliveryValidator()
+
+
+def benchmark(count=100_000, invalid_ratio=0.1):
+    """Time validate_batch on generated deliveries and print the throughput"""
+    deliveries = []
+    for i in range(count):
+        delivery = {
+            "customerRef": f"ORD-{i:06d}",
+            "deliveryAddress": {"line1": f"Kerkstraat {i % 200 + 1}, 2000 Antwerpen",
+                                "contactName": "Café Marie", "contactPhone": "+32 3 123 45 67"},
+            "serviceDate": "2025-10-11",
+            "timeWindowStart": "08:00",
+            "timeWindowEnd": "10:00",
+            "items": [{"description": "Broodjes", "quantity": 3}],
+            "notes": "Achterdeur"
+        }
+        if i % int(1 / invalid_ratio) == 0:
+            delivery["serviceDate"] = "11/10/2025"
+            delivery["timeWindowEnd"] = "10u"
+        deliveries.append(delivery)
+
+    started = time.perf_counter()
+    report = ANNOUNCE_VALIDATOR.validate_batch(deliveries)
+    elapsed = time.perf_counter() - started
+
+    print(f"⏱️  Validated {count:,} deliveries in {elapsed * 1000:.0f} ms "
+          f"({count / elapsed:,.0f}/s, {elapsed / count * 1e6:.2f} µs per delivery)")
+    print(f"   {report['valid']:,} valid, {report['invalid']:,} invalid")
+    for message, n in report['errorCounts'].items():
+        print(f"   {n:>7,} × {message}")
+    return elapsed
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,282 @@
+"""
+Analysis of uploaded documents: PDFs page by page, emails part by part, spreadsheets and text
+
+A DocumentAnalyzer works on the documents of one UploadStore and keeps no other
+state, so the server and the mailbox and watch-folder worker processes each
+create their own. Text goes through delivery_extraction.
+"""
+
+import os
+import sys
+from io import BytesIO
+
+import delivery_extraction
+import email_ingest
+import json_stream
+import pdf_pages
+import pdf_text
+import spreadsheet_ingest
+from export_store import idempotency_key
+from upload_store import UploadStore
+
+# Per worker process of the mailbox and watch-folder tools: the analyzer set up by init_worker
+worker_analyzer = None
+
+
+def analysis_artifact():
+    """Name of the stored analysis; AI and pattern results are cached separately"""
+    return 'analysis-ai.json' if os.environ.get('ANTHROPIC_API_KEY') else 'analysis-patterns.json'
+
+
+class DocumentAnalyzer:
+    """Extracts deliveries from documents in an upload store"""
+
+    def __init__(self, store, pdf_workers=None):
+        self.store = store
+        # Page extraction processes per PDF; None uses PDF_WORKERS
+        self.pdf_workers = pdf_workers
+
+    def analyze_text(self, text, html_content=''):
+        """Fields of a text analysis as kept in the result store"""
+        extraction = delivery_extraction.extract_deliveries(text, html_content)
+        deliveries = extraction["deliveries"]
+        return {
+            "deliveries": deliveries,
+            "deliveryCount": len(deliveries),
+            "promptDiet": extraction["promptDiet"],
+            # A pattern fallback after a Claude error is answered but not reused
+            "status": 'partial' if extraction["claudeFailed"] else 'done'
+        }
+
+    def upload_analysis(self, sha, file_name, kind=None):
+        """Fields of an upload analysis as kept in the result store"""
+        response, status = self.analyze_upload(sha, file_name, kind)
+        return {
+            "response": response,
+            "httpStatus": status,
+            "deliveryCount": response.get("deliveryCount", 0),
+            "status": 'partial' if response.get("claudeFailed") else 'done'
+        }
+
+    def analyze_upload(self, sha, file_name, kind=None):
+        """Analyze a stored PDF, email, spreadsheet or text file; returns (response, HTTP status)"""
+        with self.store.open(sha) as f:
+            head = f.read(1024)
+        kind = kind or email_ingest.attachment_kind(file_name, '', head)
+        if kind == 'other':
+            if email_ingest.looks_like_email(head):
+                kind = 'email'
+            elif spreadsheet_ingest.detect_format(head, file_name) == 'csv':
+                kind = 'text'
+
+        if kind == 'pdf':
+            try:
+                response, status = self.analyze_stored_pdf(sha, file_name)
+            except pdf_text.PDFError as e:
+                response, status = {"success": False, "error": str(e)}, 422
+        elif kind == 'email':
+            response, status = self.analyze_stored_email(sha)
+        elif kind in ('csv', 'xlsx'):
+            try:
+                with self.store.open(sha) as f:
+                    deliveries, columns = spreadsheet_ingest.read_deliveries(f, kind)
+                response, status = {
+                    "success": True,
+                    "confidence": 95,
+                    "deliveries": deliveries,
+                    "deliveryCount": len(deliveries),
+                    "multipleDeliveries": len(deliveries) > 1,
+                    "aiPowered": False,
+                    "method": "column_mapping",
+                    "columns": columns
+                }, 200
+            except spreadsheet_ingest.SpreadsheetError as e:
+                if kind == 'xlsx':
+                    response, status = {"success": False, "error": str(e)}, 422
+                else:
+                    # No known column headers; read it as plain text
+                    kind = 'text'
+        elif kind != 'text':
+            response, status = {"success": False, "error": "Unsupported file type"}, 415
+
+        if kind == 'text':
+            with self.store.open(sha) as f:
+                text = f.read().decode('utf-8', errors='replace')
+            extraction = delivery_extraction.extract_deliveries(text)
+            deliveries = extraction["deliveries"]
+            response, status = {
+                "success": True,
+                "confidence": 80,
+                "rawText": text,
+                "deliveries": deliveries,
+                "deliveryCount": len(deliveries),
+                "multipleDeliveries": len(deliveries) > 1,
+                "claudeFailed": extraction["claudeFailed"]
+            }, 200
+        return dict(response, kind=kind, fileName=file_name, uploadId=sha), status
+
+    def analyze_file(self, path):
+        """Copy a local file into the upload store and analyze it like an upload"""
+        file_name = os.path.basename(path)
+        with open(path, 'rb') as f:
+            sha, _ = self.store.put(f, name=file_name)
+        with self.store.hold(sha):
+            return self.analyze_upload(sha, file_name)
+
+    def analyze_stored_pdf(self, sha, file_name):
+        """Analyze a PDF from the upload store; returns (response, HTTP status)"""
+        # A file seen before is answered from its stored analysis without parsing it again
+        cached = self.store.get_json(sha, analysis_artifact())
+        if cached:
+            print(f"📦 {file_name}: known upload {sha[:12]}, returning stored analysis")
+            return dict(cached, fileName=file_name, uploadId=sha, cached=True), 200
+
+        manifest = self.store.get_json(sha, 'manifest.json')
+        if manifest is None:
+            # Worker processes open the stored blob by path
+            manifest = pdf_pages.extract_manifest(self.store.blob_path(sha), workers=self.pdf_workers)
+            self.store.put_json(sha, 'manifest.json', manifest)
+
+        text = manifest["text"]
+        print(f"📄 {file_name}: {manifest['pageCount']} page(s), {len(manifest['sections'])} section(s), "
+              f"{len(text)} chars in {manifest['seconds']}s (slowest page {manifest['slowestPageSeconds']}s)")
+        if not text.strip():
+            # Scanned documents have no text layer; those need OCR first
+            return {
+                "success": False,
+                "error": "No text found in PDF (scanned document?)",
+                "fileName": file_name,
+                "pageCount": manifest["pageCount"]
+            }, 422
+
+        extraction = delivery_extraction.extract_deliveries(text, sections=manifest["sections"])
+        deliveries = extraction["deliveries"]
+
+        response = {
+            "success": True,
+            "confidence": 85,
+            "rawText": text,
+            "deliveries": deliveries,
+            "deliveryCount": len(deliveries),
+            "multipleDeliveries": len(deliveries) > 1,
+            "fileName": file_name,
+            "pageCount": manifest["pageCount"],
+            "uploadId": sha,
+            "claudeFailed": extraction["claudeFailed"]
+        }
+        # A pattern fallback after a Claude error is not kept as the upload's analysis
+        if deliveries and not extraction["claudeFailed"]:
+            self.store.put_json(sha, analysis_artifact(), response)
+        return response, 200
+
+    def analyze_stored_email(self, sha):
+        """Analyze a raw email from the upload store; returns (response, HTTP status)"""
+        cached = self.store.get_json(sha, analysis_artifact())
+        if cached:
+            print(f"📦 Known email {sha[:12]}, returning stored analysis")
+            return dict(cached, uploadId=sha, cached=True), 200
+
+        with self.store.open(sha) as f:
+            message = email_ingest.parse_email(iter(lambda: f.read(json_stream.READ_CHUNK_BYTES), b''))
+        parts = email_ingest.split_message(message)
+        print(f"📧 Email '{parts['subject']}': {parts['bodyFormat']} body, {len(parts['attachments'])} attachment(s)")
+        deliveries, sources = self.analyze_email_parts(parts)
+        claude_failed = any(source.get("claudeFailed") for source in sources)
+
+        response = {
+            "success": True,
+            "confidence": 85,
+            "rawText": parts["text"],
+            "deliveries": deliveries,
+            "deliveryCount": len(deliveries),
+            "multipleDeliveries": len(deliveries) > 1,
+            "subject": parts["subject"],
+            "from": parts["from"],
+            "parts": sources,
+            "uploadId": sha,
+            "claudeFailed": claude_failed
+        }
+        # A pattern fallback after a Claude error is not kept as the upload's analysis
+        if deliveries and not claude_failed:
+            self.store.put_json(sha, analysis_artifact(), response)
+        return response, 200
+
+    def analyze_email_parts(self, parts, depth=0):
+        """Deliveries from an email body and its attachments, plus a summary per part"""
+        deliveries, sources = [], []
+        seen = set()
+
+        def add(found, source):
+            source["deliveryCount"] = 0
+            for delivery in found:
+                # A table in the body often repeats the attached PDF
+                key = idempotency_key(delivery)
+                if key not in seen:
+                    seen.add(key)
+                    deliveries.append(delivery)
+                    source["deliveryCount"] += 1
+            sources.append(source)
+
+        def extract(text, source):
+            extraction = delivery_extraction.extract_deliveries(text)
+            if extraction["claudeFailed"]:
+                source["claudeFailed"] = True
+            return extraction["deliveries"]
+
+        # "See attachment" bodies are not worth an analysis of their own
+        if len(parts["body"]) >= 40 or (parts["body"] and not parts["attachments"]):
+            source = {"part": "body", "format": parts["bodyFormat"]}
+            add(extract(parts["text"], source), source)
+
+        for attachment in parts["attachments"]:
+            source = {"part": "attachment", "fileName": attachment["fileName"], "kind": attachment["kind"]}
+            kind = attachment["kind"]
+            if kind == 'pdf':
+                sha, _ = self.store.put_bytes(attachment["data"], 'application/pdf', attachment["fileName"])
+                try:
+                    with self.store.hold(sha):
+                        result, _ = self.analyze_stored_pdf(sha, attachment["fileName"])
+                except pdf_text.PDFError as e:
+                    result = {"error": str(e)}
+                source["uploadId"] = sha
+                if result.get("error"):
+                    source["error"] = result["error"]
+                if result.get("claudeFailed"):
+                    source["claudeFailed"] = True
+                add(result.get("deliveries") or [], source)
+            elif kind in ('csv', 'xlsx'):
+                try:
+                    found, source["columns"] = spreadsheet_ingest.read_deliveries(BytesIO(attachment["data"]), kind)
+                except spreadsheet_ingest.SpreadsheetError as e:
+                    found = []
+                    if kind == 'csv':
+                        # No known column headers; the text analyzer gets a go at it
+                        source["columns"] = None
+                        found = extract(attachment["data"].decode(attachment["charset"] or 'utf-8', errors='replace'),
+                                        source)
+                    else:
+                        source["error"] = str(e)
+                add(found, source)
+            elif kind == 'text':
+                text = attachment["data"].decode(attachment["charset"] or 'utf-8', errors='replace')
+                add(extract(text, source), source)
+            elif kind == 'email' and depth < email_ingest.MAX_NESTING:
+                nested = email_ingest.split_message(email_ingest.parse_email([attachment["data"]]))
+                found, nested_sources = self.analyze_email_parts(nested, depth + 1)
+                source["parts"] = nested_sources
+                if any(part.get("claudeFailed") for part in nested_sources):
+                    source["claudeFailed"] = True
+                add(found, source)
+            else:
+                source["skipped"] = "no analyzer for this attachment type"
+                sources.append(source)
+        return deliveries, sources
+
+
+def init_worker(quiet):
+    """Process pool initializer of the batch tools: one analyzer per worker process"""
+    global worker_analyzer
+    if quiet:
+        sys.stdout = open(os.devnull, 'w')
+    # Documents are already spread over processes; PDFs are extracted inline in each of them
+    worker_analyzer = DocumentAnalyzer(UploadStore(), pdf_workers=1)
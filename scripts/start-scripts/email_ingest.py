@@ -0,0 +1,171 @@
+"""
+Parsing of raw RFC 822 / MIME emails into the parts the analyzers understand
+
+The message is fed to the email package's feed parser chunk by chunk. The body
+text prefers the HTML alternative when it contains tables (rendered as
+"cell | cell" rows, the same shape PDF manifests produce), otherwise the plain
+text part. Attachments are decoded and classified so each can be routed to its
+own analyzer: PDFs, text/CSV files and forwarded emails.
+"""
+
+import email.parser
+import email.policy
+import html.parser
+import re
+
+# Forwarded emails inside emails are followed this deep
+MAX_NESTING = 3
+
+_HEADER_LINE = re.compile(rb'^(?:From |[!-9;-~]+:)')
+_TABLE = re.compile(r'<table\b', re.IGNORECASE)
+_BLOCK_TAGS = {'p', 'div', 'br', 'li', 'ul', 'ol', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'table', 'blockquote', 'hr'}
+_SKIP_TAGS = {'script', 'style', 'head', 'title'}
+
+
+def looks_like_email(head):
+    """Whether the first bytes of a file look like an RFC 822 message"""
+    return bool(_HEADER_LINE.match(head.removeprefix(b'\xef\xbb\xbf').lstrip(b'\r\n')))
+
+
+def parse_email(chunks):
+    """Parse a message from an iterable of byte chunks"""
+    parser = email.parser.BytesFeedParser(policy=email.policy.default)
+    for chunk in chunks:
+        parser.feed(chunk)
+    return parser.close()
+
+
+class _HTMLText(html.parser.HTMLParser):
+    """HTML to text; table rows become 'cell | cell' lines"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.lines = []
+        self.current = []
+        self.row = None
+        self.cell = None
+        self.skip = 0
+
+    def _break(self):
+        text = ' '.join(''.join(self.current).split())
+        if text:
+            self.lines.append(text)
+        self.current = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self.skip += 1
+        elif tag == 'tr':
+            self._break()
+            self.row = []
+        elif tag in ('td', 'th') and self.row is not None:
+            self.cell = []
+        elif tag in _BLOCK_TAGS:
+            if self.cell is not None:
+                self.cell.append(' ')
+            else:
+                self._break()
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS:
+            self.skip = max(0, self.skip - 1)
+        elif tag in ('td', 'th') and self.cell is not None:
+            self.row.append(' '.join(''.join(self.cell).split()))
+            self.cell = None
+        elif tag == 'tr' and self.row is not None:
+            if self.cell is not None:
+                self.handle_endtag('td')
+            if any(self.row):
+                self.lines.append(' | '.join(self.row))
+            self.row = None
+        elif tag in _BLOCK_TAGS and self.cell is None:
+            self._break()
+
+    def handle_data(self, data):
+        if self.skip:
+            return
+        (self.cell if self.cell is not None else self.current).append(data)
+
+    def text(self):
+        self.close()
+        self._break()
+        return '\n'.join(self.lines)
+
+
+def html_to_text(html):
+    parser = _HTMLText()
+    parser.feed(html)
+    return parser.text()
+
+
+def attachment_kind(file_name, content_type, data):
+    """pdf, csv, xlsx, text, email or other"""
+    name = (file_name or '').lower()
+    if data[:1024].lstrip().startswith(b'%PDF') or content_type == 'application/pdf':
+        return 'pdf'
+    if content_type == 'message/rfc822' or name.endswith('.eml'):
+        return 'email'
+    if content_type in ('text/csv', 'application/csv') or name.endswith('.csv'):
+        return 'csv'
+    if data[:4] == b'PK\x03\x04' and (name.endswith('.xlsx') or 'spreadsheetml' in content_type):
+        return 'xlsx'
+    if content_type.startswith('text/') or name.endswith('.txt'):
+        return 'text'
+    return 'other'
+
+
+def _payload_bytes(part):
+    if part.get_content_type() == 'message/rfc822':
+        nested = part.get_payload()
+        nested = nested[0] if isinstance(nested, list) else nested
+        return nested.as_bytes(policy=email.policy.default)
+    return part.get_payload(decode=True) or b''
+
+
+def split_message(message):
+    """Headers, the best body text and the decoded attachments of a message"""
+    plain = html = None
+    attachments = []
+    for part in message.walk():
+        if part.is_multipart() and part.get_content_type() != 'message/rfc822':
+            continue
+        content_type = part.get_content_type()
+        file_name = part.get_filename()
+        if content_type == 'message/rfc822' or part.is_attachment() or file_name:
+            data = _payload_bytes(part)
+            attachments.append({
+                "fileName": file_name or ('forwarded.eml' if content_type == 'message/rfc822' else 'attachment'),
+                "contentType": content_type,
+                "kind": attachment_kind(file_name, content_type, data),
+                "size": len(data),
+                "charset": part.get_content_charset(),
+                "data": data
+            })
+            if content_type == 'message/rfc822':
+                # walk() would descend into the forwarded message; it is analyzed on its own instead
+                part.set_payload([])
+        elif content_type == 'text/plain' and plain is None:
+            plain = part.get_content()
+        elif content_type == 'text/html' and html is None:
+            html = part.get_content()
+
+    if html and _TABLE.search(html):
+        body, body_format = html_to_text(html), 'html-table'
+    elif plain:
+        body, body_format = plain, 'plain'
+    elif html:
+        body, body_format = html_to_text(html), 'html'
+    else:
+        body, body_format = '', 'none'
+
+    headers = {key: str(message.get(key, '')) for key in ('Subject', 'From', 'To', 'Date')}
+    summary = '\n'.join(f"{key}: {value}" for key, value in headers.items() if value)
+    return {
+        "subject": headers['Subject'],
+        "from": headers['From'],
+        "date": headers['Date'],
+        "body": body.strip(),
+        "bodyFormat": body_format,
+        "text": f"{summary}\n\n{body.strip()}".strip(),
+        "attachments": attachments
+    }
@@ -0,0 +1,249 @@
+"""
+Durable background queue for Urbantz exports (SQLite, WAL mode)
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from export_store import EXPORT_STORE_PATH
+from urbantz_client import validate_delivery
+
+EXPORT_QUEUE_PATH = os.environ.get('EXPORT_QUEUE_PATH', EXPORT_STORE_PATH)
+EXPORT_QUEUE_MAX_ATTEMPTS = int(os.environ.get('EXPORT_QUEUE_MAX_ATTEMPTS', '5'))
+# Items handed to the Urbantz client per dispatch round
+EXPORT_QUEUE_BATCH_SIZE = int(os.environ.get('EXPORT_QUEUE_BATCH_SIZE', '100'))
+# Running items whose owner has not renewed them for this long are handed to another worker
+EXPORT_QUEUE_LEASE_SECONDS = float(os.environ.get('EXPORT_QUEUE_LEASE_SECONDS', '60'))
+
+
+def is_retryable(result):
+    """Whether a failed result is worth another attempt (429, 5xx, network error, busy key)"""
+    status = result.get('httpStatus')
+    return status is None or status == 429 or status >= 500
+
+
+class ExportQueue:
+    """Persists export batches and their per-delivery status"""
+
+    def __init__(self, path=EXPORT_QUEUE_PATH, lease_seconds=EXPORT_QUEUE_LEASE_SECONDS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        # Identifies the items this queue claimed, so other processes leave them alone
+        self.owner = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS export_jobs (
+                id TEXT PRIMARY KEY,
+                total INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                finished_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS export_items (
+                job_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                customer_ref TEXT,
+                delivery TEXT NOT NULL,
+                status TEXT NOT NULL,
+                task_id TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (job_id, idx)
+            );
+            CREATE INDEX IF NOT EXISTS export_items_ready ON export_items (status, next_attempt_at);
+        ''')
+        # Upload the batch was extracted from; stores created before it existed get the column added
+        if 'upload_id' not in {row['name'] for row in self._conn.execute('PRAGMA table_info(export_jobs)')}:
+            self._conn.execute('ALTER TABLE export_jobs ADD COLUMN upload_id TEXT')
+        # Claim owner and lease expiry of running items, added the same way
+        columns = {row['name'] for row in self._conn.execute('PRAGMA table_info(export_items)')}
+        if 'owner' not in columns:
+            self._conn.execute('ALTER TABLE export_items ADD COLUMN owner TEXT')
+        if 'lease_until' not in columns:
+            self._conn.execute('ALTER TABLE export_items ADD COLUMN lease_until REAL')
+        self.wakeup = threading.Event()
+
+    def enqueue(self, deliveries, upload_id=None):
+        """Store a batch and return its job id; invalid deliveries are failed right away"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        rows = []
+        for i, delivery in enumerate(deliveries):
+            error = validate_delivery(delivery)
+            rows.append((job_id, i, delivery.get('customerRef') if isinstance(delivery, dict) else None,
+                         json.dumps(delivery, ensure_ascii=False), 'failed' if error else 'queued', error, now))
+        finished = now if all(row[4] == 'failed' for row in rows) else None
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            self._conn.execute('INSERT INTO export_jobs (id, total, created_at, finished_at, upload_id) '
+                               'VALUES (?, ?, ?, ?, ?)', (job_id, len(deliveries), now, finished, upload_id))
+            self._conn.executemany(
+                'INSERT INTO export_items (job_id, idx, customer_ref, delivery, status, error, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+            self._conn.execute('COMMIT')
+        self.wakeup.set()
+        return job_id
+
+    def pending_upload_ids(self):
+        """Uploads referenced by jobs that are not finished yet"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT DISTINCT upload_id FROM export_jobs WHERE finished_at IS NULL AND upload_id IS NOT NULL'
+            ).fetchall()
+        return {row['upload_id'] for row in rows}
+
+    def claim(self, limit):
+        """Mark up to `limit` ready items as running under this queue's lease and return them"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            rows = self._conn.execute(
+                "SELECT job_id, idx, delivery FROM export_items "
+                "WHERE status = 'queued' AND next_attempt_at <= ? ORDER BY next_attempt_at, rowid LIMIT ?",
+                (now, limit)).fetchall()
+            self._conn.executemany(
+                "UPDATE export_items SET status = 'running', attempts = attempts + 1, owner = ?, lease_until = ?, "
+                "updated_at = ? WHERE job_id = ? AND idx = ?",
+                [(self.owner, now + self.lease_seconds, now, r['job_id'], r['idx']) for r in rows])
+            self._conn.execute('COMMIT')
+        return [(r['job_id'], r['idx'], json.loads(r['delivery'])) for r in rows]
+
+    def renew(self):
+        """Extend the lease on the items this queue is running"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE export_items SET lease_until = ? WHERE status = 'running' AND owner = ?",
+                (time.time() + self.lease_seconds, self.owner))
+
+    def recover_expired(self):
+        """Re-queue running items whose owner stopped renewing them; returns how many"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE export_items SET status = 'queued', owner = NULL, lease_until = NULL, next_attempt_at = 0 "
+                "WHERE status = 'running' AND (lease_until IS NULL OR lease_until < ?)", (time.time(),))
+        return cursor.rowcount
+
+    def finish(self, job_id, idx, result):
+        """Store the outcome of one item, re-queueing retryable failures with backoff"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute('SELECT status, attempts, owner FROM export_items WHERE job_id = ? AND idx = ?',
+                                     (job_id, idx)).fetchone()
+            # The lease ran out and the item went back to the queue; the next attempt records the outcome
+            if row is None or row['status'] != 'running' or row['owner'] != self.owner:
+                return
+            attempts = row['attempts']
+            if result['status'] == 'success':
+                self._conn.execute(
+                    "UPDATE export_items SET status = 'success', task_id = ?, error = NULL, owner = NULL, "
+                    "lease_until = NULL, updated_at = ? WHERE job_id = ? AND idx = ?",
+                    (result.get('taskId'), now, job_id, idx))
+            else:
+                if is_retryable(result) and attempts < EXPORT_QUEUE_MAX_ATTEMPTS:
+                    status, next_attempt = 'queued', now + min(300, 2 ** attempts)
+                else:
+                    status, next_attempt = 'failed', 0
+                self._conn.execute(
+                    "UPDATE export_items SET status = ?, error = ?, next_attempt_at = ?, owner = NULL, "
+                    "lease_until = NULL, updated_at = ? WHERE job_id = ? AND idx = ?",
+                    (status, result.get('error'), next_attempt, now, job_id, idx))
+            self._conn.execute(
+                "UPDATE export_jobs SET finished_at = ? WHERE id = ? AND finished_at IS NULL AND NOT EXISTS "
+                "(SELECT 1 FROM export_items WHERE job_id = ? AND status IN ('queued', 'running'))",
+                (now, job_id, job_id))
+
+    def next_due(self):
+        """Seconds until the earliest queued item may run, or None when the queue is empty"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(next_attempt_at) AS due FROM export_items WHERE status = 'queued'").fetchone()
+        return None if row['due'] is None else max(0.0, row['due'] - time.time())
+
+    def status(self, job_id):
+        """Job summary with per-delivery status, or None for an unknown job"""
+        with self._lock:
+            job = self._conn.execute('SELECT * FROM export_jobs WHERE id = ?', (job_id,)).fetchone()
+            if job is None:
+                return None
+            items = self._conn.execute(
+                'SELECT idx, customer_ref, status, task_id, error, attempts FROM export_items '
+                'WHERE job_id = ? ORDER BY idx', (job_id,)).fetchall()
+
+        counts = {}
+        for item in items:
+            counts[item['status']] = counts.get(item['status'], 0) + 1
+        return {
+            "jobId": job_id,
+            "status": "done" if job['finished_at'] else "running",
+            "totalDeliveries": job['total'],
+            "successful": counts.get('success', 0),
+            "failed": counts.get('failed', 0),
+            "pending": counts.get('queued', 0) + counts.get('running', 0),
+            "createdAt": job['created_at'],
+            "finishedAt": job['finished_at'],
+            "results": [{
+                "index": item['idx'],
+                "customerRef": item['customer_ref'] or 'N/A',
+                "status": item['status'],
+                "taskId": item['task_id'],
+                "error": item['error'],
+                "attempts": item['attempts']
+            } for item in items]
+        }
+
+
+class ExportWorker(threading.Thread):
+    """Drains the queue through an UrbantzClient in the background"""
+
+    def __init__(self, queue, client, batch_size=EXPORT_QUEUE_BATCH_SIZE):
+        super().__init__(name='urbantz-export-queue', daemon=True)
+        self.queue = queue
+        self.client = client
+        self.batch_size = batch_size
+
+    def start(self):
+        """Re-queue items left behind by stopped workers, then start draining and renewing leases"""
+        recovered = self.queue.recover_expired()
+        if recovered:
+            print(f"🔁 Re-queued {recovered} export items from a stopped worker")
+        threading.Thread(target=self._keep_leases, name='urbantz-export-lease', daemon=True).start()
+        super().start()
+
+    def _keep_leases(self):
+        """Renew our leases and pick up expired ones from other workers while we run"""
+        while True:
+            time.sleep(self.queue.lease_seconds / 3)
+            try:
+                self.queue.renew()
+                if self.queue.recover_expired():
+                    self.queue.wakeup.set()
+            except Exception as e:
+                print(f"❌ Export lease error: {e}")
+
+    def run(self):
+        while True:
+            try:
+                # Clear before claiming so an enqueue during the claim still wakes us up
+                self.queue.wakeup.clear()
+                items = self.queue.claim(self.batch_size)
+                if not items:
+                    due = self.queue.next_due()
+                    self.queue.wakeup.wait(min(due, 5.0) if due is not None else None)
+                    continue
+
+                # The client handles concurrency, rate limiting and idempotency
+                results = self.client.export_deliveries([delivery for _, _, delivery in items])
+                for (job_id, idx, _), result in zip(items, results):
+                    self.queue.finish(job_id, idx, result)
+            except Exception as e:
+                print(f"❌ Export queue error: {e}")
+                time.sleep(1)
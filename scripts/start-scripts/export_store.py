@@ -0,0 +1,129 @@
+"""
+SQLite store of exported deliveries, used to make Urbantz exports idempotent
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+EXPORT_STORE_PATH = os.environ.get('EXPORT_STORE_PATH', 'urbantz-exports.sqlite3')
+
+# A claim that is still pending after this long belongs to a crashed export and may be retried
+PENDING_TIMEOUT_SECONDS = int(os.environ.get('EXPORT_PENDING_TIMEOUT', '300'))
+
+# Task status columns filled in by reconciliation, added to stores created before it existed
+TASK_COLUMNS = (('remote_status', 'TEXT'), ('etag', 'TEXT'), ('last_modified', 'TEXT'), ('remote_updated_at', 'REAL'))
+
+
+def idempotency_key(delivery):
+    """Stable key for a delivery: customerRef + serviceDate + normalised address"""
+    address = (delivery.get('deliveryAddress') or {}).get('line1') or ''
+    parts = [delivery.get('customerRef') or '', delivery.get('serviceDate') or '', address]
+    normalised = '|'.join(re.sub(r'[\s,]+', ' ', str(p)).strip().lower() for p in parts)
+    return hashlib.sha256(normalised.encode('utf-8')).hexdigest()
+
+
+class ExportStore:
+    """Remembers which idempotency keys were exported and under which task id"""
+
+    def __init__(self, path=EXPORT_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS exports (
+                key TEXT PRIMARY KEY,
+                customer_ref TEXT,
+                service_date TEXT,
+                address TEXT,
+                task_id TEXT,
+                status TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        existing = {row['name'] for row in self._conn.execute('PRAGMA table_info(exports)')}
+        for name, kind in TASK_COLUMNS:
+            if name not in existing:
+                self._conn.execute(f'ALTER TABLE exports ADD COLUMN {name} {kind}')
+
+    def claim(self, key, delivery):
+        """Reserve a key before exporting
+
+        Returns None when the caller now owns the key and should export it, or the
+        existing row when the delivery was already exported or is being exported.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._conn.execute('SELECT * FROM exports WHERE key = ?', (key,)).fetchone()
+                if row and (row['status'] == 'exported' or now - row['updated_at'] < PENDING_TIMEOUT_SECONDS):
+                    self._conn.execute('COMMIT')
+                    return dict(row)
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO exports (key, customer_ref, service_date, address, task_id, status, updated_at) '
+                    'VALUES (?, ?, ?, ?, NULL, ?, ?)',
+                    (key, delivery.get('customerRef'), delivery.get('serviceDate'),
+                     (delivery.get('deliveryAddress') or {}).get('line1'), 'pending', now)
+                )
+                self._conn.execute('COMMIT')
+                return None
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def complete(self, key, task_id):
+        """Mark a claimed key as exported"""
+        with self._lock:
+            self._conn.execute('UPDATE exports SET task_id = ?, status = ?, updated_at = ? WHERE key = ?',
+                               (task_id, 'exported', time.time(), key))
+
+    def release(self, key):
+        """Give up a claim after a failed export so a retry can try again"""
+        with self._lock:
+            self._conn.execute("DELETE FROM exports WHERE key = ? AND status = 'pending'", (key,))
+
+    def iter_active_tasks(self, batch_size, final_statuses=()):
+        """Yield exported tasks in batches, skipping tasks whose remote status is final"""
+        final = tuple(final_statuses)
+        placeholders = ', '.join('?' * len(final))
+        status_filter = f'AND (remote_status IS NULL OR remote_status NOT IN ({placeholders})) ' if final else ''
+        last_key = ''
+        while True:
+            # Keyset pagination keeps every batch query cheap and never holds the lock for long
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT key, task_id, remote_status, etag, last_modified FROM exports "
+                    "WHERE status = 'exported' AND task_id IS NOT NULL AND key > ? " + status_filter +
+                    "ORDER BY key LIMIT ?", (last_key, *final, batch_size)).fetchall()
+            if not rows:
+                return
+            yield [dict(row) for row in rows]
+            last_key = rows[-1]['key']
+
+    def update_tasks(self, updates):
+        """Store changed task states: (key, remote_status, etag, last_modified) tuples"""
+        if not updates:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            self._conn.executemany(
+                'UPDATE exports SET remote_status = ?, etag = ?, last_modified = ?, remote_updated_at = ? WHERE key = ?',
+                [(status, etag, last_modified, now, key) for key, status, etag, last_modified in updates])
+            self._conn.execute('COMMIT')
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM exports WHERE key = ?', (key,)).fetchone()
+        return dict(row) if row else None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
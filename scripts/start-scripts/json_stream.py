@@ -0,0 +1,121 @@
+"""
+Incremental JSON decoding of request bodies, read from the socket in chunks
+"""
+
+import codecs
+import json
+import os
+
+# Requests with a larger Content-Length are refused before anything is read
+MAX_REQUEST_BODY_BYTES = int(os.environ.get('MAX_REQUEST_BODY_BYTES', str(64 * 1024 * 1024)))
+READ_CHUNK_BYTES = 64 * 1024
+
+_WHITESPACE = ' \t\r\n'
+
+
+class BodyTooLarge(ValueError):
+    """Content-Length exceeds MAX_REQUEST_BODY_BYTES"""
+
+
+def read_text(stream, length, max_bytes=MAX_REQUEST_BODY_BYTES, chunk_size=READ_CHUNK_BYTES):
+    """Yield a UTF-8 request body of `length` bytes as decoded text chunks"""
+    if length > max_bytes:
+        raise BodyTooLarge(f"Request body of {length} bytes exceeds the limit of {max_bytes} bytes")
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    remaining = length
+    while remaining:
+        data = stream.read(min(chunk_size, remaining))
+        if not data:
+            raise ValueError(f"Request body ended {remaining} bytes early")
+        remaining -= len(data)
+        yield decoder.decode(data, final=not remaining)
+
+
+def read_json(stream, length, max_bytes=MAX_REQUEST_BODY_BYTES):
+    """Decode a whole JSON body without keeping the raw bytes around"""
+    if length > max_bytes:
+        raise BodyTooLarge(f"Request body of {length} bytes exceeds the limit of {max_bytes} bytes")
+    return json.loads(''.join(read_text(stream, length, max_bytes)))
+
+
+class ArrayReader:
+    """Iterates over the elements of a top-level JSON array as they arrive
+
+    Only the element being decoded and one read chunk are buffered, so memory stays
+    flat however long the array is. The opening bracket is checked on construction,
+    so a body that is not an array fails before any response has been sent.
+    """
+
+    def __init__(self, stream, length, max_bytes=MAX_REQUEST_BODY_BYTES, chunk_size=READ_CHUNK_BYTES):
+        self._chunks = read_text(stream, length, max_bytes, chunk_size)
+        self._decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._pos = 0
+        self._done = False
+        self.count = 0
+
+        if self._next_char() != '[':
+            raise ValueError("Expected a JSON array")
+        self._pos += 1
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._done:
+            raise StopIteration
+
+        char = self._next_char()
+        if char == ']' and self.count == 0:
+            return self._finish()
+        if self.count:
+            if char == ']':
+                return self._finish()
+            if char != ',':
+                raise ValueError(f"Expected ',' or ']' after array element {self.count - 1}")
+            self._pos += 1
+            self._next_char()
+
+        element = self._decode_element()
+        self.count += 1
+        return element
+
+    def _decode_element(self):
+        while True:
+            try:
+                element, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number at the end of the buffer may continue in the next chunk
+            if end == len(self._buffer) and self._fill():
+                continue
+            self._pos = end
+            return element
+
+    def _next_char(self):
+        """Skip whitespace and return the next character, or None at the end of the body"""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return None
+
+    def _fill(self):
+        """Append the next chunk, dropping what has been consumed; False at the end of the body"""
+        for chunk in self._chunks:
+            if chunk:
+                self._buffer = self._buffer[self._pos:] + chunk
+                self._pos = 0
+                return True
+        return False
+
+    def _finish(self):
+        self._pos += 1
+        if self._next_char() is not None:
+            raise ValueError("Unexpected data after the JSON array")
+        self._done = True
+        raise StopIteration
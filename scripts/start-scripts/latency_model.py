@@ -0,0 +1,37 @@
+"""
+Response latency distributions shared by the local API stand-ins
+"""
+
+import math
+
+
+class LatencyModel:
+    """Samples response latency in seconds from a spec like 'lognormal:4000:0.6'
+
+    Supported specs (milliseconds):
+        fixed:<ms>
+        uniform:<min_ms>:<max_ms>
+        normal:<mean_ms>:<stddev_ms>
+        lognormal:<median_ms>:<sigma>
+    """
+
+    def __init__(self, spec, rng):
+        self.spec = spec
+        self.rng = rng
+        kind, *params = spec.split(':')
+        self.kind = kind
+        self.params = [float(p) for p in params]
+        if kind not in ('fixed', 'uniform', 'normal', 'lognormal'):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+
+    def sample(self):
+        p = self.params
+        if self.kind == 'fixed':
+            ms = p[0]
+        elif self.kind == 'uniform':
+            ms = self.rng.uniform(p[0], p[1])
+        elif self.kind == 'normal':
+            ms = self.rng.gauss(p[0], p[1])
+        else:
+            ms = self.rng.lognormvariate(math.log(max(p[0], 1)), p[1])
+        return max(ms, 0) / 1000
@@ -0,0 +1,156 @@
+"""
+Batch extraction of deliveries from an mbox file or Maildir directory
+
+Every message is analyzed in a worker process by the DocumentAnalyzer the server
+uses for /api/analyze-email: the body through the smart-analyze extraction
+(Claude with pattern fallback), PDF attachments page by page, forwarded emails
+recursively. One JSON line per message is appended to the output file and
+flushed as soon as the message is done, so an interrupted run resumes where it
+stopped: messages whose id (SHA-256 of the raw message) is already in the output
+are skipped.
+
+    python mailbox_ingest.py archive.mbox deliveries.jsonl --workers 8
+"""
+
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import mailbox
+import multiprocessing
+import os
+import time
+
+# Load environment variables from .env file; spawned workers inherit them
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
+
+# Local modules read their settings from the environment, so import after .env is loaded
+import document_analysis
+import email_ingest
+
+# Messages handed to the pool ahead of the ones being analyzed, per worker
+PREFETCH_PER_WORKER = 4
+
+def analyze_message(raw):
+    """Deliveries of one raw message; runs in a worker process"""
+    started = time.monotonic()
+    record = {"pid": os.getpid()}
+    try:
+        parts = email_ingest.split_message(email_ingest.parse_email([raw]))
+        deliveries, sources = document_analysis.worker_analyzer.analyze_email_parts(parts)
+        record.update(subject=parts["subject"], date=parts["date"], deliveries=deliveries,
+                      deliveryCount=len(deliveries), parts=sources)
+    except Exception as e:
+        record.update(deliveries=[], deliveryCount=0, error=f"{type(e).__name__}: {e}")
+    record["seconds"] = round(time.monotonic() - started, 3)
+    return record
+
+
+def open_mailbox(path):
+    """Maildir for a directory with cur/ and new/, mbox otherwise"""
+    if os.path.isdir(os.path.join(path, 'cur')) or os.path.isdir(os.path.join(path, 'new')):
+        return mailbox.Maildir(path, factory=None, create=False)
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"No mbox file or Maildir at {path}")
+    return mailbox.mbox(path, create=False)
+
+
+def done_ids(output):
+    """Ids of the messages already in the output; a line cut off by a crash is removed"""
+    ids = set()
+    if not os.path.exists(output):
+        return ids
+    with open(output, 'rb+') as f:
+        data = f.read()
+        complete = data.rfind(b'\n') + 1
+        if complete < len(data):
+            f.truncate(complete)
+        for line in data[:complete].splitlines():
+            try:
+                ids.add(json.loads(line)["id"])
+            except (ValueError, KeyError):
+                continue
+    return ids
+
+
+def ingest(source, output, workers=None, quiet=True):
+    """Analyze every message of a mailbox not yet in the output; returns run statistics"""
+    workers = workers or os.cpu_count() or 1
+    box = open_mailbox(source)
+    done = done_ids(output)
+    stats = {"messages": 0, "skipped": 0, "analyzed": 0, "deliveries": 0, "errors": 0}
+    started = time.monotonic()
+
+    def pending():
+        for key in box.iterkeys():
+            raw = box.get_bytes(key)
+            stats["messages"] += 1
+            message_id = hashlib.sha256(raw).hexdigest()
+            if message_id in done:
+                stats["skipped"] += 1
+                continue
+            # The same message twice in one mailbox is analyzed once
+            done.add(message_id)
+            yield message_id, str(key), raw
+
+    # spawn: workers import the analysis modules themselves instead of inheriting this process
+    pool = concurrent.futures.ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                                                  initializer=document_analysis.init_worker, initargs=(quiet,))
+    try:
+        with open(output, 'a', encoding='utf-8') as out:
+            messages = pending()
+            in_flight = {}
+            while True:
+                # Only a bounded window of raw messages is held in memory
+                for message_id, key, raw in messages:
+                    in_flight[pool.submit(analyze_message, raw)] = (message_id, key)
+                    if len(in_flight) >= workers * PREFETCH_PER_WORKER:
+                        break
+                if not in_flight:
+                    break
+                finished, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in finished:
+                    message_id, key = in_flight.pop(future)
+                    record = dict(id=message_id, mailboxKey=key, **future.result())
+                    out.write(json.dumps(record, ensure_ascii=False) + '\n')
+                    out.flush()
+                    stats["analyzed"] += 1
+                    stats["deliveries"] += record["deliveryCount"]
+                    stats["errors"] += 'error' in record
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        box.close()
+
+    stats["seconds"] = round(time.monotonic() - started, 3)
+    stats["messagesPerSecond"] = round(stats["analyzed"] / stats["seconds"], 2) if stats["seconds"] else None
+    return stats
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Extract deliveries from every message of an mbox file or Maildir")
+    parser.add_argument('source', help="mbox file or Maildir directory")
+    parser.add_argument('output', help="JSONL file; messages already in it are skipped")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: number of CPUs)")
+    parser.add_argument('--verbose', action='store_true', help="show the extraction logs of the workers")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    print(f"📬 Ingesting {args.source} → {args.output}")
+    try:
+        stats = ingest(args.source, args.output, args.workers, quiet=not args.verbose)
+    except KeyboardInterrupt:
+        print("\n👋 Interrupted; run the same command again to resume")
+        return
+    print(f"✅ {stats['analyzed']} message(s) analyzed, {stats['skipped']} already done, "
+          f"{stats['deliveries']} deliveries, {stats['errors']} error(s) in {stats['seconds']}s "
+          f"({stats['messagesPerSecond']} msg/s)")
+
+
+if __name__ == "__main__":
+    main()
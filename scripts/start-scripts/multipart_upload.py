@@ -0,0 +1,235 @@
+"""
+Streaming multipart/form-data parser that writes file parts straight into the upload store
+
+The request body is read in chunks and never held in memory as a whole: the file
+part is hashed and spooled to disk as it arrives, other form fields are small and
+kept. Oversized bodies are rejected from their Content-Length before anything is
+read, and an oversized or unacceptable file part is rejected as soon as it is
+detected, without reading the rest of the upload.
+"""
+
+import email.parser
+import os
+
+import json_stream
+
+# Largest accepted file in an upload (default: the request body limit)
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', str(json_stream.MAX_REQUEST_BODY_BYTES)))
+MAX_HEADER_BYTES = 16 * 1024
+MAX_FIELD_BYTES = 64 * 1024
+# Bytes of a file part collected before accept() decides on it
+SNIFF_BYTES = 1024
+
+
+class UploadError(ValueError):
+    """The upload cannot be accepted; status is the HTTP status to answer with"""
+    status = 400
+
+
+class UploadTooLarge(UploadError, json_stream.BodyTooLarge):
+    status = 413
+
+
+class UnsupportedUpload(UploadError):
+    status = 415
+
+
+def boundary_of(content_type):
+    """The boundary parameter of a multipart Content-Type header"""
+    message = email.parser.HeaderParser().parsestr(f"Content-Type: {content_type}\r\n\r\n")
+    boundary = message.get_param('boundary')
+    if not message.get_content_type().startswith('multipart/') or not boundary:
+        raise UploadError("Expected multipart/form-data with a boundary")
+    if len(boundary) > 200:
+        raise UploadError("Multipart boundary too long")
+    return boundary.encode('latin-1')
+
+
+class MultipartReader:
+    """Reads the parts of a multipart body from a stream of known length"""
+
+    def __init__(self, stream, length, boundary, chunk_size=json_stream.READ_CHUNK_BYTES):
+        self.stream = stream
+        self.remaining = length
+        self.chunk_size = chunk_size
+        self.delimiter = b'\r\n--' + boundary
+        self.buffer = b'\r\n'  # lets the first boundary match the same delimiter as the others
+        self.done = False
+
+    def _fill(self):
+        """Read the next chunk into the buffer; False at the end of the body"""
+        if self.remaining <= 0:
+            return False
+        chunk = self.stream.read(min(self.chunk_size, self.remaining))
+        if not chunk:
+            raise UploadError("Upload ended early")
+        self.remaining -= len(chunk)
+        self.buffer += chunk
+        return True
+
+    def _skip_to_boundary(self, write=None):
+        """Pass everything before the next delimiter to write(); then consume the delimiter"""
+        keep = len(self.delimiter) - 1
+        while True:
+            index = self.buffer.find(self.delimiter)
+            if index >= 0:
+                if write and index:
+                    write(self.buffer[:index])
+                self.buffer = self.buffer[index + len(self.delimiter):]
+                break
+            if len(self.buffer) > keep:
+                if write:
+                    write(self.buffer[:-keep])
+                self.buffer = self.buffer[-keep:]
+            if not self._fill():
+                raise UploadError("Multipart body without closing boundary")
+
+        while len(self.buffer) < 2 and self._fill():
+            pass
+        if self.buffer.startswith(b'--'):
+            self.done = True
+        elif not self.buffer.startswith(b'\r\n'):
+            raise UploadError("Malformed multipart boundary")
+        self.buffer = self.buffer[2:]
+
+    def _read_headers(self):
+        while True:
+            index = self.buffer.find(b'\r\n\r\n')
+            if index >= 0 or self.buffer.startswith(b'\r\n'):
+                break
+            if len(self.buffer) > MAX_HEADER_BYTES:
+                raise UploadError("Multipart part headers too large")
+            if not self._fill():
+                raise UploadError("Upload ended inside part headers")
+        if self.buffer.startswith(b'\r\n'):
+            raw, self.buffer = b'', self.buffer[2:]
+        else:
+            raw, self.buffer = self.buffer[:index], self.buffer[index + 4:]
+        return email.parser.BytesHeaderParser().parsebytes(raw + b'\r\n\r\n')
+
+    def parts(self):
+        """Yield a MultipartPart per part; each must be read before the next one is requested"""
+        self._skip_to_boundary()
+        while not self.done:
+            part = MultipartPart(self, self._read_headers())
+            yield part
+            if not part.consumed:
+                part.read_into(lambda data: None)
+        # Drop the epilogue so the connection can carry the next request
+        while self._fill():
+            self.buffer = b''
+
+
+class MultipartPart:
+    """Headers of one part; read_into(write) streams its body to write()"""
+
+    def __init__(self, reader, headers):
+        self.reader = reader
+        self.headers = headers
+        self.consumed = False
+
+    def read_into(self, write):
+        self.consumed = True
+        self.reader._skip_to_boundary(write)
+
+
+class _FileSink:
+    """Feeds a file part into a BlobWriter, enforcing the size limit and accept()"""
+
+    def __init__(self, writer, max_bytes, accept):
+        self.writer = writer
+        self.max_bytes = max_bytes
+        self.accept = accept
+        self.head = b'' if accept else None
+
+    def __call__(self, data):
+        if self.writer.size + len(data) + len(self.head or b'') > self.max_bytes:
+            raise UploadTooLarge(f"Uploaded file exceeds the limit of {self.max_bytes} bytes")
+        if self.head is not None:
+            self.head += data
+            if len(self.head) < SNIFF_BYTES:
+                return
+            data = self._check_head()
+        self.writer.write(data)
+
+    def _check_head(self):
+        head, self.head = self.head, None
+        if not self.accept(head):
+            raise UnsupportedUpload("Unsupported file type")
+        return head
+
+    def finish(self):
+        if self.head is not None:
+            self.writer.write(self._check_head())
+
+
+def receive_upload(stream, headers, store, field='file', accept=None, max_file_bytes=MAX_UPLOAD_BYTES,
+                   max_body_bytes=json_stream.MAX_REQUEST_BODY_BYTES):
+    """Stream an upload into the store
+
+    Accepts multipart/form-data (the file in form field `field`) or the raw file as
+    the request body. accept(first_bytes) can reject a file by its content. Returns
+    {"sha256", "created", "fileName", "contentType", "size", "fields"}.
+    """
+    length = int(headers.get('Content-Length') or 0)
+    if length > max_body_bytes:
+        raise UploadTooLarge(f"Request body of {length} bytes exceeds the limit of {max_body_bytes} bytes")
+    content_type = headers.get('Content-Type', '')
+
+    if not content_type.startswith('multipart/'):
+        # Raw body: the whole request is the file
+        if length > max_file_bytes:
+            raise UploadTooLarge(f"Uploaded file exceeds the limit of {max_file_bytes} bytes")
+        file_name = headers.get('X-File-Name', 'document.pdf')
+        with store.writer(content_type or None, file_name) as writer:
+            sink = _FileSink(writer, max_file_bytes, accept)
+            for chunk in _read_body(stream, length):
+                sink(chunk)
+            sink.finish()
+            sha, created = writer.commit()
+        return {"sha256": sha, "created": created, "fileName": file_name, "contentType": content_type or None,
+                "size": writer.size, "fields": {}}
+
+    reader = MultipartReader(stream, length, boundary_of(content_type))
+    fields = {}
+    received = None
+    for part in reader.parts():
+        part_headers = part.headers
+        name = part_headers.get_param('name', header='content-disposition')
+        file_name = part_headers.get_filename()
+        if name == field and received is None:
+            part_type = part_headers.get_content_type() if part_headers.get('Content-Type') else None
+            with store.writer(part_type, file_name) as writer:
+                sink = _FileSink(writer, max_file_bytes, accept)
+                part.read_into(sink)
+                sink.finish()
+                sha, created = writer.commit()
+            received = {"sha256": sha, "created": created, "fileName": file_name or 'document.pdf',
+                        "contentType": part_type, "size": writer.size}
+        elif file_name is None and name:
+            value = bytearray()
+
+            def collect(data, value=value):
+                if len(value) + len(data) > MAX_FIELD_BYTES:
+                    raise UploadTooLarge(f"Form field {name!r} exceeds {MAX_FIELD_BYTES} bytes")
+                value.extend(data)
+            part.read_into(collect)
+            fields[name] = value.decode(part_headers.get_content_charset() or 'utf-8', errors='replace')
+        else:
+            # Other files in the form are read past, not stored
+            part.read_into(lambda data: None)
+
+    if received is None:
+        raise UploadError(f"No {field!r} file in upload")
+    received["fields"] = fields
+    return received
+
+
+def _read_body(stream, length, chunk_size=json_stream.READ_CHUNK_BYTES):
+    remaining = length
+    while remaining > 0:
+        chunk = stream.read(min(chunk_size, remaining))
+        if not chunk:
+            raise UploadError("Upload ended early")
+        remaining -= len(chunk)
+        yield chunk
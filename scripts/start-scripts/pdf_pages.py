@@ -0,0 +1,169 @@
+"""
+Page-parallel PDF manifest extraction with a process pool
+
+Every page is extracted and split into delivery sections in a worker process, so
+a long manifest takes about as long as its slowest page instead of the sum of all
+pages. The page results are merged in page order. Text at the top of a page that
+does not start a new section continues the last section of the previous page, so
+deliveries split by a page break are stitched back together. Table headers and
+page numbers repeated on every page are dropped.
+"""
+
+import concurrent.futures
+import multiprocessing
+import os
+import re
+import threading
+import time
+
+import pdf_text
+
+# Worker processes for page extraction; 0 or 1 processes every page inline
+PDF_WORKERS = int(os.environ.get('PDF_WORKERS', str(os.cpu_count() or 1)))
+# Shorter documents are not worth the round trip to the pool
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get('PDF_PARALLEL_MIN_PAGES', '4'))
+
+# A delivery starts at "REF: X" or at a line beginning with an order reference like ORD-ANT3001
+SECTION_START = re.compile(r'(?=REF:\s*[A-Z0-9-]+)|^(?=[A-Z]{2,}-[A-Z0-9])', re.IGNORECASE | re.MULTILINE)
+# IGNORECASE is only meant for "REF:"; order references must be upper case
+_ORDER_REF = re.compile(r'[A-Z]{2,}-[A-Z0-9]')
+PAGE_NUMBER = re.compile(r'^\s*(?:pagina|page|blz\.?)\s*\d+\s*(?:(?:van|of|/)\s*\d+)?\s*$|^\s*\d+\s*/\s*\d+\s*$',
+                         re.IGNORECASE)
+
+_pool = None
+_pool_lock = threading.Lock()
+# Per pool worker process: parsed documents by (path, size, mtime), so pages of one file share the
+# xref parse. Inline extraction runs in request threads and opens its own document instead.
+_documents = {}
+
+
+def split_sections(text):
+    """(head, sections): the text before the first delivery on a page and the deliveries starting on it"""
+    lines = [line for line in text.splitlines() if not PAGE_NUMBER.match(line)]
+    text = '\n'.join(lines)
+    starts = []
+    for match in SECTION_START.finditer(text):
+        rest = text[match.start():]
+        if rest[:4].upper() == 'REF:' or _ORDER_REF.match(rest):
+            if not starts or starts[-1] != match.start():
+                starts.append(match.start())
+    if not starts:
+        return text.strip(), []
+    bounds = starts + [len(text)]
+    sections = [text[bounds[i]:bounds[i + 1]].strip() for i in range(len(starts))]
+    return text[:starts[0]].strip(), [s for s in sections if s]
+
+
+def _open_document(path):
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime)
+    if key not in _documents:
+        if len(_documents) >= 4:
+            close_documents()
+        f = open(path, 'rb')
+        doc = pdf_text.PDFDocument(f)
+        _documents[key] = (doc, list(doc.pages()))
+    return _documents[key]
+
+
+def close_documents():
+    """Close the files of cached documents"""
+    while _documents:
+        _documents.popitem()[1][0].file.close()
+
+
+def page_result(doc, page, index):
+    """Extract one page of an open document and split it into sections"""
+    started = time.monotonic()
+    text = pdf_text.page_text(doc, page)
+    head, sections = split_sections(text)
+    return {"index": index, "text": text, "head": head, "sections": sections,
+            "seconds": time.monotonic() - started}
+
+
+def process_page(path, index):
+    """Extract one page using the worker's document cache; runs in a worker process"""
+    doc, pages = _open_document(path)
+    return page_result(doc, pages[index], index)
+
+
+def page_count(path):
+    """Number of pages, read from the page tree without decoding any content"""
+    with open(path, 'rb') as f:
+        return sum(1 for _ in pdf_text.PDFDocument(f).pages())
+
+
+def get_pool(workers=PDF_WORKERS):
+    """The shared process pool, created on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: forking a threaded server can copy locks held by other threads
+            _pool = concurrent.futures.ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def shutdown():
+    """Stop the worker processes"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def stitch(page_results):
+    """Merge per-page results in page order, joining deliveries split over a page break"""
+    head = ''
+    head_lines = set()
+    sections = []
+    for i, page in enumerate(sorted(page_results, key=lambda p: p["index"])):
+        if i == 0:
+            head = page["head"]
+            head_lines = {line.strip() for line in head.splitlines() if line.strip()}
+        else:
+            # Repeated titles and table headers are not part of the continued delivery
+            carry = '\n'.join(line for line in page["head"].splitlines()
+                              if line.strip() and line.strip() not in head_lines)
+            if carry and sections:
+                previous = sections[-1]
+                # A table row cut off at the page bottom continues on the same line
+                joiner = ' ' if '\n' not in previous and ' | ' in previous else '\n'
+                sections[-1] = previous + joiner + carry
+            elif carry:
+                head = f"{head}\n{carry}".strip()
+        sections.extend(page["sections"])
+    return head, sections
+
+
+def extract_manifest(path, workers=None):
+    """Extract a PDF page-parallel; returns pages, stitched sections and the stitched text"""
+    started = time.monotonic()
+    workers = PDF_WORKERS if workers is None else workers
+    count = page_count(path)
+
+    results = None
+    if workers > 1 and count >= PDF_PARALLEL_MIN_PAGES:
+        try:
+            pool = get_pool(workers)
+            futures = [pool.submit(process_page, path, index) for index in range(count)]
+            results = [future.result() for future in futures]
+        except concurrent.futures.process.BrokenProcessPool as e:
+            print(f"⚠️ PDF worker pool failed ({e}), extracting inline")
+            shutdown()
+    if results is None:
+        # A private document per call; request threads extract inline concurrently
+        with open(path, 'rb') as f:
+            doc = pdf_text.PDFDocument(f)
+            results = [page_result(doc, page, index) for index, page in enumerate(doc.pages())]
+
+    head, sections = stitch(results)
+    text = '\n'.join([head] + sections).strip() if sections else '\n\n'.join(r["text"] for r in results if r["text"])
+    return {
+        "pages": [r["text"] for r in results],
+        "sections": sections,
+        "text": text,
+        "pageCount": count,
+        "seconds": round(time.monotonic() - started, 3),
+        "slowestPageSeconds": round(max((r["seconds"] for r in results), default=0), 3)
+    }
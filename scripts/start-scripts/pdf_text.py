@@ -0,0 +1,832 @@
+"""
+Pure-Python PDF text extraction, one page at a time
+
+Reads the cross-reference table (classic tables as well as xref and object
+streams), walks the page tree and interprets each page's content stream to
+collect positioned text, which is then put back together line by line. Only the
+page being processed is decoded, so memory stays bounded by the largest page.
+
+Supported stream filters: FlateDecode (with PNG predictors), ASCII85Decode and
+ASCIIHexDecode. Text is decoded through ToUnicode CMaps when present, otherwise
+through WinAnsi/MacRoman/Standard encodings. Encrypted PDFs are not supported.
+"""
+
+import base64
+import binascii
+import re
+import unicodedata
+import zlib
+
+# Objects are read from the file in steps of this size until their end is found
+READ_CHUNK_BYTES = 8192
+# Form XObjects may nest; deeper nesting is ignored rather than followed forever
+MAX_FORM_DEPTH = 8
+# Largest decoded size of a single stream; a few kilobytes of Flate data can inflate to gigabytes
+MAX_STREAM_BYTES = 64 * 1024 * 1024
+
+# Horizontal gap, in multiples of the font size, that separates table columns
+COLUMN_GAP = 1.5
+# Gap that still counts as a space between words drawn separately
+WORD_GAP = 0.15
+# TJ adjustments (thousandths of an em) below this are treated as a space
+TJ_SPACE = -200
+
+_WHITESPACE = b' \t\r\n\x0c\x00'
+_TOKEN = re.compile(
+    rb'[ \t\r\n\x0c\x00]+|%[^\r\n]*'
+    rb'|(?P<name>/[^ \t\r\n\x0c\x00()<>\[\]{}/%]*)'
+    rb'|(?P<dict><<|>>)'
+    rb'|(?P<bracket>[\[\]{}])'
+    rb'|(?P<hex><[0-9A-Fa-f \t\r\n\x0c\x00]*>)'
+    rb'|(?P<string>\()'
+    rb'|(?P<number>[+-]?(?:\d+\.?\d*|\.\d+))(?![^ \t\r\n\x0c\x00()<>\[\]{}/%])'
+    rb'|(?P<keyword>[^ \t\r\n\x0c\x00()<>\[\]{}/%]+)'
+)
+_OBJ_HEADER = re.compile(rb'(\d+)\s+(\d+)\s+obj\b')
+_OBJ_END = re.compile(rb'endobj|stream\r?\n|stream(?=[^a-z])')
+_ESCAPES = {ord('n'): b'\n', ord('r'): b'\r', ord('t'): b'\t', ord('b'): b'\b', ord('f'): b'\f',
+            ord('('): b'(', ord(')'): b')', ord('\\'): b'\\'}
+
+
+class PDFError(ValueError):
+    """The file is not a PDF this extractor can read"""
+
+
+class Name(str):
+    """A PDF name such as /Type (stored without the slash)"""
+
+
+class Keyword(str):
+    """A bare PDF keyword or content stream operator"""
+
+
+class Ref(tuple):
+    """An indirect reference 'num gen R'"""
+
+    def __new__(cls, num, gen):
+        return super().__new__(cls, (num, gen))
+
+
+class Stream:
+    """A stream object: its dictionary and the location of its raw data in the file"""
+
+    def __init__(self, attrs, offset=None, data=None):
+        self.attrs = attrs
+        self.offset = offset
+        self.data = data
+
+    def get(self, key, default=None):
+        return self.attrs.get(key, default)
+
+
+class Lexer:
+    """Tokenizer for PDF object syntax and content streams"""
+
+    def __init__(self, data, pos=0):
+        self.data = data
+        self.pos = pos
+
+    def next_token(self):
+        """Next token, or None at the end of the data"""
+        data = self.data
+        while True:
+            match = _TOKEN.match(data, self.pos)
+            if not match:
+                if self.pos >= len(data):
+                    return None
+                # Stray delimiter such as ')' outside a string; skip it
+                self.pos += 1
+                continue
+            self.pos = match.end()
+            kind = match.lastgroup
+            if kind is None:
+                continue
+            text = match.group(kind)
+            if kind == 'number':
+                return float(text) if b'.' in text else int(text)
+            if kind == 'name':
+                return Name(_decode_name(text[1:]))
+            if kind == 'string':
+                return self._literal_string()
+            if kind == 'hex':
+                digits = bytes(b for b in text[1:-1] if b not in _WHITESPACE)
+                return binascii.unhexlify(digits + b'0' * (len(digits) % 2))
+            return Keyword(text.decode('latin-1'))
+
+    def _literal_string(self):
+        data = self.data
+        out = bytearray()
+        depth = 1
+        i = self.pos
+        while i < len(data):
+            c = data[i]
+            if c == 0x5C:  # backslash
+                i += 1
+                if i >= len(data):
+                    break
+                c = data[i]
+                if c in _ESCAPES:
+                    out += _ESCAPES[c]
+                elif 0x30 <= c <= 0x37:
+                    digits = data[i:i + 3]
+                    n = 0
+                    while n < len(digits) and 0x30 <= digits[n] <= 0x37:
+                        n += 1
+                    out.append(int(digits[:n], 8) & 0xFF)
+                    i += n - 1
+                elif c == 0x0D:
+                    if data[i + 1:i + 2] == b'\n':
+                        i += 1
+                elif c != 0x0A:
+                    out.append(c)
+            elif c == 0x28:
+                depth += 1
+                out.append(c)
+            elif c == 0x29:
+                depth -= 1
+                if depth == 0:
+                    i += 1
+                    break
+                out.append(c)
+            else:
+                out.append(c)
+            i += 1
+        self.pos = i
+        return bytes(out)
+
+    def parse_object(self, token=None):
+        """Parse one object; '[' and '<<' start arrays and dictionaries, 'n g R' a reference"""
+        if token is None:
+            token = self.next_token()
+        if token == '[':
+            items = []
+            while True:
+                token = self.next_token()
+                if token is None or token == ']':
+                    return _fold_refs(items)
+                items.append(self.parse_object(token))
+        if token == '<<':
+            items = []
+            while True:
+                token = self.next_token()
+                if token is None or token == '>>':
+                    items = _fold_refs(items)
+                    return {items[i]: items[i + 1] for i in range(0, len(items) - 1, 2) if isinstance(items[i], Name)}
+                items.append(self.parse_object(token))
+        if token == 'true':
+            return True
+        if token == 'false':
+            return False
+        if token == 'null':
+            return None
+        return token
+
+
+def _fold_refs(items):
+    """Turn 'num gen R' token triples into Ref objects"""
+    out = []
+    for item in items:
+        if (item == 'R' and isinstance(item, Keyword) and len(out) >= 2
+                and type(out[-1]) is int and type(out[-2]) is int):
+            gen = out.pop()
+            out[-1] = Ref(out[-1], gen)
+        else:
+            out.append(item)
+    return out
+
+
+def _decode_name(raw):
+    if b'#' in raw:
+        raw = re.sub(rb'#([0-9A-Fa-f]{2})', lambda m: bytes([int(m.group(1), 16)]), raw)
+    return raw.decode('latin-1')
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _png_unpredict(data, columns, colors=1, bits=8):
+    """Undo PNG row predictors (Predictor >= 10), as used by xref streams"""
+    bpp = max(1, colors * bits // 8)
+    row_len = (columns * colors * bits + 7) // 8
+    out = bytearray()
+    prev = bytearray(row_len)
+    for start in range(0, len(data), row_len + 1):
+        kind = data[start]
+        row = bytearray(data[start + 1:start + 1 + row_len])
+        for i in range(len(row)):
+            left = row[i - bpp] if i >= bpp else 0
+            up = prev[i]
+            if kind == 1:
+                row[i] = (row[i] + left) & 0xFF
+            elif kind == 2:
+                row[i] = (row[i] + up) & 0xFF
+            elif kind == 3:
+                row[i] = (row[i] + ((left + up) >> 1)) & 0xFF
+            elif kind == 4:
+                up_left = prev[i - bpp] if i >= bpp else 0
+                p = left + up - up_left
+                pa, pb, pc = abs(p - left), abs(p - up), abs(p - up_left)
+                row[i] = (row[i] + (left if pa <= pb and pa <= pc else up if pb <= pc else up_left)) & 0xFF
+        out += row
+        prev = row
+    return bytes(out)
+
+
+def decode_stream_data(data, filters, parms):
+    """Apply a stream's filters in order"""
+    for i, name in enumerate(filters):
+        parm = parms[i] if i < len(parms) and isinstance(parms[i], dict) else {}
+        if name in ('FlateDecode', 'Fl'):
+            # Truncated streams still give their readable prefix
+            inflater = zlib.decompressobj()
+            data = inflater.decompress(data, MAX_STREAM_BYTES)
+            if inflater.unconsumed_tail:
+                raise PDFError(f"Stream inflates beyond {MAX_STREAM_BYTES} bytes")
+            if parm.get('Predictor', 1) >= 10:
+                data = _png_unpredict(data, parm.get('Columns', 1), parm.get('Colors', 1), parm.get('BitsPerComponent', 8))
+        elif name in ('ASCII85Decode', 'A85'):
+            data = bytes(b for b in data if b not in _WHITESPACE)
+            if data.startswith(b'<~'):
+                data = data[2:]
+            end = data.find(b'~>')
+            data = base64.a85decode(data[:end] if end >= 0 else data, adobe=False)
+        elif name in ('ASCIIHexDecode', 'AHx'):
+            digits = bytes(b for b in data.split(b'>', 1)[0] if b not in _WHITESPACE)
+            data = binascii.unhexlify(digits + b'0' * (len(digits) % 2))
+        else:
+            raise PDFError(f"Unsupported stream filter: {name}")
+    return data
+
+
+class PDFDocument:
+    """Random access to the objects of a PDF in a seekable binary file"""
+
+    def __init__(self, fileobj):
+        self.file = fileobj
+        self.offsets = {}
+        self.compressed = {}
+        self.trailer = {}
+        self._cache = {}
+        self._objstm = (None, None)
+
+        fileobj.seek(0)
+        if not fileobj.read(1024).lstrip().startswith(b'%PDF'):
+            raise PDFError("Not a PDF file")
+        try:
+            self._read_xref_chain()
+        except Exception:
+            self.offsets, self.compressed, self.trailer = {}, {}, {}
+        if not self.trailer.get('Root') or not self.offsets:
+            self._scan_objects()
+        if self.trailer.get('Encrypt'):
+            raise PDFError("Encrypted PDFs are not supported")
+
+    # Cross-reference
+
+    def _read_xref_chain(self):
+        self.file.seek(0, 2)
+        size = self.file.tell()
+        self.file.seek(max(0, size - 2048))
+        tail = self.file.read()
+        pos = tail.rfind(b'startxref')
+        if pos < 0:
+            raise PDFError("startxref not found")
+        offset = int(tail[pos + 9:].split()[0])
+
+        seen = set()
+        while offset is not None and offset not in seen:
+            seen.add(offset)
+            self.file.seek(offset)
+            head = self.file.read(32)
+            if head.lstrip().startswith(b'xref'):
+                trailer = self._read_xref_table(offset)
+                if isinstance(trailer.get('XRefStm'), int):
+                    self._read_xref_stream(trailer['XRefStm'])
+            else:
+                trailer = self._read_xref_stream(offset)
+            for key, value in trailer.items():
+                self.trailer.setdefault(key, value)
+            offset = trailer.get('Prev') if isinstance(trailer.get('Prev'), int) else None
+
+    def _read_xref_table(self, offset):
+        self.file.seek(offset)
+        self.file.readline()
+        while True:
+            line = self.file.readline()
+            if not line:
+                raise PDFError("Truncated xref table")
+            parts = line.split()
+            if not parts:
+                continue
+            if parts[0].startswith(b'trailer'):
+                rest = line.split(b'trailer', 1)[1] + self.file.read(READ_CHUNK_BYTES)
+                return Lexer(rest).parse_object()
+            start, count = int(parts[0]), int(parts[1])
+            for num in range(start, start + count):
+                entry = self.file.readline().split()
+                while not entry:
+                    entry = self.file.readline().split()
+                # Newer sections were read first and win
+                if entry[2] == b'n' and num not in self.offsets and num not in self.compressed:
+                    self.offsets[num] = int(entry[0])
+
+    def _read_xref_stream(self, offset):
+        stream = self._read_object_at(offset)
+        if not isinstance(stream, Stream):
+            raise PDFError("Expected an xref stream")
+        data = self.stream_data(stream)
+        widths = stream.get('W')
+        index = stream.get('Index') or [0, stream.get('Size')]
+        pos = 0
+        for i in range(0, len(index) - 1, 2):
+            for num in range(index[i], index[i] + index[i + 1]):
+                fields = []
+                for width in widths:
+                    fields.append(int.from_bytes(data[pos:pos + width], 'big') if width else None)
+                    pos += width
+                kind = fields[0] if widths[0] else 1
+                if num in self.offsets or num in self.compressed:
+                    continue
+                if kind == 1:
+                    self.offsets[num] = fields[1]
+                elif kind == 2:
+                    self.compressed[num] = (fields[1], fields[2])
+        return stream.attrs
+
+    def _scan_objects(self):
+        """Rebuild the object table by scanning the file, for damaged or odd xref data"""
+        self.offsets, self.compressed = {}, {}
+        self.file.seek(0)
+        base = 0
+        carry = b''
+        while True:
+            chunk = self.file.read(1 << 20)
+            if not chunk:
+                break
+            data = carry + chunk
+            for match in _OBJ_HEADER.finditer(data):
+                if match.start() == 0 or data[match.start() - 1] in _WHITESPACE:
+                    self.offsets[int(match.group(1))] = base - len(carry) + match.start()
+            base += len(chunk)
+            carry = data[-32:]
+        if not self.trailer.get('Root'):
+            for num in sorted(self.offsets):
+                obj = self._load(num)
+                if isinstance(obj, dict) and obj.get('Type') == 'Catalog':
+                    self.trailer['Root'] = Ref(num, 0)
+                    break
+        if not self.trailer.get('Root'):
+            raise PDFError("No document catalog found")
+
+    # Objects
+
+    def resolve(self, value):
+        """Follow indirect references until a direct value is reached"""
+        depth = 0
+        while isinstance(value, Ref) and depth < 32:
+            value = self._load(value[0])
+            depth += 1
+        return value
+
+    def _load(self, num):
+        if num in self._cache:
+            return self._cache[num]
+        if num in self.offsets:
+            obj = self._read_object_at(self.offsets[num])
+        elif num in self.compressed:
+            obj = self._read_compressed(*self.compressed[num])
+        else:
+            obj = None
+        # Stream data stays in the file; only the small dictionaries are cached
+        self._cache[num] = obj
+        return obj
+
+    def _read_object_at(self, offset):
+        self.file.seek(offset)
+        data = b''
+        while True:
+            chunk = self.file.read(READ_CHUNK_BYTES)
+            data += chunk
+            match = _OBJ_END.search(data)
+            if match or not chunk:
+                break
+        lexer = Lexer(data)
+        header = _OBJ_HEADER.match(data.lstrip())
+        if header:
+            lexer.pos = len(data) - len(data.lstrip()) + header.end()
+        obj = lexer.parse_object()
+        if isinstance(obj, dict):
+            rest = data[lexer.pos:].lstrip(_WHITESPACE)
+            if rest.startswith(b'stream'):
+                start = offset + data.index(b'stream', lexer.pos) + 6
+                after = data[start - offset:start - offset + 2]
+                start += 2 if after == b'\r\n' else 1 if after[:1] in (b'\n', b'\r') else 0
+                return Stream(obj, offset=start)
+        return obj
+
+    def _read_compressed(self, stream_num, index):
+        if self._objstm[0] != stream_num:
+            stream = self.resolve(Ref(stream_num, 0))
+            data = self.stream_data(stream)
+            lexer = Lexer(data)
+            header = [lexer.next_token() for _ in range(2 * stream.get('N', 0))]
+            self._objstm = (stream_num, (data, stream.get('First', 0), header))
+        data, first, header = self._objstm[1]
+        if 2 * index + 1 >= len(header):
+            return None
+        return Lexer(data, first + header[2 * index + 1]).parse_object()
+
+    def stream_data(self, stream):
+        """Decoded data of a stream object"""
+        if stream.data is not None:
+            raw = stream.data
+        else:
+            length = self.resolve(stream.get('Length'))
+            self.file.seek(stream.offset)
+            if isinstance(length, int):
+                raw = self.file.read(length)
+            else:
+                raw = b''
+                while b'endstream' not in raw:
+                    chunk = self.file.read(READ_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    raw += chunk
+                raw = raw.split(b'endstream', 1)[0].rstrip(b'\r\n')
+        filters = [self.resolve(f) for f in _as_list(self.resolve(stream.get('Filter')))]
+        parms = [self.resolve(p) for p in _as_list(self.resolve(stream.get('DecodeParms')))]
+        return decode_stream_data(raw, filters, parms)
+
+    # Pages
+
+    def pages(self):
+        """Yield page dictionaries in order, with inherited Resources filled in"""
+        root = self.resolve(self.trailer.get('Root')) or {}
+        stack = [(self.resolve(root.get('Pages')), {})]
+        seen = set()
+        while stack:
+            node, inherited = stack.pop()
+            if not isinstance(node, dict) or id(node) in seen:
+                continue
+            seen.add(id(node))
+            inherited = dict(inherited)
+            if 'Resources' in node:
+                inherited['Resources'] = node['Resources']
+            if node.get('Type') == 'Page' or 'Kids' not in node:
+                page = dict(node)
+                page.setdefault('Resources', inherited.get('Resources'))
+                yield page
+            else:
+                kids = self.resolve(node.get('Kids')) or []
+                for kid in reversed(kids):
+                    stack.append((self.resolve(kid), inherited))
+
+    def page_content(self, page):
+        """Concatenated, decoded content streams of a page"""
+        parts = []
+        for ref in _as_list(self.resolve(page.get('Contents'))):
+            stream = self.resolve(ref)
+            if isinstance(stream, Stream):
+                try:
+                    parts.append(self.stream_data(stream))
+                except (PDFError, ValueError, zlib.error) as e:
+                    print(f"⚠️ Skipping unreadable content stream: {e}")
+        return b'\n'.join(parts)
+
+
+class Font:
+    """Turns the bytes of a text-showing operator into text and glyph widths"""
+
+    def __init__(self, doc, spec):
+        spec = doc.resolve(spec) or {}
+        self.two_byte = spec.get('Subtype') == 'Type0'
+        self.cmap = None
+        self.byte_map = None
+        self.widths = {}
+        self.default_width = 500
+
+        to_unicode = doc.resolve(spec.get('ToUnicode'))
+        if isinstance(to_unicode, Stream):
+            try:
+                self.cmap, code_lengths = parse_cmap(doc.stream_data(to_unicode))
+                if code_lengths:
+                    self.two_byte = max(code_lengths) >= 2
+            except (PDFError, ValueError, zlib.error):
+                self.cmap = None
+
+        if self.two_byte:
+            descendant = doc.resolve((_as_list(doc.resolve(spec.get('DescendantFonts'))) or [None])[0]) or {}
+            self.default_width = descendant.get('DW', 1000)
+            widths = doc.resolve(descendant.get('W')) or []
+            i = 0
+            while i < len(widths) - 1:
+                first, nxt = widths[i], doc.resolve(widths[i + 1])
+                if isinstance(nxt, list):
+                    for j, w in enumerate(nxt):
+                        self.widths[first + j] = w
+                    i += 2
+                elif i + 2 < len(widths):
+                    for code in range(first, nxt + 1):
+                        self.widths[code] = widths[i + 2]
+                    i += 3
+                else:
+                    break
+        else:
+            first_char = spec.get('FirstChar', 0)
+            for j, w in enumerate(doc.resolve(spec.get('Widths')) or []):
+                self.widths[first_char + j] = doc.resolve(w)
+            self.byte_map = _simple_encoding(doc, spec.get('Encoding'))
+
+    def decode(self, data):
+        """(text, [(code, width in thousandths)]) for a shown string"""
+        if self.two_byte:
+            codes = [int.from_bytes(data[i:i + 2], 'big') for i in range(0, len(data) - 1, 2)]
+        else:
+            codes = list(data)
+        chars = []
+        for code in codes:
+            if self.cmap is not None and code in self.cmap:
+                chars.append(self.cmap[code])
+            elif self.two_byte:
+                chars.append(chr(code) if self.cmap is None and 32 <= code < 0xD800 else '')
+            else:
+                chars.append(self.byte_map[code])
+        return chars, [(code, self.widths.get(code, self.default_width)) for code in codes]
+
+
+def parse_cmap(data):
+    """Code-to-text mapping of a ToUnicode CMap, plus the code lengths in bytes"""
+    mapping = {}
+    code_lengths = set()
+    lexer = Lexer(data)
+    section = None
+    operands = []
+    while True:
+        token = lexer.next_token()
+        if token is None:
+            break
+        if isinstance(token, Keyword) and token not in ('[', ']'):
+            if token in ('begincodespacerange', 'beginbfchar', 'beginbfrange'):
+                section = token
+                operands = []
+            elif token == 'endcodespacerange':
+                code_lengths.update(len(o) for o in operands if isinstance(o, bytes))
+                section = None
+            elif token == 'endbfchar':
+                for i in range(0, len(operands) - 1, 2):
+                    if isinstance(operands[i], bytes) and isinstance(operands[i + 1], bytes):
+                        mapping[int.from_bytes(operands[i], 'big')] = _utf16(operands[i + 1])
+                section = None
+            elif token == 'endbfrange':
+                for i in range(0, len(operands) - 2, 3):
+                    lo, hi, dst = operands[i:i + 3]
+                    if not isinstance(lo, bytes) or not isinstance(hi, bytes):
+                        continue
+                    lo, hi = int.from_bytes(lo, 'big'), int.from_bytes(hi, 'big')
+                    if isinstance(dst, list):
+                        for j, target in enumerate(dst[:hi - lo + 1]):
+                            mapping[lo + j] = _utf16(target)
+                    elif isinstance(dst, bytes) and hi - lo < 65536:
+                        base = int.from_bytes(dst, 'big')
+                        for j in range(hi - lo + 1):
+                            mapping[lo + j] = _utf16((base + j).to_bytes(len(dst), 'big'))
+                section = None
+            continue
+        if section:
+            operands.append(lexer.parse_object(token) if token == '[' else token)
+    return mapping, code_lengths
+
+
+def _utf16(data):
+    try:
+        return data.decode('utf-16-be')
+    except UnicodeDecodeError:
+        return ''
+
+
+# Glyph names that commonly appear in /Differences arrays
+_GLYPHS = {
+    'space': ' ', 'quoteright': '’', 'quoteleft': '‘', 'quotedblleft': '“',
+    'quotedblright': '”', 'endash': '–', 'emdash': '—', 'bullet': '•',
+    'hyphen': '-', 'period': '.', 'comma': ',', 'colon': ':', 'semicolon': ';', 'slash': '/',
+    'parenleft': '(', 'parenright': ')', 'plus': '+', 'at': '@', 'numbersign': '#', 'ampersand': '&',
+    'zero': '0', 'one': '1', 'two': '2', 'three': '3', 'four': '4', 'five': '5', 'six': '6', 'seven': '7',
+    'eight': '8', 'nine': '9', 'Euro': '€', 'fi': 'fi', 'fl': 'fl',
+}
+_ACCENTS = {'acute': '́', 'grave': '̀', 'dieresis': '̈', 'circumflex': '̂',
+            'cedilla': '̧', 'tilde': '̃', 'ring': '̊'}
+
+
+def _glyph_text(name):
+    if name in _GLYPHS:
+        return _GLYPHS[name]
+    if len(name) == 1:
+        return name
+    if name.startswith('uni') and len(name) == 7:
+        try:
+            return chr(int(name[3:], 16))
+        except ValueError:
+            return ''
+    for accent, mark in _ACCENTS.items():
+        if name.endswith(accent) and len(name) == len(accent) + 1:
+            return unicodedata.normalize('NFC', name[0] + mark)
+    return ''
+
+
+_BASE_ENCODINGS = {'WinAnsiEncoding': 'cp1252', 'MacRomanEncoding': 'mac_roman', 'StandardEncoding': 'latin-1'}
+
+
+def _simple_encoding(doc, encoding):
+    """256-entry byte-to-text table for a simple (single-byte) font"""
+    encoding = doc.resolve(encoding)
+    base = encoding if isinstance(encoding, str) else (encoding or {}).get('BaseEncoding', 'WinAnsiEncoding')
+    codec = _BASE_ENCODINGS.get(base, 'cp1252')
+    table = [bytes([b]).decode(codec, errors='replace').replace('�', '') for b in range(256)]
+    if isinstance(encoding, dict):
+        code = 0
+        for item in doc.resolve(encoding.get('Differences')) or []:
+            if isinstance(item, int):
+                code = item
+            elif isinstance(item, Name) and 0 <= code < 256:
+                table[code] = _glyph_text(item)
+                code += 1
+    return table
+
+
+def _multiply(m, n):
+    a, b, c, d, e, f = m
+    a2, b2, c2, d2, e2, f2 = n
+    return (a * a2 + b * c2, a * b2 + b * d2, c * a2 + d * c2, c * b2 + d * d2,
+            e * a2 + f * c2 + e2, e * b2 + f * d2 + f2)
+
+
+IDENTITY = (1, 0, 0, 1, 0, 0)
+
+
+class _TextCollector:
+    """Runs a content stream and collects (x, y, end_x, size, text) fragments"""
+
+    def __init__(self, doc):
+        self.doc = doc
+        self.fragments = []
+        self._fonts = {}
+
+    def run(self, content, resources, ctm=IDENTITY, depth=0):
+        doc = self.doc
+        resources = doc.resolve(resources) or {}
+        font_specs = doc.resolve(resources.get('Font')) or {}
+        xobjects = doc.resolve(resources.get('XObject')) or {}
+
+        gstack = []
+        tm = lm = IDENTITY
+        font, size, leading, char_space, word_space, scale = None, 0, 0, 0, 0, 1.0
+        lexer = Lexer(content)
+        operands = []
+        while True:
+            token = lexer.next_token()
+            if token is None:
+                break
+            if not isinstance(token, Keyword) or token in ('[', '<<'):
+                operands.append(lexer.parse_object(token) if isinstance(token, Keyword) else token)
+                continue
+            op = token
+            if op == 'BI':
+                # Inline image: skip its binary data up to EI
+                end = re.compile(rb'[ \t\r\n\x0c\x00]EI(?=[ \t\r\n\x0c\x00]|$)').search(content, lexer.pos)
+                lexer.pos = end.end() if end else len(content)
+            elif op == 'q':
+                gstack.append(ctm)
+            elif op == 'Q':
+                ctm = gstack.pop() if gstack else ctm
+            elif op == 'cm' and len(operands) >= 6:
+                ctm = _multiply(tuple(_num(v) for v in operands[-6:]), ctm)
+            elif op == 'BT':
+                tm = lm = IDENTITY
+            elif op == 'Tf' and len(operands) >= 2:
+                font = self._font(font_specs, operands[-2])
+                size = _num(operands[-1])
+            elif op == 'TL' and operands:
+                leading = _num(operands[-1])
+            elif op == 'Tc' and operands:
+                char_space = _num(operands[-1])
+            elif op == 'Tw' and operands:
+                word_space = _num(operands[-1])
+            elif op == 'Tz' and operands:
+                scale = _num(operands[-1]) / 100
+            elif op in ('Td', 'TD') and len(operands) >= 2:
+                tx, ty = _num(operands[-2]), _num(operands[-1])
+                if op == 'TD':
+                    leading = -ty
+                lm = tm = _multiply((1, 0, 0, 1, tx, ty), lm)
+            elif op == 'Tm' and len(operands) >= 6:
+                lm = tm = tuple(_num(v) for v in operands[-6:])
+            elif op in ('T*', "'", '"'):
+                if op == '"' and len(operands) >= 3:
+                    word_space, char_space = _num(operands[-3]), _num(operands[-2])
+                lm = tm = _multiply((1, 0, 0, 1, 0, -leading), lm)
+                if op != 'T*' and operands:
+                    tm = self._show([operands[-1]], font, size, char_space, word_space, scale, tm, ctm)
+            elif op in ('Tj', 'TJ') and operands:
+                items = operands[-1] if op == 'TJ' and isinstance(operands[-1], list) else [operands[-1]]
+                tm = self._show(items, font, size, char_space, word_space, scale, tm, ctm)
+            elif op == 'Do' and operands and depth < MAX_FORM_DEPTH:
+                form = doc.resolve(xobjects.get(operands[-1]))
+                if isinstance(form, Stream) and form.get('Subtype') == 'Form':
+                    matrix = tuple(_num(v) for v in (doc.resolve(form.get('Matrix')) or IDENTITY))
+                    try:
+                        self.run(doc.stream_data(form), form.get('Resources') or resources,
+                                 _multiply(matrix, ctm), depth + 1)
+                    except (PDFError, ValueError, zlib.error):
+                        pass
+            operands = []
+
+    def _font(self, specs, name):
+        key = id(specs), name
+        if key not in self._fonts:
+            self._fonts[key] = Font(self.doc, specs.get(name)) if specs.get(name) is not None else None
+        return self._fonts[key]
+
+    def _show(self, items, font, size, char_space, word_space, scale, tm, ctm):
+        """Record the strings of a Tj/TJ and return the advanced text matrix"""
+        texts = []
+        start = _multiply(tm, ctm)
+        for item in items:
+            if isinstance(item, (int, float)):
+                if item < TJ_SPACE and texts and not texts[-1].endswith(' '):
+                    texts.append(' ')
+                tm = _multiply((1, 0, 0, 1, -item / 1000 * size * scale, 0), tm)
+                continue
+            if not isinstance(item, bytes):
+                continue
+            if font is None:
+                chars, widths = list(item.decode('latin-1')), [(b, 500) for b in item]
+            else:
+                chars, widths = font.decode(item)
+            advance = 0
+            for (code, width), char in zip(widths, chars):
+                advance += (width / 1000 * size + char_space + (word_space if char == ' ' and not (font and font.two_byte) else 0)) * scale
+            texts.append(''.join(chars))
+            tm = _multiply((1, 0, 0, 1, advance, 0), tm)
+
+        text = ''.join(texts)
+        if text.strip():
+            end = _multiply(tm, ctm)
+            device_size = abs(size * (start[3] if start[3] else start[1])) or abs(size) or 1
+            x0, x1 = sorted((start[4], end[4]))
+            self.fragments.append((x0, start[5], x1, device_size, text))
+        return tm
+
+
+def _num(value):
+    return value if isinstance(value, (int, float)) else 0
+
+
+def _assemble_lines(fragments):
+    """Group fragments into lines top to bottom and join them left to right"""
+    lines = []
+    for fragment in sorted(fragments, key=lambda f: (-f[1], f[0])):
+        x0, y, x1, size, text = fragment
+        if lines and abs(lines[-1][0] - y) <= size * 0.4:
+            lines[-1][1].append(fragment)
+        else:
+            lines.append([y, [fragment]])
+
+    out = []
+    for _, parts in lines:
+        parts.sort(key=lambda f: f[0])
+        line = ''
+        previous_end = None
+        for x0, _, x1, size, text in parts:
+            if previous_end is not None:
+                gap = x0 - previous_end
+                if gap > size * COLUMN_GAP:
+                    line = line.rstrip() + ' | '
+                    text = text.lstrip()
+                elif gap > size * WORD_GAP and not line.endswith(' ') and not text.startswith(' '):
+                    line += ' '
+            line += text
+            previous_end = x1
+        out.append(' '.join(line.split()) if '|' not in line else re.sub(r'[ \t]{2,}', ' ', line.strip()))
+    return '\n'.join(out)
+
+
+def page_text(doc, page):
+    """Text of one page, line by line"""
+    collector = _TextCollector(doc)
+    collector.run(doc.page_content(page), page.get('Resources'))
+    return _assemble_lines(collector.fragments)
+
+
+def iter_page_texts(fileobj):
+    """Yield the text of each page in order; only one page is decoded at a time"""
+    doc = PDFDocument(fileobj)
+    for page in doc.pages():
+        yield page_text(doc, page)
+
+
+def extract_text(fileobj):
+    """Text of a whole PDF, pages separated by a blank line"""
+    return '\n\n'.join(text for text in iter_page_texts(fileobj) if text)
@@ -0,0 +1,252 @@
+"""
+Strip email boilerplate from document text before it is sent to the LLM
+"""
+
+import re
+
+# Rough token estimate used for reporting; Claude averages ~4 chars per token on Dutch text
+CHARS_PER_TOKEN = 4
+
+# Lines that hint at delivery content; used to make sure we never strip the data itself
+DELIVERY_HINT = re.compile(
+    r'(REF\s*:|Klant\s*:|Adres\s*:|\d{1,2}:\d{2}|\d{4}\s+(?-i:[A-Z][a-z])|straat|laan|plein|weg\b|rue\b|ORD-)',
+    re.IGNORECASE
+)
+
+# Data that makes a quoted block worth keeping on its own; a bare time is not enough
+QUOTED_DELIVERY_DATA = re.compile(
+    r'(REF\s*:|Klant\s*:|Adres\s*:|\d{4}\s+(?-i:[A-Z][a-z])|straat|laan|plein|weg\b|rue\b|ORD-)',
+    re.IGNORECASE
+)
+
+SIGN_OFF = re.compile(
+    r'^\s*(\*\*)?(met )?(vriendelijke )?(groet(en)?|kind regards|best regards|regards|cordialement|'
+    r'bien à vous|mvg|met vriendelijke groet(en)?)\b[\s,.!*]*$',
+    re.IGNORECASE
+)
+
+QUOTE_INTRO = re.compile(
+    r'^\s*(op .+ schreef .+:|on .+ wrote:|le .+ a écrit ?:|-+\s*(original message|oorspronkelijk bericht)\s*-+)\s*$',
+    re.IGNORECASE
+)
+
+# Forwarded/reply header lines; subject and date are kept since they often carry the
+# delivery count or service date. "Van:" and "Aan:" also label time windows and
+# addresses, so they are only stripped inside a header block.
+MAIL_FROM = re.compile(r'^\s*(\*\*)?(van|from)(\*\*)?\s*:', re.IGNORECASE)
+MAIL_HEADER = re.compile(r'^\s*(\*\*)?(van|from|verzonden|sent|aan|to|cc)(\*\*)?\s*:', re.IGNORECASE)
+KEPT_HEADER = re.compile(r'^\s*(\*\*)?(onderwerp|subject|datum|date)(\*\*)?\s*:', re.IGNORECASE)
+TIME_VALUE = re.compile(r'^\d{1,2}[:.hu]\d{2}\b', re.IGNORECASE)
+FORWARD_MARKER = re.compile(r'^\s*-+\s*(forwarded message|doorgestuurd bericht)\s*-+\s*$', re.IGNORECASE)
+
+LEGAL_FOOTER = re.compile(
+    r'(disclaimer|vertrouwelijk|confidential|uitsluitend bestemd|intended solely|intended only|'
+    r'this e-?mail and any attachments|denk aan het milieu|consider the environment|'
+    r'niet de bedoelde ontvanger|not the intended recipient)',
+    re.IGNORECASE
+)
+
+PAGE_MARKER = re.compile(r'^\s*(pagina|page)\s+\d+\s*(van|of|/)\s*\d+\s*$', re.IGNORECASE)
+TABLE_RULE = re.compile(r'^\s*\|?\s*:?-{3,}:?\s*(\|\s*:?-{3,}:?\s*)*\|?\s*$')
+
+
+def estimate_tokens(text):
+    """Cheap token estimate for reporting savings"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def slim_text(text):
+    """Remove quoted history, signatures, legal footers and repeated headers
+
+    Returns (slimmed_text, stats) where stats reports what was removed and the
+    estimated number of tokens saved.
+    """
+    removed = {"quotedLines": 0, "signatureLines": 0, "footerLines": 0,
+               "headerLines": 0, "repeatedTableHeaders": 0}
+
+    lines = text.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    lines = _strip_quoted_history(lines, removed)
+    lines = _strip_signature(lines, removed)
+    lines = _strip_legal_footers(lines, removed)
+    lines = _strip_repeated_headers(lines, removed)
+    slimmed = _collapse_whitespace(lines)
+
+    tokens_before = estimate_tokens(text)
+    tokens_after = estimate_tokens(slimmed)
+    stats = {
+        "charsBefore": len(text),
+        "charsAfter": len(slimmed),
+        "tokensBefore": tokens_before,
+        "tokensAfter": tokens_after,
+        "tokensSaved": tokens_before - tokens_after,
+        "removed": removed
+    }
+    return slimmed, stats
+
+
+def _has_delivery_content(lines):
+    return any(DELIVERY_HINT.search(line) for line in lines)
+
+
+def _strip_quoted_history(lines, removed):
+    """Drop '>' quoted blocks, except those with delivery data of their own
+
+    When the text outside the quotes has no delivery data at all (a reply on top
+    of the real content), every quote is kept.
+    """
+    quoted = [line.lstrip().startswith('>') for line in lines]
+    if not any(quoted):
+        return lines
+
+    unquoted = [line for line, q in zip(lines, quoted) if not q and not QUOTE_INTRO.match(line)]
+    keep_all = not _has_delivery_content(unquoted)
+    result = []
+    block = []
+
+    def flush():
+        if keep_all or any(QUOTED_DELIVERY_DATA.search(line) for line in block):
+            result.extend(re.sub(r'^\s*(>\s?)+', '', line) for line in block)
+        else:
+            removed["quotedLines"] += sum(1 for line in block if line.strip())
+        block.clear()
+
+    for i, line in enumerate(lines):
+        if quoted[i]:
+            block.append(line)
+        elif block and not line.strip() and i + 1 < len(lines) and quoted[i + 1]:
+            # A blank line between quoted paragraphs belongs to the same block
+            block.append(line)
+        else:
+            flush()
+            if QUOTE_INTRO.match(line) and not keep_all:
+                removed["quotedLines"] += 1
+                continue
+            result.append(line)
+    flush()
+    return result
+
+
+def _strip_signature(lines, removed):
+    """Cut everything from the last sign-off that is not followed by delivery data"""
+    for i in range(len(lines) - 1, -1, -1):
+        if SIGN_OFF.match(lines[i]) and not _has_delivery_content(lines[i + 1:]):
+            removed["signatureLines"] += len(lines) - i
+            return lines[:i]
+    return lines
+
+
+def _strip_legal_footers(lines, removed):
+    """Drop paragraphs that read like disclaimers and contain no delivery data"""
+    result = []
+    paragraph = []
+
+    def flush():
+        if paragraph and any(LEGAL_FOOTER.search(line) for line in paragraph) \
+                and not _has_delivery_content(paragraph):
+            removed["footerLines"] += len(paragraph)
+        else:
+            result.extend(paragraph)
+        paragraph.clear()
+
+    for line in lines:
+        if line.strip():
+            paragraph.append(line)
+        else:
+            flush()
+            result.append(line)
+    flush()
+    return result
+
+
+def _strip_repeated_headers(lines, removed):
+    """Drop forwarded mail headers, page markers and table headers repeated on every page"""
+    result = []
+    seen_table_headers = set()
+    in_header_block = False
+    dropped_table_header = False
+
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+
+        if FORWARD_MARKER.match(stripped):
+            removed["headerLines"] += 1
+            in_header_block = True
+            continue
+        if PAGE_MARKER.match(stripped):
+            removed["headerLines"] += 1
+            continue
+
+        if MAIL_FROM.match(line) and _is_sender(lines, i):
+            in_header_block = True
+        if in_header_block and MAIL_HEADER.match(line) and not TIME_VALUE.match(_header_value(line)):
+            removed["headerLines"] += 1
+            continue
+        if not (in_header_block and KEPT_HEADER.match(line)):
+            in_header_block = False
+
+        if dropped_table_header and TABLE_RULE.match(stripped):
+            removed["repeatedTableHeaders"] += 1
+            continue
+        dropped_table_header = False
+
+        if _is_table_header(stripped):
+            key = re.sub(r'\s+', ' ', stripped.strip('|').lower())
+            if key in seen_table_headers:
+                removed["repeatedTableHeaders"] += 1
+                dropped_table_header = True
+                continue
+            seen_table_headers.add(key)
+
+        result.append(line)
+
+    return result
+
+
+def _header_value(line):
+    return line.split(':', 1)[1].strip().strip('*').strip()
+
+
+def _is_person(value):
+    """An email address or a name, not a time, address or route"""
+    return '@' in value or bool(value) and not re.search(r'\d', value)
+
+
+def _is_sender(lines, i):
+    """A "Van:"/"From:" line of a mail header, as opposed to "Van: 08:00" or "Van: Brussel"
+
+    The value must be an email address, or a name followed by the sent date, the
+    subject or a recipient that is a name or address too.
+    """
+    value = _header_value(lines[i])
+    if '@' in value:
+        return True
+    if not _is_person(value) or i + 1 == len(lines):
+        return False
+    following = lines[i + 1]
+    if KEPT_HEADER.match(following):
+        return True
+    header = MAIL_HEADER.match(following)
+    if not header or MAIL_FROM.match(following):
+        return False
+    return header.group(2).lower() in ('verzonden', 'sent') or _is_person(_header_value(following))
+
+
+def _is_table_header(line):
+    """A row with at least three columns and no digits, e.g. '| Ref | Klant | Adres |'"""
+    if not line or re.search(r'\d', line):
+        return False
+    columns = [c for c in re.split(r'\s*[|\t;]\s*', line) if c.strip()]
+    return len(columns) >= 3
+
+
+def _collapse_whitespace(lines):
+    """Collapse runs of spaces and blank lines, keeping a double space as column gap"""
+    collapsed = []
+    for line in lines:
+        line = re.sub(r'[ \u00a0]{3,}', '  ', line).rstrip()
+        if not line and (not collapsed or not collapsed[-1]):
+            continue
+        collapsed.append(line)
+    while collapsed and not collapsed[-1]:
+        collapsed.pop()
+    return '\n'.join(collapsed)
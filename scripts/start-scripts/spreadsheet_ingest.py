@@ -0,0 +1,372 @@
+"""
+Streaming delivery extraction from CSV and XLSX files, standard library only
+
+Rows are read one at a time: CSV through the csv module, XLSX by unzipping the
+first worksheet and walking its XML with iterparse, clearing every row once it is
+converted. The header row is matched against known column names once
+(Ref/Klant/Adres/Datum/Tijdslot/Contact and their variants) and every following
+row is turned into a delivery directly, so large sheets never need the LLM.
+Memory stays flat in the number of rows; only an XLSX shared-strings table, which
+holds each distinct text value once, is loaded up front.
+"""
+
+import codecs
+import csv
+import datetime
+import io
+import posixpath
+import re
+import time
+import xml.etree.ElementTree as ET
+import zipfile
+
+# The header is looked for in this many rows at the top of a sheet
+HEADER_SCAN_ROWS = 20
+
+# Normalized header names per delivery field; the first matching column wins
+COLUMN_NAMES = {
+    'customerRef': ('ref', 'referentie', 'reference', 'order', 'ordernummer', 'ordernr', 'bestelling',
+                    'bestelnummer', 'klantref', 'customer ref', 'order ref'),
+    'contactName': ('klant', 'klantnaam', 'naam', 'customer', 'name', 'ontvanger', 'bedrijf', 'company'),
+    'address': ('adres', 'address', 'leveradres', 'leveringsadres', 'delivery address', 'straat', 'street'),
+    'postalCode': ('postcode', 'zip', 'zipcode', 'postal code'),
+    'city': ('gemeente', 'stad', 'city', 'plaats', 'woonplaats'),
+    'serviceDate': ('datum', 'date', 'leverdatum', 'leveringsdatum', 'service date'),
+    'timeSlot': ('tijdslot', 'tijdvenster', 'slot', 'time window', 'timeslot', 'tijd', 'time'),
+    'timeWindowStart': ('van', 'vanaf', 'start', 'from'),
+    'timeWindowEnd': ('tot', 'einde', 'end', 'until'),
+    'contact': ('contact', 'contactpersoon'),
+    'contactPhone': ('telefoon', 'telefoonnummer', 'tel', 'gsm', 'phone', 'mobile'),
+    'items': ('items', 'artikel', 'artikelen', 'omschrijving', 'description', 'product'),
+    'quantity': ('aantal', 'colli', 'pakketten', 'quantity', 'qty'),
+    'notes': ('opmerking', 'opmerkingen', 'notes', 'note', 'instructies', 'remarks'),
+    'priority': ('prioriteit', 'priority', 'spoed', 'urgent'),
+}
+_FIELD_BY_NAME = {name: field for field, names in COLUMN_NAMES.items() for name in names}
+
+XLSX_MIME = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+_PKG_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+# Built-in number formats that display dates or times
+_DATE_FORMAT_IDS = set(range(14, 23)) | set(range(45, 48))
+_DATE_CODE = re.compile(r'[dmyhs]', re.IGNORECASE)
+_CELL_COLUMN = re.compile(r'[A-Z]+')
+_TIME_SLOT = re.compile(r'(\d{1,2})[:.hu](\d{2})\s*(?:-|–|—|tot|to)\s*(\d{1,2})[:.hu](\d{2})', re.IGNORECASE)
+_TIME = re.compile(r'(\d{1,2})[:.hu](\d{2})')
+_DMY = re.compile(r'(\d{1,2})[-/.](\d{1,2})[-/.](\d{2,4})')
+_PHONE = re.compile(r'^\+?[\d\s()./-]{8,}$')
+_URGENT = re.compile(r'\b(?:spoed|urgent|hoog|high|ja|yes)\b', re.IGNORECASE)
+_EXCEL_EPOCH = datetime.datetime(1899, 12, 30)
+
+
+class SpreadsheetError(ValueError):
+    """The file cannot be read as a spreadsheet"""
+
+
+class NoHeaderFound(SpreadsheetError):
+    """No row near the top of the sheet looks like a delivery table header"""
+
+
+def detect_format(head, file_name=''):
+    """'xlsx', 'csv' or None from the first bytes and the file name"""
+    name = (file_name or '').lower()
+    if head.startswith(b'PK\x03\x04'):
+        return 'xlsx' if not name or name.endswith(('.xlsx', '.xlsm')) else None
+    if b'\x00' in head or head.lstrip().startswith(b'%PDF'):
+        return None
+    return 'csv'
+
+
+def _normalize(name):
+    return ' '.join(re.sub(r'[^\w\s]', ' ', name.lower()).split())
+
+
+# --- CSV -------------------------------------------------------------------
+
+def iter_csv_rows(fileobj):
+    """Rows of a CSV file as lists of strings; the delimiter and encoding are sniffed"""
+    head = fileobj.read(8192)
+    fileobj.seek(0)
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(head)
+        encoding = 'utf-8-sig'
+    except UnicodeDecodeError:
+        # Excel on Windows saves CSV in the ANSI code page
+        encoding = 'cp1252'
+    text = io.TextIOWrapper(fileobj, encoding=encoding, errors='replace', newline='')
+    sample = head.decode(encoding, errors='ignore')
+    try:
+        dialect, options = csv.Sniffer().sniff(sample, delimiters=';,\t|'), {}
+    except csv.Error:
+        dialect, options = csv.excel, {"delimiter": max(';,\t|', key=sample.count)}
+    try:
+        yield from csv.reader(text, dialect, **options)
+    finally:
+        # Leave the underlying file open for the caller
+        text.detach()
+
+
+# --- XLSX ------------------------------------------------------------------
+
+def _first_sheet_path(archive):
+    workbook = ET.fromstring(archive.read('xl/workbook.xml'))
+    sheet = workbook.find(f'{_NS}sheets/{_NS}sheet')
+    if sheet is None:
+        raise ValueError("Workbook has no sheets")
+    rel_id = sheet.get(f'{_REL_NS}id')
+    rels = ET.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+    for rel in rels.iter(f'{_PKG_REL_NS}Relationship'):
+        if rel.get('Id') == rel_id:
+            target = rel.get('Target')
+            return target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join('xl', target))
+    return 'xl/worksheets/sheet1.xml'
+
+
+def _shared_strings(archive):
+    if 'xl/sharedStrings.xml' not in archive.namelist():
+        return []
+    strings = []
+    root = None
+    with archive.open('xl/sharedStrings.xml') as f:
+        for event, element in ET.iterparse(f, events=('start', 'end')):
+            if root is None:
+                root = element
+            if event == 'end' and element.tag == f'{_NS}si':
+                # Rich text runs are joined; phonetic hints (rPh) are not part of the value
+                runs = [element.find(f'{_NS}t')] + [r.find(f'{_NS}t') for r in element.findall(f'{_NS}r')]
+                strings.append(''.join(t.text or '' for t in runs if t is not None))
+                root.clear()
+    return strings
+
+
+def _date_styles(archive):
+    """Indexes of the cell styles that format numbers as dates or times"""
+    if 'xl/styles.xml' not in archive.namelist():
+        return set()
+    styles = ET.fromstring(archive.read('xl/styles.xml'))
+    date_formats = set(_DATE_FORMAT_IDS)
+    for fmt in styles.iter(f'{_NS}numFmt'):
+        # Strip quoted literals and colour/locale blocks before looking for date codes
+        code = re.sub(r'"[^"]*"|\[[^\]]*\]', '', fmt.get('formatCode', ''))
+        if _DATE_CODE.search(code):
+            date_formats.add(int(fmt.get('numFmtId')))
+    cell_xfs = styles.find(f'{_NS}cellXfs')
+    if cell_xfs is None:
+        return set()
+    return {i for i, xf in enumerate(cell_xfs) if int(xf.get('numFmtId', 0)) in date_formats}
+
+
+def _excel_date(value):
+    moment = _EXCEL_EPOCH + datetime.timedelta(days=value)
+    if value < 1:
+        return moment.strftime('%H:%M')
+    if value == int(value):
+        return moment.strftime('%Y-%m-%d')
+    return moment.strftime('%Y-%m-%d %H:%M')
+
+
+def _column_index(ref):
+    index = 0
+    for char in _CELL_COLUMN.match(ref).group():
+        index = index * 26 + ord(char) - 64
+    return index - 1
+
+
+def iter_xlsx_rows(fileobj):
+    """Rows of the first worksheet as lists of strings, parsed incrementally"""
+    try:
+        yield from _iter_sheet(fileobj)
+    except (zipfile.BadZipFile, ET.ParseError, KeyError, IndexError, ValueError) as e:
+        raise SpreadsheetError(f"Invalid XLSX file: {e}") from e
+
+
+def _iter_sheet(fileobj):
+    with zipfile.ZipFile(fileobj) as archive:
+        shared = _shared_strings(archive)
+        date_styles = _date_styles(archive)
+        with archive.open(_first_sheet_path(archive)) as sheet:
+            sheet_data = None
+            for event, element in ET.iterparse(sheet, events=('start', 'end')):
+                if event == 'start':
+                    if element.tag == f'{_NS}sheetData':
+                        sheet_data = element
+                    continue
+                if element.tag != f'{_NS}row':
+                    continue
+                row = []
+                for cell in element.iter(f'{_NS}c'):
+                    ref = cell.get('r')
+                    if ref:
+                        row.extend([''] * (_column_index(ref) - len(row)))
+                    row.append(_cell_value(cell, shared, date_styles))
+                yield row
+                # Converted rows are dropped so the tree never grows with the sheet
+                if sheet_data is not None:
+                    sheet_data.clear()
+                else:
+                    element.clear()
+
+
+def _cell_value(cell, shared, date_styles):
+    kind = cell.get('t', 'n')
+    if kind == 'inlineStr':
+        return ''.join(t.text or '' for t in cell.iter(f'{_NS}t')).strip()
+    value = cell.find(f'{_NS}v')
+    if value is None or value.text is None:
+        return ''
+    text = value.text
+    if kind == 's':
+        return shared[int(text)].strip()
+    if kind == 'b':
+        return 'TRUE' if text == '1' else 'FALSE'
+    if kind != 'n':
+        return text.strip()
+    number = float(text)
+    if int(cell.get('s', 0)) in date_styles:
+        return _excel_date(number)
+    # Postcodes, phone numbers and references stored as numbers lose their ".0"
+    return str(int(number)) if number == int(number) else text
+
+
+# --- Rows to deliveries ----------------------------------------------------
+
+def _iso_date(value):
+    match = re.match(r'\d{4}-\d{2}-\d{2}', value)
+    if match:
+        return match.group()
+    match = _DMY.search(value)
+    if match:
+        day, month, year = match.groups()
+        year = '20' + year if len(year) == 2 else year
+        return f"{year}-{month.zfill(2)}-{day.zfill(2)}"
+    return None
+
+
+def _clock(hours, minutes):
+    return f"{int(hours):02d}:{minutes}"
+
+
+class ColumnMapping:
+    """Which column holds which delivery field, decided once from the header row"""
+
+    def __init__(self, header, columns):
+        self.header = header
+        self.columns = columns
+
+    @classmethod
+    def from_header(cls, cells):
+        """The mapping for a header row, or None if the row does not look like one"""
+        columns = {}
+        for index, cell in enumerate(cells):
+            field = _FIELD_BY_NAME.get(_normalize(cell))
+            if field and field not in columns:
+                columns[field] = index
+        # A delivery table needs a reference or an address next to at least one other known column
+        if len(columns) < 2 or not ({'customerRef', 'address'} & columns.keys()):
+            return None
+        return cls(cells, columns)
+
+    def describe(self):
+        """Field → header name, for logs and responses"""
+        return {field: self.header[index] for field, index in self.columns.items()}
+
+    def delivery(self, cells, number, task_prefix):
+        """A delivery in the shape the other extractors produce, or None for an empty row"""
+        values = {field: cells[index].strip() if index < len(cells) else ''
+                  for field, index in self.columns.items()}
+        ref = values.get('customerRef', '')
+        street = values.get('address', '')
+        if not ref and not street:
+            return None
+
+        place = ' '.join(v for v in (values.get('postalCode', ''), values.get('city', '')) if v)
+        if place and place not in street:
+            street = f"{street}, {place}" if street else place
+
+        name, phone = values.get('contactName', ''), values.get('contactPhone', '')
+        contact = values.get('contact', '')
+        if contact:
+            if _PHONE.match(contact) and not phone:
+                phone = contact
+            elif not name:
+                name = contact
+
+        start, end = '09:00', '17:00'
+        slot = _TIME_SLOT.search(values.get('timeSlot', ''))
+        if slot:
+            start, end = _clock(*slot.group(1, 2)), _clock(*slot.group(3, 4))
+        for field in ('timeWindowStart', 'timeWindowEnd'):
+            match = _TIME.search(values.get(field, ''))
+            if match:
+                if field == 'timeWindowStart':
+                    start = _clock(*match.groups())
+                else:
+                    end = _clock(*match.groups())
+
+        quantity = re.search(r'\d+', values.get('quantity', ''))
+        service_date = _iso_date(values.get('serviceDate', ''))
+        if not service_date:
+            service_date = (datetime.date.today() + datetime.timedelta(days=1)).isoformat()
+        return {
+            "taskId": f"{task_prefix}-{number}",
+            "customerRef": ref or "AUTO-NOTFOUND",
+            "deliveryAddress": {
+                "line1": street or "Adres niet gevonden",
+                "contactName": name or "Onbekend",
+                "contactPhone": phone or "+32 000 000 000"
+            },
+            "serviceDate": service_date,
+            "timeWindowStart": start,
+            "timeWindowEnd": end,
+            "items": [{
+                "description": values.get('items') or "Standaard levering",
+                "quantity": int(quantity.group()) if quantity else 1,
+                "tempClass": "ambient"
+            }],
+            "notes": values.get('notes') or f"Rij {number} uit spreadsheet",
+            "priority": "high" if _URGENT.search(values.get('priority', '')) else "normal"
+        }
+
+
+class DeliveryReader:
+    """Iterates over the deliveries of a CSV or XLSX file, one row at a time
+
+    The header is located on construction, so a file that is not a delivery table
+    fails with NoHeaderFound before anything has been emitted.
+    """
+
+    def __init__(self, fileobj, fmt):
+        self._rows = iter_xlsx_rows(fileobj) if fmt == 'xlsx' else iter_csv_rows(fileobj)
+        self.format = fmt
+        self.rows = 0
+        self.skipped = 0
+        self.mapping = None
+        for cells in self._rows:
+            self.rows += 1
+            self.mapping = ColumnMapping.from_header(cells)
+            if self.mapping:
+                break
+            if self.rows >= HEADER_SCAN_ROWS:
+                break
+        if not self.mapping:
+            self._rows.close()
+            raise NoHeaderFound(f"No delivery table header in the first {self.rows} rows")
+        self.header_row = self.rows
+        self._task_prefix = f"TASK-{int(time.time() * 1000)}"
+
+    def __iter__(self):
+        for cells in self._rows:
+            self.rows += 1
+            delivery = self.mapping.delivery(cells, self.rows - self.header_row, self._task_prefix)
+            if delivery is None:
+                self.skipped += 1
+            else:
+                yield delivery
+
+
+def read_deliveries(fileobj, fmt):
+    """All deliveries of a file as a list, with the column mapping that was used"""
+    reader = DeliveryReader(fileobj, fmt)
+    return list(reader), reader.mapping.describe()
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Offline stand-in for the Anthropic Messages API (POST /v1/messages)
+
+Answers with canned or rule-generated delivery JSON and can simulate latency,
+server errors, 429 rate limits and max_tokens truncation, so the analyze path
+can be load-tested without network access or API costs.
+
+Point the servers at it with:
+    ANTHROPIC_BASE_URL=http://localhost:8787 ANTHROPIC_API_KEY=sk-ant-mock python start-server-fast.py
+"""
+
+import argparse
+import http.server
+import json
+import random
+import re
+import socketserver
+import threading
+import time
+import uuid
+
+from latency_model import LatencyModel
+
+PORT = 8787
+# Default random seed for latency and fault draws
+SEED = 1
+
+# Named presets for --profile; explicit flags override them
+PROFILES = {
+    "instant": {"latency": "fixed:0", "error_rate": 0.0, "rate_limit_rate": 0.0, "truncate_rate": 0.0},
+    "fast": {"latency": "uniform:200:600", "error_rate": 0.0, "rate_limit_rate": 0.0, "truncate_rate": 0.0},
+    "realistic": {"latency": "lognormal:4000:0.6", "error_rate": 0.01, "rate_limit_rate": 0.02, "truncate_rate": 0.01},
+    "flaky": {"latency": "lognormal:8000:0.9", "error_rate": 0.1, "rate_limit_rate": 0.15, "truncate_rate": 0.05},
+}
+
+TEXT_MARKER = "=== TEKST OM TE ANALYSEREN ==="
+REF_PATTERN = re.compile(r'\b(?=[A-Z0-9-]*\d)([A-Z]{2,}[A-Z0-9]*(?:-[A-Z0-9]+)+|[A-Z]{2,}\d{3,})\b')
+ADDRESS_PATTERN = re.compile(r'([A-Za-zÀ-ÿ\'\-. ]+\d+[A-Za-z]?,?\s*\d{4}\s+[A-Za-zÀ-ÿ\- ]+)')
+TIME_PATTERN = re.compile(r'(\d{1,2}:\d{2})\s*[-–tot]+\s*(\d{1,2}:\d{2})')
+DATE_PATTERN = re.compile(r'(\d{1,2})[/-](\d{1,2})[/-](\d{4})|(\d{4}-\d{2}-\d{2})')
+PHONE_PATTERN = re.compile(r'(\+32[\d\s]{8,13}\d)')
+
+
+class MockConfig:
+    """Behaviour of the mock, shared by all request threads"""
+
+    def __init__(self, args):
+        self.rng = random.Random(args.seed)
+        self.rng_lock = threading.Lock()
+        self.latency = LatencyModel(args.latency, self.rng)
+        self.error_rate = args.error_rate
+        self.rate_limit_rate = args.rate_limit_rate
+        self.retry_after = args.retry_after
+        self.truncate_rate = args.truncate_rate
+        self.stream_chunk_delay = args.stream_chunk_delay / 1000
+        self.canned = None
+        if args.canned:
+            with open(args.canned, encoding='utf-8') as f:
+                self.canned = json.load(f)
+        self.stats = {"requests": 0, "streamed": 0, "errors": 0, "rateLimited": 0, "truncated": 0}
+        self.stats_lock = threading.Lock()
+
+    def roll(self):
+        """Draw the outcome and latency of one request"""
+        with self.rng_lock:
+            latency = self.latency.sample()
+            r = self.rng.random()
+        if r < self.rate_limit_rate:
+            return 'rate_limited', latency
+        if r < self.rate_limit_rate + self.error_rate:
+            return 'error', latency
+        if r < self.rate_limit_rate + self.error_rate + self.truncate_rate:
+            return 'truncated', latency
+        return 'ok', latency
+
+    def count(self, key):
+        with self.stats_lock:
+            self.stats[key] += 1
+
+
+def generate_deliveries(prompt):
+    """Rule-based delivery extraction from the document text inside the prompt"""
+    text = prompt.split(TEXT_MARKER, 1)[1] if TEXT_MARKER in prompt else prompt
+    text = text.split("=== OUTPUT FORMAT ===", 1)[0]
+
+    date_match = DATE_PATTERN.search(text)
+    service_date = None
+    if date_match:
+        if date_match.group(4):
+            service_date = date_match.group(4)
+        else:
+            service_date = f"{date_match.group(3)}-{date_match.group(2).zfill(2)}-{date_match.group(1).zfill(2)}"
+
+    # One delivery per line or block that carries a reference
+    blocks = re.split(r'\n(?=\s*(?:\d+\.|\|?\s*[A-Z]{2,}[A-Z0-9]*-?\d)|\s*\**REF)', text)
+    deliveries = []
+    for block in blocks:
+        ref = REF_PATTERN.search(block)
+        if not ref:
+            continue
+        address = ADDRESS_PATTERN.search(block)
+        times = TIME_PATTERN.search(block)
+        phone = PHONE_PATTERN.search(block)
+        deliveries.append({
+            "customerRef": ref.group(1),
+            "deliveryAddress": {
+                "line1": address.group(1).strip(' ,|') if address else "Adres niet gevonden",
+                "contactName": "Onbekend",
+                "contactPhone": phone.group(1).strip() if phone else ""
+            },
+            "serviceDate": service_date or time.strftime('%Y-%m-%d'),
+            "timeWindowStart": times.group(1).zfill(5) if times else "09:00",
+            "timeWindowEnd": times.group(2).zfill(5) if times else "17:00",
+            "items": [{"description": "Standaard levering", "quantity": 1, "tempClass": "ambient"}],
+            "notes": "",
+            "priority": "normal"
+        })
+    return deliveries
+
+
+class MockAnthropicHandler(http.server.BaseHTTPRequestHandler):
+    config = None
+
+    def log_message(self, format, *args):
+        """Keep load tests quiet"""
+        pass
+
+    def do_GET(self):
+        """Expose request counters"""
+        if self.path == '/stats':
+            with self.config.stats_lock:
+                self.send_json(200, dict(self.config.stats))
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        """Handle POST /v1/messages"""
+        if self.path != '/v1/messages':
+            self.send_error(404)
+            return
+
+        content_length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(content_length).decode('utf-8') or '{}')
+        self.config.count('requests')
+
+        if not self.headers.get('x-api-key'):
+            self.send_json(401, api_error('authentication_error', 'x-api-key header is required'))
+            return
+
+        outcome, latency = self.config.roll()
+        time.sleep(latency)
+
+        if outcome == 'rate_limited':
+            self.config.count('rateLimited')
+            self.send_json(429, api_error('rate_limit_error', 'Mock rate limit'),
+                           {'retry-after': str(self.config.retry_after)})
+            return
+        if outcome == 'error':
+            self.config.count('errors')
+            self.send_json(529, api_error('overloaded_error', 'Mock overload'))
+            return
+
+        truncated = outcome == 'truncated'
+        if truncated:
+            self.config.count('truncated')
+
+        prompt = last_user_text(body)
+        deliveries = self.config.canned if self.config.canned is not None else generate_deliveries(prompt)
+        use_tool = bool(body.get('tools'))
+
+        if body.get('stream'):
+            self.config.count('streamed')
+            self.stream_message(body, prompt, deliveries, use_tool, truncated)
+        else:
+            self.send_json(200, build_message(body, prompt, deliveries, use_tool, truncated))
+
+    def stream_message(self, body, prompt, deliveries, use_tool, truncated):
+        """Send the message as server-sent events like the real streaming API"""
+        message = build_message(body, prompt, deliveries, use_tool, False)
+        block = message['content'][0]
+        payload = json.dumps(block['input']) if use_tool else block['text']
+        if truncated:
+            payload = payload[:len(payload) // 2]
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+
+        start = dict(message, content=[], stop_reason=None)
+        start['usage'] = dict(message['usage'], output_tokens=1)
+        self.send_event('message_start', {"type": "message_start", "message": start})
+
+        if use_tool:
+            empty_block = {"type": "tool_use", "id": block['id'], "name": block['name'], "input": {}}
+        else:
+            empty_block = {"type": "text", "text": ""}
+        self.send_event('content_block_start', {"type": "content_block_start", "index": 0, "content_block": empty_block})
+
+        for i in range(0, len(payload), 64):
+            chunk = payload[i:i + 64]
+            if use_tool:
+                delta = {"type": "input_json_delta", "partial_json": chunk}
+            else:
+                delta = {"type": "text_delta", "text": chunk}
+            self.send_event('content_block_delta', {"type": "content_block_delta", "index": 0, "delta": delta})
+            if self.config.stream_chunk_delay:
+                time.sleep(self.config.stream_chunk_delay)
+
+        self.send_event('content_block_stop', {"type": "content_block_stop", "index": 0})
+        self.send_event('message_delta', {
+            "type": "message_delta",
+            "delta": {"stop_reason": "max_tokens" if truncated else message['stop_reason'], "stop_sequence": None},
+            "usage": {"output_tokens": estimate_tokens(payload)}
+        })
+        self.send_event('message_stop', {"type": "message_stop"})
+
+    def send_event(self, event, data):
+        self.wfile.write(f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode('utf-8'))
+        self.wfile.flush()
+
+    def send_json(self, status, data, headers=None):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def last_user_text(body):
+    """Text of the last user message, whether content is a string or blocks"""
+    for message in reversed(body.get('messages') or []):
+        if message.get('role') != 'user':
+            continue
+        content = message.get('content')
+        if isinstance(content, str):
+            return content
+        return '\n'.join(b.get('text', '') for b in content or [] if b.get('type') == 'text')
+    return ''
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+def build_message(body, prompt, deliveries, use_tool, truncated):
+    """Build a non-streaming Messages API response"""
+    if truncated:
+        deliveries = deliveries[:len(deliveries) // 2]
+
+    if use_tool:
+        tool_name = body['tools'][0]['name']
+        forced = body.get('tool_choice') or {}
+        if forced.get('type') == 'tool':
+            tool_name = forced['name']
+        block = {"type": "tool_use", "id": f"toolu_mock_{uuid.uuid4().hex[:16]}",
+                 "name": tool_name, "input": {"deliveries": deliveries}}
+        output = json.dumps(block['input'])
+    else:
+        output = json.dumps(deliveries, ensure_ascii=False)
+        if truncated:
+            output = output[:len(output) // 2]
+        block = {"type": "text", "text": output}
+
+    return {
+        "id": f"msg_mock_{uuid.uuid4().hex[:16]}",
+        "type": "message",
+        "role": "assistant",
+        "model": body.get('model', 'mock'),
+        "content": [block],
+        "stop_reason": "max_tokens" if truncated else ("tool_use" if use_tool else "end_turn"),
+        "stop_sequence": None,
+        "usage": {"input_tokens": estimate_tokens(prompt), "output_tokens": estimate_tokens(output)}
+    }
+
+
+def api_error(error_type, message):
+    return {"type": "error", "error": {"type": error_type, "message": message}}
+
+
+class ThreadedHTTPServer(socketserver.ThreadingTCPServer):
+    """One thread per connection so simulated latency overlaps like the real API"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline mock of the Anthropic Messages API")
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='fast',
+                        help="preset for latency and failure rates")
+    parser.add_argument('--latency', help="fixed:<ms> | uniform:<min>:<max> | normal:<mean>:<sd> | lognormal:<median>:<sigma>")
+    parser.add_argument('--error-rate', type=float, help="fraction of requests answered with 529 overloaded")
+    parser.add_argument('--rate-limit-rate', type=float, help="fraction of requests answered with 429")
+    parser.add_argument('--retry-after', type=int, default=1, help="Retry-After seconds sent with 429s")
+    parser.add_argument('--truncate-rate', type=float, help="fraction of responses cut off with stop_reason max_tokens")
+    parser.add_argument('--stream-chunk-delay', type=float, default=0, help="milliseconds between streamed deltas")
+    parser.add_argument('--canned', help="JSON file with a fixed deliveries array to return")
+    parser.add_argument('--seed', type=int, default=SEED,
+                        help=f"random seed; fixed (default {SEED}) so a fault profile fails the same requests every run")
+    args = parser.parse_args(argv)
+
+    for key, value in PROFILES[args.profile].items():
+        if getattr(args, key) is None:
+            setattr(args, key, value)
+    return args
+
+
+def start_server(argv=None):
+    args = parse_args(argv)
+    MockAnthropicHandler.config = MockConfig(args)
+
+    print("🧪 Starting mock Anthropic API...")
+    print(f"📱 Listening on http://localhost:{args.port}/v1/messages")
+    print(f"⚙️ Profile: {args.profile} | latency {args.latency} | errors {args.error_rate:.0%} | "
+          f"429s {args.rate_limit_rate:.0%} | truncation {args.truncate_rate:.0%}")
+
+    with ThreadedHTTPServer(("", args.port), MockAnthropicHandler) as httpd:
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            print("\n👋 Mock stopped by user")
+
+
+if __name__ == "__main__":
+    start_server()
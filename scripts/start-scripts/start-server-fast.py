@@ -7,14 +7,10 @@ import http.server
 import socketserver
 import json
 import urllib.parse
-import re
 import datetime
 import random
-from io import BytesIO
 import os
-import threading
 import time
-import urllib.request
 
 # Load environment variables from .env file
 try:
@@ -25,22 +21,104 @@ except ImportError:
     print("⚠️  python-dotenv not installed. Install with: pip install python-dotenv")
     print("   Environment variables will only be loaded from system environment")
 
+# Local modules read their settings from the environment, so import after .env is loaded
+import delivery_extraction
+import email_ingest
+import json_stream
+import multipart_upload
+import pdf_text
+import spreadsheet_ingest
+import urbantz_client
+from delivery_validator import ANNOUNCE_VALIDATOR
+from document_analysis import DocumentAnalyzer, analysis_artifact
+from export_store import ExportStore
+from export_queue import ExportQueue, ExportWorker
+from upload_store import UploadStore, UploadCompactor, UPLOAD_COMPACT_INTERVAL_SECONDS
+from task_reconciler import Reconciler, RECONCILE_INTERVAL_SECONDS
+from analysis_jobs import (ResultStore, Prefetcher, content_key, run_hedged, start_refinement_job,
+                           HEDGE_DEADLINE_SECONDS, MAX_HEDGE_DEADLINE_SECONDS)
+
 # Use a different port to avoid conflicts
 PORT = 8080
 
+# Shared services, opened by create_services() when the server starts. Spawned worker processes (the
+# PDF page pool) run this script again as __mp_main__ and must not open stores, queues or clients.
+UPLOAD_STORE = None
+ANALYZER = None
+RESULT_STORE = None
+PREFETCHER = None
+JOB_STORE = None
+URBANTZ_CLIENT = None
+EXPORT_QUEUE = None
+UPLOAD_COMPACTOR = None
+RECONCILER = None
+
+
+def create_services():
+    """Open the stores, queues and clients shared by the request handlers"""
+    global UPLOAD_STORE, ANALYZER, RESULT_STORE, PREFETCHER, JOB_STORE
+    global URBANTZ_CLIENT, EXPORT_QUEUE, UPLOAD_COMPACTOR, RECONCILER
+
+    # Uploaded documents by SHA-256, with their extracted text and analysis attached
+    UPLOAD_STORE = UploadStore()
+    ANALYZER = DocumentAnalyzer(UPLOAD_STORE)
+
+    # Results of background AI calls that missed the hedge deadline, and of speculative analyses
+    RESULT_STORE = ResultStore()
+
+    # Analyses started by /api/prefetch before the analyze request arrives; that request joins or reuses them
+    PREFETCHER = Prefetcher(RESULT_STORE)
+
+    # Progressive refinement jobs started by async analyze requests
+    JOB_STORE = ResultStore()
+
+    # Shared Urbantz client so keep-alive connections survive between export requests;
+    # the export store makes re-clicks and retries return the original task ids
+    URBANTZ_CLIENT = urbantz_client.UrbantzClient(store=ExportStore()) if urbantz_client.is_configured() else None
+
+    # Durable queue for background exports, drained by a worker thread started with the server
+    EXPORT_QUEUE = ExportQueue() if URBANTZ_CLIENT else None
+
+    # Keeps the upload store within its disk budget; uploads of unfinished queued exports and of queued
+    # or running prefetches are kept, as are uploads held by an analysis in progress
+    UPLOAD_COMPACTOR = UploadCompactor(
+        UPLOAD_STORE,
+        pinned=lambda: PREFETCHER.in_flight('uploadId') | (EXPORT_QUEUE.pending_upload_ids() if EXPORT_QUEUE else set())
+    ) if UPLOAD_COMPACT_INTERVAL_SECONDS else None
+
+    # Polls the status of exported tasks with conditional requests and stores what changed
+    RECONCILER = (Reconciler(URBANTZ_CLIENT, URBANTZ_CLIENT.store)
+                  if URBANTZ_CLIENT and RECONCILE_INTERVAL_SECONDS else None)
+
+class ThreadedHTTPServer(socketserver.ThreadingTCPServer):
+    """One thread per connection so slow requests never block the others"""
+    daemon_threads = True
+
 class FastAPIHandler(http.server.BaseHTTPRequestHandler):
+    # HTTP/1.1 so export progress can be streamed with chunked transfer encoding
+    protocol_version = 'HTTP/1.1'
+
     def do_OPTIONS(self):
         """Handle CORS preflight requests"""
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
     def do_GET(self):
         """Handle GET requests"""
         if self.path == '/api/health':
             self.handle_health()
+        elif self.path == '/api/metrics':
+            self.handle_metrics()
+        elif self.path.startswith('/api/results/'):
+            self.handle_get_result(self.path[len('/api/results/'):])
+        elif self.path.startswith('/api/jobs/'):
+            self.handle_get_job(self.path[len('/api/jobs/'):])
+        elif self.path.startswith('/api/exports/'):
+            self.handle_get_export(self.path[len('/api/exports/'):])
         else:
             self.send_error(404)
 
@@ -50,8 +128,20 @@ class FastAPIHandler(http.server.BaseHTTPRequestHandler):
             self.handle_smart_analyze()
         elif self.path == '/api/urbantz-export':
             self.handle_urbantz_export()
+        elif self.path == '/api/exports':
+            self.handle_queue_export()
+        elif self.path == '/api/validate-deliveries':
+            self.handle_validate_deliveries()
+        elif self.path == '/api/reconcile':
+            self.handle_reconcile()
         elif self.path == '/api/analyze-document':
             self.handle_analyze_document()
+        elif self.path == '/api/analyze-email':
+            self.handle_analyze_email()
+        elif self.path == '/api/analyze-spreadsheet':
+            self.handle_analyze_spreadsheet()
+        elif self.path == '/api/prefetch':
+            self.handle_prefetch()
         else:
             self.send_error(404)
 
@@ -63,12 +153,39 @@ class FastAPIHandler(http.server.BaseHTTPRequestHandler):
         }
         self.send_json_response(response)
 
+    def handle_metrics(self):
+        """Runtime metrics of the export pipeline"""
+        response = {
+            "urbantzExport": URBANTZ_CLIENT.metrics() if URBANTZ_CLIENT else None,
+            "reconciliation": RECONCILER.last_run if RECONCILER else None,
+            "uploadStore": dict(UPLOAD_STORE.stats(), lastCompaction=UPLOAD_COMPACTOR.last_run if UPLOAD_COMPACTOR else None),
+            "prefetch": dict(PREFETCHER.counts),
+            "timestamp": datetime.datetime.now().isoformat()
+        }
+        self.send_json_response(response)
+
+    def handle_get_result(self, result_id):
+        """Return the late AI result of a hedged analysis"""
+        result = RESULT_STORE.get(result_id)
+        if result is None:
+            self.send_error(404, "Unknown or expired result id")
+            return
+        self.send_json_response(result)
+
+    def handle_get_job(self, job_id):
+        """Return the current (possibly still refining) result of an async analysis"""
+        job = JOB_STORE.get(job_id)
+        if job is None:
+            self.send_error(404, "Unknown or expired job id")
+            return
+        job["jobId"] = job.pop("resultId")
+        job["multipleDeliveries"] = job.get("deliveryCount", 0) > 1
+        self.send_json_response(job)
+
     def handle_smart_analyze(self):
         """Smart analyze endpoint with improved AI integration"""
         try:
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            data = json.loads(post_data.decode('utf-8'))
+            data = json_stream.read_json(self.rfile, int(self.headers['Content-Length']))
             
             text = data.get('text', '')
             html_content = data.get('htmlContent', '')
@@ -88,519 +205,478 @@ class FastAPIHandler(http.server.BaseHTTPRequestHandler):
                 print(f"\nFirst 500 chars of HTML:\n{html_content[:500]}")
             print("="*50 + "\n")
             
-            # Use AI analysis with enhanced prompting
-            deliveries = self.extract_deliveries_with_improved_ai(text, html_content)
+            key = self.text_prefetch_key(text, html_content)
+            if data.get('mode') in ('hedged', 'async'):
+                # A finished prefetch beats any deadline
+                prefetched = PREFETCHER.peek(key)
+                if prefetched:
+                    print(f"⚡ Prefetched analysis {prefetched['resultId']} reused")
+                    self.send_json_response(self.text_analysis_response(text, prefetched, 'hit'))
+                    return
             
-            response = {
-                "success": True,
-                "confidence": 90,
-                "rawText": text,
-                "deliveries": deliveries,
-                "deliveryCount": len(deliveries),
-                "multipleDeliveries": len(deliveries) > 1,
-                "aiPowered": True,
-                "method": "ai_extraction"
-            }
+            if data.get('mode') == 'hedged' and os.environ.get('ANTHROPIC_API_KEY'):
+                deadline = data.get('deadline')
+                try:
+                    deadline = HEDGE_DEADLINE_SECONDS if deadline is None else float(deadline)
+                except (TypeError, ValueError):
+                    deadline = float('nan')
+                # NaN fails the comparison as well
+                if not 0 < deadline <= MAX_HEDGE_DEADLINE_SECONDS:
+                    self.send_error(400, f"deadline must be a number of seconds between 0 and {MAX_HEDGE_DEADLINE_SECONDS:g}")
+                    return
+                self.handle_hedged_analyze(text, deadline)
+                return
             
-            self.send_json_response(response)
+            if data.get('mode') == 'async':
+                self.handle_async_analyze(text)
+                return
+            
+            # Use AI analysis with enhanced prompting, unless a prefetch of this text is done or under way
+            result, outcome = PREFETCHER.take(key, lambda: ANALYZER.analyze_text(text, html_content))
+            if outcome != 'miss':
+                print(f"⚡ Prefetched analysis {result['resultId']} {'reused' if outcome == 'hit' else 'joined'}")
+            self.send_json_response(self.text_analysis_response(text, result, outcome))
             
+        except json_stream.BodyTooLarge as e:
+            self.send_error(413, str(e))
         except Exception as e:
             print(f"Smart analyze error: {e}")
             self.send_error(500, str(e))
 
+    def text_analysis_response(self, text, result, prefetch):
+        """Smart analyze response for a text analysis result"""
+        deliveries = result["deliveries"]
+        return {
+            "success": True,
+            "confidence": 90,
+            "rawText": text,
+            "deliveries": deliveries,
+            "deliveryCount": len(deliveries),
+            "multipleDeliveries": len(deliveries) > 1,
+            "aiPowered": True,
+            "method": "ai_extraction",
+            "promptDiet": result.get("promptDiet"),
+            "prefetch": prefetch,
+            "resultId": result.get("resultId")
+        }
+
+    def text_prefetch_key(self, text, html_content=''):
+        """Prefetch key of a text analysis; AI and pattern results are kept apart"""
+        return content_key('text', analysis_artifact(), text, html_content)
+
+    def handle_hedged_analyze(self, text, deadline=HEDGE_DEADLINE_SECONDS):
+        """Race pattern matching against Claude and answer within the deadline"""
+        api_key = os.environ.get('ANTHROPIC_API_KEY')
+        
+        deliveries, method, result_id = run_hedged(
+            lambda: delivery_extraction.extract_deliveries_with_patterns(text),
+            lambda: delivery_extraction.extract_deliveries_with_claude(text, api_key=api_key)[0],
+            deadline,
+            RESULT_STORE
+        )
+        
+        if result_id:
+            print(f"⏱️ Claude missed the {deadline}s deadline, returning provisional result {result_id}")
+        
+        response = {
+            "success": True,
+            "confidence": 90 if method == 'ai_extraction' else 70,
+            "rawText": text,
+            "deliveries": deliveries,
+            "deliveryCount": len(deliveries),
+            "multipleDeliveries": len(deliveries) > 1,
+            "aiPowered": method == 'ai_extraction',
+            "method": method,
+            "provisional": result_id is not None,
+            "resultId": result_id
+        }
+        
+        self.send_json_response(response)
+
+    def handle_async_analyze(self, text):
+        """Answer with a local extraction right away and refine it in the background"""
+        deliveries = delivery_extraction.extract_deliveries_with_patterns(text)
+        
+        stages = []
+        api_key = os.environ.get('ANTHROPIC_API_KEY')
+        if api_key:
+            stages.append(('ai_extraction',
+                           lambda: delivery_extraction.extract_deliveries_with_claude(text, api_key=api_key)[0]))
+        
+        job_id = start_refinement_job(JOB_STORE, deliveries, 'pattern_matching', stages)
+        
+        response = {
+            "success": True,
+            "jobId": job_id,
+            "status": JOB_STORE.get(job_id)["status"],
+            "rawText": text,
+            "deliveries": deliveries,
+            "deliveryCount": len(deliveries),
+            "multipleDeliveries": len(deliveries) > 1,
+            "aiPowered": False,
+            "method": "pattern_matching"
+        }
+        
+        self.send_json_response(response, status=202)
+
     def handle_urbantz_export(self):
         """Urbantz export endpoint"""
         try:
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            deliveries = json.loads(post_data.decode('utf-8'))
+            # Deliveries are decoded one by one while they are being exported
+            deliveries = json_stream.ArrayReader(self.rfile, int(self.headers['Content-Length']))
             
-            results = []
-            successful = 0
-            failed = 0
+            if 'application/x-ndjson' in (self.headers.get('Accept') or ''):
+                self.stream_export(deliveries)
+                return
             
-            for delivery in deliveries:
-                try:
-                    # Create mock Urbantz task ID
-                    task_id = f"URBANTZ-{int(time.time() * 1000)}-{random.randint(1000, 9999)}"
-                    results.append({
-                        "customerRef": delivery.get('customerRef', 'N/A'),
-                        "taskId": task_id,
-                        "status": "success"
-                    })
-                    successful += 1
-                except Exception as e:
-                    results.append({
-                        "customerRef": delivery.get('customerRef', 'N/A'),
-                        "error": str(e),
-                        "status": "failed"
-                    })
-                    failed += 1
+            if URBANTZ_CLIENT:
+                print(f"📦 Exporting deliveries to {URBANTZ_CLIENT.base_url} "
+                      f"(limit {URBANTZ_CLIENT.limiter.limit:.0f} in flight)...")
+                exported = URBANTZ_CLIENT.iter_export(deliveries)
+            else:
+                print("⚠️ URBANTZ_API_KEY not found, creating mock task IDs")
+                exported = ((i, self.mock_export_result(d)) for i, d in enumerate(deliveries))
+            
+            by_index = {}
+            try:
+                for index, result in exported:
+                    by_index[index] = result
+            except json_stream.BodyTooLarge:
+                raise
+            except ValueError as e:
+                # Deliveries before the malformed part were already sent; tell the caller which ones
+                print(f"Export error after {len(by_index)} deliveries: {e}")
+                results = [dict(by_index[i], index=i) for i in sorted(by_index)]
+                self.close_connection = True
+                self.send_json_response({
+                    "success": False,
+                    "error": f"Invalid deliveries: {e}",
+                    "processed": len(results),
+                    "successful": sum(1 for r in results if r.get('status') == 'success'),
+                    "results": results
+                }, status=400)
+                return
+            results = [by_index[i] for i in range(len(by_index))]
+            
+            successful = sum(1 for r in results if r.get('status') == 'success')
+            failed = len(results) - successful
             
             response = {
                 "success": True,
-                "totalDeliveries": len(deliveries),
+                "totalDeliveries": len(results),
                 "successful": successful,
                 "failed": failed,
+                "cached": sum(1 for r in results if r.get('cached')),
                 "results": results,
                 "errors": [r for r in results if r.get('status') == 'failed']
             }
             
             self.send_json_response(response)
             
+        except json_stream.BodyTooLarge as e:
+            self.send_error(413, str(e))
+        except ValueError as e:
+            print(f"Export error: {e}")
+            self.send_error(400, f"Invalid deliveries: {e}")
         except Exception as e:
             print(f"Export error: {e}")
             self.send_error(500, str(e))
 
-    def handle_analyze_document(self):
-        """Handle document analysis endpoint"""
+    def stream_export(self, deliveries):
+        """Write one NDJSON line per delivery as soon as its export finishes"""
+        if URBANTZ_CLIENT:
+            results = URBANTZ_CLIENT.iter_export(deliveries)
+        else:
+            results = ((i, self.mock_export_result(d)) for i, d in enumerate(deliveries))
+        
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        
+        total = successful = cached = 0
+        try:
+            for index, result in results:
+                total += 1
+                successful += result.get('status') == 'success'
+                cached += bool(result.get('cached'))
+                self.write_chunk(dict(result, type="result", index=index))
+        except ValueError as e:
+            # Headers are already sent, so a malformed body ends the stream with an error line
+            print(f"Export error: {e}")
+            self.write_chunk({"type": "error", "error": f"Invalid deliveries: {e}", "processed": total})
+            self.wfile.write(b'0\r\n\r\n')
+            self.close_connection = True
+            return
+        
+        self.write_chunk({
+            "type": "summary",
+            "success": True,
+            "totalDeliveries": total,
+            "successful": successful,
+            "failed": total - successful,
+            "cached": cached
+        })
+        self.wfile.write(b'0\r\n\r\n')
+
+    def write_chunk(self, data):
+        """Send one JSON object as an NDJSON line in its own HTTP chunk"""
+        line = (json.dumps(data, ensure_ascii=False) + '\n').encode('utf-8')
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(line), line))
+        self.wfile.flush()
+
+    def mock_export_result(self, delivery):
+        """Export result with a mock Urbantz task ID, used without URBANTZ_API_KEY"""
+        return {
+            "customerRef": delivery.get('customerRef', 'N/A'),
+            "taskId": f"URBANTZ-{int(time.time() * 1000)}-{random.randint(1000, 9999)}",
+            "status": "success"
+        }
+
+    def handle_queue_export(self):
+        """Queue an export batch and return its job id right away"""
+        if not EXPORT_QUEUE:
+            self.skip_body()
+            self.send_json_response({"error": "URBANTZ_API_KEY not configured"}, status=503)
+            return
         try:
-            # For now, simulate document analysis with mock data
-            mock_text = """
-            Levering informatie:
+            deliveries = json_stream.read_json(self.rfile, int(self.headers['Content-Length']))
+            upload_id = None
+            if isinstance(deliveries, dict):
+                # {"deliveries": [...], "uploadId": ...} keeps the source document until the export is done
+                upload_id = deliveries.get('uploadId')
+                deliveries = deliveries.get('deliveries')
             
-            REF: DOC-12345
-            Klant: Test Bedrijf
-            Adres: Teststraat 123, 1000 Brussel
-            Nummer: +32 2 123 4567
-            Datum: 15/10/2025
-            Tijd: 10:00 - 14:00
+            if not isinstance(deliveries, list) or len(deliveries) == 0:
+                self.send_json_response({"error": "Expected array of deliveries"}, status=400)
+                return
             
-            Items: 3x Pakketten, 1x Documenten
-            """
+            job_id = EXPORT_QUEUE.enqueue(deliveries, upload_id)
+            print(f"📥 Queued export {job_id} with {len(deliveries)} deliveries")
             
-            deliveries = self.extract_deliveries_with_improved_ai(mock_text)
+            self.send_json_response({
+                "success": True,
+                "jobId": job_id,
+                "totalDeliveries": len(deliveries),
+                "statusUrl": f"/api/exports/{job_id}"
+            }, status=202)
+            
+        except json_stream.BodyTooLarge as e:
+            self.send_error(413, str(e))
+        except Exception as e:
+            print(f"Export queue error: {e}")
+            self.send_error(500, str(e))
+
+    def handle_reconcile(self):
+        """Start a task status reconciliation pass now instead of at the next interval"""
+        self.skip_body()
+        if not RECONCILER:
+            self.send_json_response({"error": "Task reconciliation is not enabled"}, status=503)
+            return
+        RECONCILER.wakeup.set()
+        self.send_json_response({"success": True, "lastRun": RECONCILER.last_run}, status=202)
+
+    def handle_validate_deliveries(self):
+        """Check a batch against the announce schema without exporting anything"""
+        try:
+            deliveries = json_stream.ArrayReader(self.rfile, int(self.headers['Content-Length']))
+            report = ANNOUNCE_VALIDATOR.validate_batch(deliveries)
+            print(f"🔎 Validated {report['total']} deliveries: {report['invalid']} invalid")
+            self.send_json_response(dict(report, success=report['invalid'] == 0))
+            
+        except json_stream.BodyTooLarge as e:
+            self.send_error(413, str(e))
+        except ValueError as e:
+            self.send_error(400, f"Invalid deliveries: {e}")
+        except Exception as e:
+            print(f"Validation error: {e}")
+            self.send_error(500, str(e))
+
+    def handle_get_export(self, job_id):
+        """Per-delivery status of a queued export"""
+        status = EXPORT_QUEUE.status(job_id) if EXPORT_QUEUE else None
+        if status is None:
+            self.send_error(404, "Unknown export job")
+            return
+        self.send_json_response(status)
+
+    def handle_analyze_document(self):
+        """Extract the text of an uploaded PDF page by page and analyze it"""
+        try:
+            # The file is hashed and spooled into the upload store while it is received
+            upload = multipart_upload.receive_upload(self.rfile, self.headers, UPLOAD_STORE,
+                                                     accept=lambda head: head.lstrip().startswith(b'%PDF'))
+            response, status = self.analyze_upload_once(upload["sha256"], upload["fileName"], kind='pdf')
+            self.send_json_response(response, status=status)
+            
+        except multipart_upload.UploadError as e:
+            # Part of the body may still be unread
+            self.close_connection = True
+            self.send_error(e.status, str(e))
+        except pdf_text.PDFError as e:
+            self.send_error(422, str(e))
+        except Exception as e:
+            print(f"Document analysis error: {e}")
+            self.send_error(500, str(e))
+
+    def handle_analyze_email(self):
+        """Analyze a raw .eml: the body and every attachment go through their own analyzer"""
+        try:
+            upload = multipart_upload.receive_upload(self.rfile, self.headers, UPLOAD_STORE,
+                                                     accept=email_ingest.looks_like_email)
+            response, status = self.analyze_upload_once(upload["sha256"], upload["fileName"], kind='email')
+            self.send_json_response(response, status=status)
+
+        except multipart_upload.UploadError as e:
+            self.close_connection = True
+            self.send_error(e.status, str(e))
+        except Exception as e:
+            print(f"Email analysis error: {e}")
+            self.send_error(500, str(e))
+
+    def handle_analyze_spreadsheet(self):
+        """Map the columns of an uploaded CSV or XLSX file once and turn every row into a delivery"""
+        try:
+            upload = multipart_upload.receive_upload(
+                self.rfile, self.headers, UPLOAD_STORE,
+                accept=lambda head: spreadsheet_ingest.detect_format(head) is not None)
+            with UPLOAD_STORE.open(upload["sha256"]) as f:
+                fmt = spreadsheet_ingest.detect_format(f.read(1024), upload["fileName"])
+                if fmt is None:
+                    self.send_error(415, "Expected a CSV or XLSX file")
+                    return
+                f.seek(0)
+                reader = spreadsheet_ingest.DeliveryReader(f, fmt)
+                columns = reader.mapping.describe()
+                print(f"📊 {upload['fileName']}: {fmt}, header on row {reader.header_row}, columns {columns}")
+                
+                if 'application/x-ndjson' in (self.headers.get('Accept') or ''):
+                    self.stream_deliveries(reader, upload)
+                    return
+                deliveries = list(reader)
             
             response = {
                 "success": True,
-                "confidence": 85,
-                "rawText": mock_text,
+                "confidence": 95,
                 "deliveries": deliveries,
                 "deliveryCount": len(deliveries),
                 "multipleDeliveries": len(deliveries) > 1,
-                "fileName": "uploaded_document.pdf"
+                "aiPowered": False,
+                "method": "column_mapping",
+                "columns": columns,
+                "rows": reader.rows,
+                "skippedRows": reader.skipped,
+                "fileName": upload["fileName"],
+                "uploadId": upload["sha256"]
             }
-            
             self.send_json_response(response)
             
+        except multipart_upload.UploadError as e:
+            self.close_connection = True
+            self.send_error(e.status, str(e))
+        except spreadsheet_ingest.SpreadsheetError as e:
+            self.send_error(422, str(e))
         except Exception as e:
-            print(f"Document analysis error: {e}")
+            print(f"Spreadsheet analysis error: {e}")
             self.send_error(500, str(e))
 
-    def extract_deliveries_with_improved_ai(self, text, html_content=''):
-        """Improved delivery extraction using Anthropic Claude API with few-shot learning"""
-        # Try to use Anthropic Claude API first
-        anthropic_api_key = os.environ.get('ANTHROPIC_API_KEY')
-        
-        if anthropic_api_key:
-            try:
-                print("🤖 Using Anthropic Claude API for AI analysis...")
-                
-                # DEBUG: Log the prompt being sent
-                print("\n📤 SENDING TO AI:")
-                print(f"Text to analyze (first 300 chars): {text[:300]}...")
-                
-                deliveries = self.extract_deliveries_with_claude(text, api_key=anthropic_api_key)
-                
-                # DEBUG: Log what we got back
-                print(f"\n📨 AI RESPONSE:")
-                print(f"Number of deliveries: {len(deliveries) if deliveries else 0}")
-                if deliveries:
-                    print(f"First delivery: {json.dumps(deliveries[0], indent=2)}")
-                
-                if deliveries:
-                    print(f"✅ Claude API extracted {len(deliveries)} delivery(ies)")
-                    return deliveries
-            except Exception as e:
-                print(f"⚠️ Claude API error: {e}")
-                import traceback
-                traceback.print_exc()
-                print("   Falling back to pattern matching...")
-        else:
-            print("⚠️ ANTHROPIC_API_KEY not found, using pattern matching")
-        
-        # Fallback to pattern matching
-        return self.extract_deliveries_with_patterns(text)
-    
-    def extract_deliveries_with_claude(self, text, api_key):
-        """Extract deliveries using Anthropic Claude API with chain-of-thought reasoning"""
-        prompt = f"""
-Je bent een expert in het analyseren van leveringsdocumenten, emails en tabellen. 
-
-=== STAP 1: ANALYSE VAN HET DOCUMENT ===
-Analyseer eerst het document en bepaal:
-1. Wat is het FORMAT? (tabel, genummerde lijst, paragrafen, enkele levering, etc.)
-2. Hoeveel LEVERINGEN zijn er? (tel zorgvuldig alle aparte leveringen)
-3. Hoe is de DATA GESTRUCTUREERD? (kolommen, bullets, tekst)
-
-=== VOORBEELDEN VAN VERSCHILLENDE FORMATEN ===
-
-VOORBEELD A - TABEL FORMAT (meerdere leveringen):
-```
-| Ref | Klant | Adres | Tijdslot | Contact |
-| ORD-001 | Bakkerij Jan | Hoofdstraat 1, Brussel | 08:00–10:00 | +32 2 123 45 67 |
-| ORD-002 | Café Marie | Kerkstraat 5, Antwerpen | 09:00–11:00 | +32 3 234 56 78 |
-```
-→ Format: TABEL
-→ Aantal leveringen: 2 (één per rij)
-→ Output: Array met 2 objecten
-
-VOORBEELD B - GENUMMERDE LIJST (meerdere leveringen):
-```
-1. REF: ORD-001
-   Klant: Bakkerij Jan
-   Adres: Hoofdstraat 1, Brussel
-   Tijd: 08:00 - 10:00
-
-2. REF: ORD-002
-   Klant: Café Marie
-   Adres: Kerkstraat 5, Antwerpen
-   Tijd: 09:00 - 11:00
-```
-→ Format: GENUMMERDE LIJST
-→ Aantal leveringen: 2 (één per nummer)
-→ Output: Array met 2 objecten
-
-VOORBEELD C - ENKELE LEVERING (één levering):
-```
-Levering: BXL2501
-Adres: Fleur du Jour, Vlaanderenstraat 16, 9000 Gent
-Contact: +32 497 30 52 10
-Tijd: 10:00 - 13:00
-```
-→ Format: ENKELE LEVERING
-→ Aantal leveringen: 1
-→ Output: Array met 1 object
-
-=== STAP 2: EXTRACTIE REGELS ===
-
-Voor TABEL format:
-- Elke DATA RIJ (niet de header) = 1 levering
-- Map kolommen naar velden (Ref→customerRef, Klant→contactName, etc.)
-
-Voor GENUMMERDE LIJST:
-- Elk genummerd item = 1 levering
-- Extraheer velden uit elk item
-
-Voor ENKELE LEVERING:
-- Alle info behoort tot 1 levering
-- Extraheer alle beschikbare velden
-
-Voor PARAGRAFEN/VRIJE TEKST:
-- Zoek naar scheiding tussen leveringen (nummering, witruimte, "levering X", etc.)
-- Elke aparte levering sectie = 1 levering
-
-=== STAP 3: VELD EXTRACTIE ===
-Voor elke levering:
-- customerRef: Referentie nummer (ORD-XXX, REF:, etc.)
-- deliveryAddress:
-  - line1: Volledig adres (straat, nummer, postcode, stad)
-  - contactName: Naam klant/bedrijf
-  - contactPhone: Telefoonnummer
-- serviceDate: Leverdatum in YYYY-MM-DD (haal uit email tekst, gebruik voor alle leveringen)
-- timeWindowStart: Start tijd (HH:MM)
-- timeWindowEnd: Eind tijd (HH:MM)
-- items: [{{description: "Standaard levering", quantity: 1, tempClass: "ambient"}}]
-- notes: Relevante extra info
-- priority: "normal" (tenzij urgent/spoed vermeld)
-
-=== TEKST OM TE ANALYSEREN ===
-{text}
-
-=== OUTPUT FORMAT ===
-Denk eerst na over:
-1. Wat is het format?
-2. Hoeveel leveringen zijn er?
-3. Hoe extraheer ik de data?
-
-Geef dan een JSON array terug met EXACT het aantal leveringen dat je hebt gevonden.
-- Als het een tabel is met 10 rijen → 10 leveringen
-- Als het een lijst is met 5 items → 5 leveringen  
-- Als het 1 enkele levering is → 1 levering
-
-Geef ALLEEN de JSON array terug, geen uitleg.
-"""
-        
-        # Prepare API request
-        request_data = {
-            "model": "claude-3-5-sonnet-20241022",
-            "max_tokens": 8000,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ]
-        }
-        
-        # Make API request
-        req = urllib.request.Request(
-            'https://api.anthropic.com/v1/messages',
-            data=json.dumps(request_data).encode('utf-8'),
-            headers={
-                'x-api-key': api_key,
-                'Content-Type': 'application/json',
-                'anthropic-version': '2023-06-01'
-            }
-        )
-        
-        response = urllib.request.urlopen(req, timeout=30)
-        result = json.loads(response.read().decode('utf-8'))
-        
-        if result.get('content') and len(result['content']) > 0:
-            ai_response = result['content'][0]['text']
-            
-            print(f"\n🤖 RAW AI RESPONSE:")
-            print(f"{ai_response[:1000]}...")  # First 1000 chars
-            
-            try:
-                # Try to extract JSON from the response (might have markdown code blocks)
-                json_match = re.search(r'```json\s*([\s\S]*?)\s*```', ai_response)
-                if json_match:
-                    json_str = json_match.group(1)
-                else:
-                    # Try to find any JSON array in the response
-                    json_match = re.search(r'\[[\s\S]*\]', ai_response)
-                    if json_match:
-                        json_str = json_match.group(0)
-                    else:
-                        json_str = ai_response
-                
-                # Parse AI response as JSON
-                deliveries = json.loads(json_str)
-                if isinstance(deliveries, list):
-                    return deliveries
-                elif isinstance(deliveries, dict):
-                    return [deliveries]
-            except json.JSONDecodeError as e:
-                print(f"❌ Failed to parse Claude response: {e}")
-                print(f"Claude full response: {ai_response}")
-        
-        return None
-    
-    def extract_deliveries_with_patterns(self, text):
-        """Fallback: Extract deliveries using pattern matching"""
-        deliveries = []
-        
-        # Improved pattern matching
-        sections = self.detect_delivery_sections(text)
+    def stream_deliveries(self, reader, upload):
+        """Write one NDJSON line per spreadsheet row as it is converted"""
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
         
-        for i, section in enumerate(sections):
-            delivery = {
-                "taskId": f"TASK-{int(time.time() * 1000)}-{i + 1}",
-                "customerRef": self.extract_customer_ref(section),
-                "deliveryAddress": self.extract_address(section),
-                "serviceDate": self.extract_date(section),
-                "timeWindowStart": self.extract_time_start(section),
-                "timeWindowEnd": self.extract_time_end(section),
-                "items": self.extract_items(section),
-                "notes": f"Geëxtraheerd uit sectie {i + 1}",
-                "priority": "normal"
-            }
+        count = 0
+        try:
+            for count, delivery in enumerate(reader, 1):
+                self.write_chunk({"type": "delivery", "index": count - 1, "delivery": delivery})
+        except spreadsheet_ingest.SpreadsheetError as e:
+            # Headers are already sent, so a broken sheet ends the stream with an error line
+            self.write_chunk({"type": "error", "error": str(e), "processed": count})
+            self.wfile.write(b'0\r\n\r\n')
+            self.close_connection = True
+            return
+        
+        self.write_chunk({
+            "type": "summary",
+            "success": True,
+            "deliveryCount": count,
+            "rows": reader.rows,
+            "skippedRows": reader.skipped,
+            "columns": reader.mapping.describe(),
+            "fileName": upload["fileName"],
+            "uploadId": upload["sha256"]
+        })
+        self.wfile.write(b'0\r\n\r\n')
+
+    def analyze_upload_once(self, sha, file_name, kind=None):
+        """ANALYZER.analyze_upload, reusing a prefetch of the same file that is done or still running"""
+        # Pinned so the compactor cannot evict the upload while it is analyzed
+        with UPLOAD_STORE.hold(sha):
+            result, outcome = PREFETCHER.take(content_key('upload', analysis_artifact(), sha),
+                                              lambda: ANALYZER.upload_analysis(sha, file_name, kind))
+        if outcome != 'miss':
+            print(f"⚡ {file_name}: prefetched analysis {result['resultId']} {'reused' if outcome == 'hit' else 'joined'}")
+        return dict(result["response"], fileName=file_name, prefetch=outcome), result["httpStatus"]
+
+    def handle_prefetch(self):
+        """Start analyzing pasted text or an uploaded file before the analyze request comes in"""
+        try:
+            if (self.headers.get('Content-Type') or '').startswith('application/json'):
+                data = json_stream.read_json(self.rfile, int(self.headers['Content-Length']))
+                text, html_content = data.get('text', ''), data.get('htmlContent', '')
+                if not text:
+                    self.send_error(400, "No text provided")
+                    return
+                result_id, started = PREFETCHER.submit(self.text_prefetch_key(text, html_content),
+                                                       lambda: ANALYZER.analyze_text(text, html_content),
+                                                       kind='text')
+                response = {"success": True, "prefetchId": result_id, "started": started}
+            else:
+                upload = multipart_upload.receive_upload(self.rfile, self.headers, UPLOAD_STORE)
+                sha, file_name = upload["sha256"], upload["fileName"]
+                result_id, started = PREFETCHER.submit(content_key('upload', analysis_artifact(), sha),
+                                                       lambda: ANALYZER.upload_analysis(sha, file_name),
+                                                       kind='upload', uploadId=sha)
+                response = {"success": True, "prefetchId": result_id, "started": started, "uploadId": sha}
             
-            # Only add if we found meaningful data
-            if delivery["customerRef"] != "AUTO-NOTFOUND" or delivery["deliveryAddress"]["line1"] != "Adres niet gevonden":
-                deliveries.append(delivery)
-        
-        return deliveries
-
-    def detect_delivery_sections(self, text):
-        """Detect delivery sections in text"""
-        # Look for clear section separators
-        sections = []
-        
-        # Try to split by REF: patterns
-        ref_sections = re.split(r'(?=REF:\s*[A-Z0-9-]+)', text, flags=re.IGNORECASE)
-        if len(ref_sections) > 1:
-            sections.extend([s for s in ref_sections if s.strip()])
-        
-        # If no REF sections, try other patterns
-        if not sections:
-            section_patterns = [
-                r'(?=Klant:\s*)',
-                r'(?=Adres:\s*)',
-                r'(?=lever|delivery)'
-            ]
+            print(f"🔮 Prefetch {response['prefetchId']} {'started' if started else 'already known'}")
+            response["status"] = RESULT_STORE.get(response["prefetchId"])["status"]
+            self.send_json_response(response, status=202)
             
-            for pattern in section_patterns:
-                parts = re.split(pattern, text, flags=re.IGNORECASE)
-                if len(parts) > 1:
-                    sections.extend([p for p in parts if p.strip() and len(p.strip()) > 50])
-                    break
-        
-        # Fallback to full text
-        if not sections:
-            sections = [text]
-        
-        return sections
-
-    def extract_customer_ref(self, text):
-        """Extract customer reference with improved patterns"""
-        patterns = [
-            r'REF:\s*([A-Z0-9-]+)',
-            r'Klant:\s*([A-Z0-9-]+)',
-            r'Customer:\s*([A-Z0-9-]+)',
-            r'Order:\s*([A-Z0-9-]+)',
-            r'([A-Z]{2,}\d{3,})'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                return match.group(1).strip()
-        
-        return "AUTO-NOTFOUND"
-
-    def extract_address(self, text):
-        """Extract address with improved patterns"""
-        patterns = [
-            r'Adres:\s*([^\n\r]+)',
-            r'Address:\s*([^\n\r]+)',
-            r'([A-Za-z\s]+(?:straat|street|laan|avenue|plein|square|weg|road)\s+\d+[^\n\r]*)',
-            r'([A-Za-z\s]+\d+[A-Za-z]?\s*,\s*\d{4}\s+[A-Za-z\s]+)'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                address = match.group(1).strip()
-                return {
-                    "line1": address,
-                    "contactName": self.extract_contact_name(text),
-                    "contactPhone": self.extract_phone(text)
-                }
-        
-        return {
-            "line1": "Adres niet gevonden",
-            "contactName": "Onbekend",
-            "contactPhone": "+32 000 000 000"
-        }
-
-    def extract_contact_name(self, text):
-        """Extract contact name"""
-        patterns = [
-            r'Klant:\s*([^\n\r]+)',
-            r'Contact:\s*([^\n\r]+)',
-            r'Naam:\s*([^\n\r]+)',
-            r'([A-Z][a-z]+\s+[A-Z][a-z]+)'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                return match.group(1).strip()
-        
-        return "Contact persoon"
-
-    def extract_phone(self, text):
-        """Extract phone number"""
-        patterns = [
-            r'Nummer:\s*(\+32\s?\d{2,3}\s?\d{2,3}\s?\d{2,3})',
-            r'(\+32\s?\d{2,3}\s?\d{2,3}\s?\d{2,3})',
-            r'(0\d{2,3}\s?\d{2,3}\s?\d{2,3})'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text)
-            if match:
-                return match.group(1)
-        
-        return "+32 000 000 000"
-
-    def extract_date(self, text):
-        """Extract date with improved patterns"""
-        patterns = [
-            r'Datum:\s*(\d{1,2}[-\/]\d{1,2}[-\/]\d{2,4})',
-            r'Date:\s*(\d{1,2}[-\/]\d{1,2}[-\/]\d{2,4})',
-            r'(\d{4}-\d{2}-\d{2})',
-            r'(\d{1,2}[-\/]\d{1,2}[-\/]\d{2,4})'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                date_str = match.group(1)
-                # Convert to ISO format
-                if '/' in date_str:
-                    parts = date_str.split('/')
-                    if len(parts[2]) == 2:
-                        parts[2] = '20' + parts[2]
-                    return f"{parts[2]}-{parts[1].zfill(2)}-{parts[0].zfill(2)}"
-                elif '-' in date_str:
-                    return date_str
-        
-        # Default to tomorrow
-        tomorrow = datetime.datetime.now() + datetime.timedelta(days=1)
-        return tomorrow.strftime('%Y-%m-%d')
-
-    def extract_time_start(self, text):
-        """Extract start time"""
-        patterns = [
-            r'Tijd:\s*(\d{1,2}:\d{2})\s*(?:-|tot)',
-            r'Time:\s*(\d{1,2}:\d{2})\s*(?:-|tot)',
-            r'(\d{1,2}:\d{2})\s*(?:tot|-)'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                return match.group(1)
-        
-        return "09:00"
-
-    def extract_time_end(self, text):
-        """Extract end time"""
-        patterns = [
-            r'Tijd:\s*\d{1,2}:\d{2}\s*(?:-|tot)\s*(\d{1,2}:\d{2})',
-            r'Time:\s*\d{1,2}:\d{2}\s*(?:-|tot)\s*(\d{1,2}:\d{2})',
-            r'(\d{1,2}:\d{2})\s*(?:einde|end)'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                return match.group(1)
-        
-        return "17:00"
+        except multipart_upload.UploadError as e:
+            self.close_connection = True
+            self.send_error(e.status, str(e))
+        except json_stream.BodyTooLarge as e:
+            self.send_error(413, str(e))
+        except Exception as e:
+            print(f"Prefetch error: {e}")
+            self.send_error(500, str(e))
 
-    def extract_items(self, text):
-        """Extract items"""
-        items = []
-        
-        # Look for item patterns
-        patterns = [
-            r'Items:\s*([^\n\r]+)',
-            r'Pakketten:\s*([^\n\r]+)',
-            r'(\d+\s*(?:x|stuks?|pakketten?))'
-        ]
-        
-        for pattern in patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            for match in matches:
-                items.append({
-                    "description": match.strip(),
-                    "quantity": 1,
-                    "tempClass": "ambient"
-                })
-        
-        if not items:
-            items.append({
-                "description": "Pakket uit document",
-                "quantity": 1,
-                "tempClass": "ambient"
-            })
-        
-        return items
+    def skip_body(self):
+        """Close the connection after this response when the request body is left unread"""
+        # Otherwise a keep-alive client's body would be parsed as its next request
+        if int(self.headers.get('Content-Length') or 0):
+            self.close_connection = True
 
-    def send_json_response(self, data):
+    def send_json_response(self, data, status=200):
         """Send JSON response"""
-        self.send_response(200)
+        json_data = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        
+        self.send_response(status)
+        if self.close_connection:
+            self.send_header('Connection', 'close')
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(json_data)))
         self.end_headers()
         
-        json_data = json.dumps(data, ensure_ascii=False)
-        self.wfile.write(json_data.encode('utf-8'))
+        self.wfile.write(json_data)
 
 def start_server():
     """Start the server with better error handling"""
@@ -608,17 +684,36 @@ def start_server():
     print(f"📱 Server will be available at: http://localhost:{PORT}")
     print("🔧 API endpoints available:")
     print("   - POST /api/smart-analyze")
-    print("   - POST /api/urbantz-export")
+    print("   - POST /api/analyze-document")
+    print("   - POST /api/analyze-email")
+    print("   - POST /api/analyze-spreadsheet (Accept: application/x-ndjson streams rows)")
+    print("   - POST /api/prefetch (text as JSON or a file; analyze requests reuse the result)")
+    print("   - POST /api/urbantz-export (Accept: application/x-ndjson streams progress)")
+    print("   - POST /api/exports")
+    print("   - POST /api/validate-deliveries")
+    print("   - POST /api/reconcile")
     print("   - GET /api/health")
+    print("   - GET /api/metrics")
+    print("   - GET /api/results/<id>")
+    print("   - GET /api/jobs/<id>")
+    print("   - GET /api/exports/<id>")
     print("\n✨ Ready to scan documents and create Urbantz tasks!")
     
+    create_services()
+    if EXPORT_QUEUE:
+        ExportWorker(EXPORT_QUEUE, URBANTZ_CLIENT).start()
+    if RECONCILER:
+        RECONCILER.start()
+    if UPLOAD_COMPACTOR:
+        UPLOAD_COMPACTOR.start()
+    
     # Try different ports if current one is busy
     current_port = PORT
     max_attempts = 5
     
     for attempt in range(max_attempts):
         try:
-            with socketserver.TCPServer(("", current_port), FastAPIHandler) as httpd:
+            with ThreadedHTTPServer(("", current_port), FastAPIHandler) as httpd:
                 print(f"✅ Server started successfully on port {current_port}")
                 httpd.serve_forever()
         except OSError as e:
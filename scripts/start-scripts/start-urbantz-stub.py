@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Urbantz API (POST /v2/announce, GET /v2/task/<id>)
+
+Simulates latency, server errors, rate limiting with 429 + Retry-After and
+duplicate announces, and can record every request it receives, so export
+throughput, retries and idempotency can be benchmarked without the real API.
+Task lookups carry ETag and Last-Modified and answer 304 to conditional requests.
+
+Point the servers at it with:
+    URBANTZ_BASE_URL=http://localhost:8788 URBANTZ_API_KEY=stub python start-server-fast.py
+"""
+
+import argparse
+import email.utils
+import http.server
+import json
+import math
+import random
+import socketserver
+import threading
+import time
+import uuid
+
+from latency_model import LatencyModel
+
+PORT = 8788
+
+# Named presets for --profile; explicit flags override them
+PROFILES = {
+    "instant": {"latency": "fixed:0", "error_rate": 0.0, "rate_limit_rate": 0.0, "lost_response_rate": 0.0},
+    "fast": {"latency": "uniform:20:80", "error_rate": 0.0, "rate_limit_rate": 0.0, "lost_response_rate": 0.0},
+    "realistic": {"latency": "lognormal:250:0.5", "error_rate": 0.01, "rate_limit_rate": 0.02, "lost_response_rate": 0.005},
+    "flaky": {"latency": "lognormal:600:0.9", "error_rate": 0.08, "rate_limit_rate": 0.1, "lost_response_rate": 0.03},
+}
+
+# Lifecycle a task walks through with --status-change-rate
+TASK_STATUSES = ('ANNOUNCED', 'ASSIGNED', 'ONGOING', 'COMPLETED')
+
+
+class TokenBucket:
+    """Requests-per-second limit; take() returns 0 or the seconds until a token is free"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+
+class StubConfig:
+    """Behaviour and state of the stub, shared by all request threads"""
+
+    def __init__(self, args):
+        self.rng = random.Random(args.seed)
+        self.rng_lock = threading.Lock()
+        self.latency = LatencyModel(args.latency, self.rng)
+        self.error_rate = args.error_rate
+        self.rate_limit_rate = args.rate_limit_rate
+        self.lost_response_rate = args.lost_response_rate
+        self.retry_after = args.retry_after
+        self.max_in_flight = args.max_in_flight
+        self.bucket = TokenBucket(args.max_rps, max(args.max_rps, 1)) if args.max_rps else None
+        self.allow_duplicates = args.allow_duplicates
+        self.status_change_rate = args.status_change_rate
+        self.record_path = args.record
+
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.tasks = {}
+        self.by_key = {}
+        self.by_ref = {}
+        self.versions = {}
+        self.modified = {}
+        self.stats = {"requests": 0, "announced": 0, "replayed": 0, "conflicts": 0, "duplicates": 0,
+                      "invalid": 0, "rateLimited": 0, "errors": 0, "lostResponses": 0, "maxInFlight": 0,
+                      "lookups": 0, "notModified": 0, "statusChanges": 0}
+
+    def roll(self):
+        """Draw the injected outcome and latency of one request"""
+        with self.rng_lock:
+            latency = self.latency.sample()
+            r = self.rng.random()
+        if r < self.rate_limit_rate:
+            return 'rate_limited', latency
+        if r < self.rate_limit_rate + self.error_rate:
+            return 'error', latency
+        if r < self.rate_limit_rate + self.error_rate + self.lost_response_rate:
+            return 'lost_response', latency
+        return 'ok', latency
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def enter(self):
+        """Track a request in flight; False when --max-in-flight is exceeded"""
+        with self.lock:
+            self.in_flight += 1
+            self.stats["maxInFlight"] = max(self.stats["maxInFlight"], self.in_flight)
+            return not self.max_in_flight or self.in_flight <= self.max_in_flight
+
+    def leave(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def announce(self, payload, idempotency_key):
+        """Store a task; returns (status, body, replayed)"""
+        ref = (payload.get('customerRef'), payload.get('serviceDate'))
+        with self.lock:
+            if idempotency_key and idempotency_key in self.by_key:
+                self.stats["replayed"] += 1
+                return 200, self.tasks[self.by_key[idempotency_key]], True
+
+            if ref in self.by_ref:
+                self.stats["duplicates"] += 1
+                if not self.allow_duplicates:
+                    self.stats["conflicts"] += 1
+                    return 409, {"error": "Task with this customerRef already announced",
+                                 "taskId": self.by_ref[ref]}, False
+
+            task_id = f"STUB-{uuid.uuid4().hex[:12]}"
+            now = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+            task = {
+                "taskId": task_id,
+                "id": task_id,
+                "status": "ANNOUNCED",
+                "customerRef": payload.get('customerRef'),
+                "serviceDate": payload.get('serviceDate'),
+                "deliveryAddress": payload.get('deliveryAddress'),
+                "timeWindowStart": payload.get('timeWindowStart'),
+                "timeWindowEnd": payload.get('timeWindowEnd'),
+                "createdAt": now,
+                "updatedAt": now
+            }
+            self.tasks[task_id] = task
+            self.versions[task_id] = 1
+            self.modified[task_id] = time.time()
+            self.by_ref.setdefault(ref, task_id)
+            if idempotency_key:
+                self.by_key[idempotency_key] = task_id
+            self.stats["announced"] += 1
+            return 200, task, False
+
+    def lookup(self, task_id):
+        """Current (task, version, modified time), sometimes advanced to its next status first"""
+        with self.rng_lock:
+            advance = self.status_change_rate and self.rng.random() < self.status_change_rate
+        with self.lock:
+            self.stats["lookups"] += 1
+            task = self.tasks.get(task_id)
+            if task is None:
+                return None, None, None
+            if advance and task['status'] != TASK_STATUSES[-1]:
+                next_status = TASK_STATUSES[TASK_STATUSES.index(task['status']) + 1]
+                task = dict(task, status=next_status, updatedAt=time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()))
+                self.tasks[task_id] = task
+                self.versions[task_id] += 1
+                self.modified[task_id] = time.time()
+                self.stats["statusChanges"] += 1
+            return task, self.versions[task_id], self.modified[task_id]
+
+    def record(self, entry):
+        if not self.record_path:
+            return
+        line = json.dumps(entry, ensure_ascii=False, separators=(',', ':'))
+        with self.lock:
+            with open(self.record_path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+
+class UrbantzStubHandler(http.server.BaseHTTPRequestHandler):
+    # Keep-alive like the real API, so connection reuse in urbantz_client is exercised
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out as separate writes; without TCP_NODELAY every keep-alive
+    # response waits ~40 ms on the client's delayed ACK
+    disable_nagle_algorithm = True
+    config = None
+
+    def log_message(self, format, *args):
+        """Keep load tests quiet"""
+        pass
+
+    def do_GET(self):
+        """Task status lookup and request counters"""
+        if self.path == '/stats':
+            with self.config.lock:
+                stats = dict(self.config.stats, tasks=len(self.config.tasks), inFlight=self.config.in_flight)
+            self.send_json(200, stats)
+        elif self.path.startswith('/v2/task/'):
+            if not self.headers.get('x-api-key'):
+                self.send_json(401, {"error": "x-api-key header is required"})
+                return
+            task_id = self.path[len('/v2/task/'):]
+            task, version, modified = self.config.lookup(task_id)
+            if task is None:
+                self.send_json(404, {"error": "Task not found"})
+                return
+            headers = {'ETag': f'"{task_id}-{version}"', 'Last-Modified': email.utils.formatdate(modified, usegmt=True)}
+            if self.not_modified(headers['ETag'], modified):
+                self.config.count('notModified')
+                self.send_response(304)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+            else:
+                self.send_json(200, task, headers)
+        else:
+            self.send_json(404, {"error": "Not found"})
+
+    def not_modified(self, etag, modified):
+        """Whether If-None-Match or If-Modified-Since show the client's copy is current"""
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match:
+            return etag in [tag.strip() for tag in if_none_match.split(',')]
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since:
+            try:
+                return int(modified) <= email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def do_POST(self):
+        """Handle POST /v2/announce"""
+        content_length = int(self.headers.get('Content-Length', 0))
+        raw = self.rfile.read(content_length)
+        if self.path != '/v2/announce':
+            self.send_json(404, {"error": "Not found"})
+            return
+
+        started = time.monotonic()
+        self.config.count('requests')
+        admitted = self.config.enter()
+        try:
+            status, body, headers = self.announce(raw, admitted)
+        finally:
+            self.config.leave()
+
+        self.send_json(status, body, headers)
+        self.config.record({
+            "receivedAt": round(time.time(), 3),
+            "idempotencyKey": self.headers.get('Idempotency-Key'),
+            "status": status,
+            "latencyMs": int((time.monotonic() - started) * 1000),
+            "body": raw.decode('utf-8', 'replace')
+        })
+
+    def announce(self, raw, admitted):
+        """Decide the response to one announce; returns (status, body, headers)"""
+        config = self.config
+        if not self.headers.get('x-api-key'):
+            return 401, {"error": "x-api-key header is required"}, None
+
+        wait = config.retry_after if not admitted else (config.bucket.take() if config.bucket else 0)
+        if wait:
+            config.count('rateLimited')
+            # Decimal seconds so sub-second waits survive (rounded up, never to 0); urbantz_client accepts them
+            return 429, {"error": "Too many requests"}, {'Retry-After': f"{math.ceil(wait * 100) / 100:.2f}"}
+
+        outcome, latency = config.roll()
+        time.sleep(latency)
+
+        if outcome == 'rate_limited':
+            config.count('rateLimited')
+            return 429, {"error": "Too many requests"}, {'Retry-After': f"{config.retry_after:.2f}"}
+        if outcome == 'error':
+            config.count('errors')
+            return 503, {"error": "Service temporarily unavailable"}, None
+
+        try:
+            payload = json.loads(raw.decode('utf-8') or '{}')
+        except ValueError:
+            payload = None
+        if not isinstance(payload, dict) or not payload.get('customerRef') \
+                or not (payload.get('deliveryAddress') or {}).get('line1'):
+            config.count('invalid')
+            return 400, {"error": "customerRef and deliveryAddress.line1 are required"}, None
+
+        status, body, replayed = config.announce(payload, self.headers.get('Idempotency-Key'))
+        if outcome == 'lost_response' and status == 200 and not replayed:
+            # The task exists but the client never hears about it; only an idempotent retry is safe
+            config.count('lostResponses')
+            return 503, {"error": "Service temporarily unavailable"}, None
+        return status, body, {'Idempotent-Replayed': 'true'} if replayed else None
+
+    def send_json(self, status, data, headers=None):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class ThreadedHTTPServer(socketserver.ThreadingTCPServer):
+    """One thread per connection so simulated latency overlaps like the real API"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Local stub of the Urbantz announce API")
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='fast',
+                        help="preset for latency and failure rates")
+    parser.add_argument('--latency', help="fixed:<ms> | uniform:<min>:<max> | normal:<mean>:<sd> | lognormal:<median>:<sigma>")
+    parser.add_argument('--error-rate', type=float, help="fraction of announces answered with 503")
+    parser.add_argument('--rate-limit-rate', type=float, help="fraction of announces answered with 429")
+    parser.add_argument('--lost-response-rate', type=float,
+                        help="fraction of announces that create the task but answer 503")
+    parser.add_argument('--retry-after', type=float, default=1, help="Retry-After seconds sent with random 429s")
+    parser.add_argument('--max-rps', type=float, default=0, help="token bucket limit in requests per second (0 = off)")
+    parser.add_argument('--max-in-flight', type=int, default=0, help="concurrent announces before 429 (0 = off)")
+    parser.add_argument('--allow-duplicates', action='store_true',
+                        help="accept a second announce of the same customerRef + serviceDate instead of 409")
+    parser.add_argument('--status-change-rate', type=float, default=0,
+                        help="chance that a task lookup first moves the task to its next status")
+    parser.add_argument('--record', help="append every received announce to this JSONL file")
+    parser.add_argument('--seed', type=int, default=None, help="random seed for reproducible runs")
+    args = parser.parse_args(argv)
+
+    for key, value in PROFILES[args.profile].items():
+        if getattr(args, key) is None:
+            setattr(args, key, value)
+    return args
+
+
+def start_server(argv=None):
+    args = parse_args(argv)
+    UrbantzStubHandler.config = StubConfig(args)
+
+    print("🧪 Starting Urbantz API stub...")
+    print(f"📱 Listening on http://localhost:{args.port}/v2/announce")
+    print(f"⚙️ Profile: {args.profile} | latency {args.latency} | errors {args.error_rate:.0%} | "
+          f"429s {args.rate_limit_rate:.0%} | lost responses {args.lost_response_rate:.0%}")
+    if args.max_rps or args.max_in_flight:
+        print(f"🚦 Rate limit: {args.max_rps or '∞'} req/s, {args.max_in_flight or '∞'} in flight")
+    if args.record:
+        print(f"📼 Recording announces to {args.record}")
+
+    with ThreadedHTTPServer(("", args.port), UrbantzStubHandler) as httpd:
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            print("\n👋 Stub stopped by user")
+
+
+if __name__ == "__main__":
+    start_server()
@@ -0,0 +1,87 @@
+"""
+Reconciles exported deliveries with their Urbantz task status using conditional requests
+"""
+
+import os
+import threading
+import time
+
+from urbantz_client import UrbantzError
+
+# Seconds between reconciliation passes; 0 disables the background job
+RECONCILE_INTERVAL_SECONDS = int(os.environ.get('URBANTZ_RECONCILE_INTERVAL', '300'))
+RECONCILE_BATCH_SIZE = int(os.environ.get('URBANTZ_RECONCILE_BATCH_SIZE', '200'))
+# Tasks in one of these states no longer change and are not polled again
+FINAL_TASK_STATUSES = frozenset(
+    s.strip().upper() for s in
+    os.environ.get('URBANTZ_FINAL_TASK_STATUSES', 'COMPLETED,DELIVERED,CANCELLED,CANCELED,FAILED,MISSING').split(',')
+    if s.strip())
+
+
+def task_status_of(task):
+    """Pick the status out of a task response"""
+    for key in ('status', 'progress', 'state'):
+        if isinstance(task, dict) and task.get(key):
+            return str(task[key]).upper()
+    return 'UNKNOWN'
+
+
+def check_task(client, row):
+    """Look up one exported task; returns (outcome, update or None)"""
+    try:
+        task, etag, last_modified = client.fetch_task(row['task_id'], row['etag'], row['last_modified'])
+    except UrbantzError as e:
+        if e.status == 404:
+            return 'missing', (row['key'], 'MISSING', None, None)
+        return 'failed', None
+    except Exception:
+        return 'failed', None
+
+    if task is None:
+        return 'unchanged', None
+    status = task_status_of(task)
+    # Servers without ETag support answer 200 every time; compare before writing
+    if (status, etag, last_modified) == (row['remote_status'], row['etag'], row['last_modified']):
+        return 'unchanged', None
+    return 'changed', (row['key'], status, etag, last_modified)
+
+
+def reconcile(client, store, batch_size=RECONCILE_BATCH_SIZE):
+    """One pass over all active exported tasks; only changed tasks are written back"""
+    started = time.monotonic()
+    stats = {"checked": 0, "changed": 0, "unchanged": 0, "missing": 0, "failed": 0}
+    for batch in store.iter_active_tasks(batch_size, FINAL_TASK_STATUSES):
+        updates = []
+        for _, (outcome, update) in client.iter_concurrent(lambda row: check_task(client, row), batch):
+            stats["checked"] += 1
+            stats[outcome] += 1
+            if update:
+                updates.append(update)
+        store.update_tasks(updates)
+    stats["seconds"] = round(time.monotonic() - started, 3)
+    stats["finishedAt"] = time.time()
+    return stats
+
+
+class Reconciler(threading.Thread):
+    """Runs reconcile() every interval in the background"""
+
+    def __init__(self, client, store, interval=RECONCILE_INTERVAL_SECONDS):
+        super().__init__(name='urbantz-reconcile', daemon=True)
+        self.client = client
+        self.store = store
+        self.interval = interval
+        self.last_run = None
+        self.wakeup = threading.Event()
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            try:
+                self.last_run = reconcile(self.client, self.store)
+                if self.last_run["changed"] or self.last_run["missing"]:
+                    print(f"🔄 Reconciled {self.last_run['checked']} tasks: {self.last_run['changed']} changed, "
+                          f"{self.last_run['missing']} missing ({self.last_run['seconds']}s)")
+            except Exception as e:
+                print(f"❌ Reconciliation error: {e}")
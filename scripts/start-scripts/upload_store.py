@@ -0,0 +1,444 @@
+"""
+Content-addressed store for uploaded documents and the artifacts derived from them
+
+Every blob is stored once under its SHA-256, however often or under whatever name
+it is uploaded. Derived artifacts (extracted text, page renders, analysis
+results) are attached to the blob's hash, so a re-upload of the same file can be
+answered without parsing or analyzing it again.
+
+Layout:
+    <root>/blobs/ab/abcdef...        the uploaded bytes
+    <root>/derived/abcdef.../<name>  artifacts derived from that blob
+    <root>/index.sqlite3             sizes, names and access times
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+UPLOAD_STORE_DIR = os.environ.get('UPLOAD_STORE_DIR', 'upload-store')
+# Disk budget for blobs plus derived artifacts; least recently used uploads are evicted beyond it
+UPLOAD_STORE_MAX_BYTES = int(os.environ.get('UPLOAD_STORE_MAX_BYTES', str(2 * 1024 ** 3)))
+# Uploads unused for this long are evicted even within budget; 0 keeps them until the budget needs room
+UPLOAD_RETENTION_SECONDS = int(float(os.environ.get('UPLOAD_RETENTION_DAYS', '30')) * 86400)
+# Seconds between compaction passes; 0 disables the background compactor
+UPLOAD_COMPACT_INTERVAL_SECONDS = int(os.environ.get('UPLOAD_COMPACT_INTERVAL', '600'))
+# Pins of a process that stopped without unpinning stop protecting their uploads after this long
+UPLOAD_PIN_LEASE_SECONDS = int(os.environ.get('UPLOAD_PIN_LEASE_SECONDS', '3600'))
+# Temporary files of uploads that never completed
+STALE_TMP_SECONDS = 3600
+
+COPY_CHUNK_BYTES = 1024 * 1024
+_SHA256 = re.compile(r'^[0-9a-f]{64}$')
+_ARTIFACT_NAME = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._-]*$')
+# Page renders written next to an upload by the Node server: <upload>_page_<n>.png
+_PAGE_RENDER = re.compile(r'^(?P<upload>.+)_page_(?P<page>\d+)\.png$')
+
+
+class BlobWriter:
+    """Receives a blob in chunks, hashing while it is written to a temporary file"""
+
+    def __init__(self, store, content_type=None, name=None):
+        self.store = store
+        self.content_type = content_type
+        self.name = name
+        self.size = 0
+        self._hash = hashlib.sha256()
+        fd, self._tmp_path = tempfile.mkstemp(dir=store.tmp_dir, prefix='upload-')
+        self._file = os.fdopen(fd, 'wb')
+
+    def write(self, data):
+        self._hash.update(data)
+        self._file.write(data)
+        self.size += len(data)
+
+    def commit(self):
+        """Move the blob into place; returns (sha256, created)"""
+        self._file.close()
+        sha = self._hash.hexdigest()
+        created = self.store._add_blob(sha, self._tmp_path, self.size, self.content_type, self.name)
+        return sha, created
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.unlink(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+
+
+class UploadStore:
+    """One copy per unique upload, plus derived artifacts keyed by the upload's hash"""
+
+    def __init__(self, root=UPLOAD_STORE_DIR, pin_lease_seconds=UPLOAD_PIN_LEASE_SECONDS):
+        self.root = root
+        self.pin_lease_seconds = pin_lease_seconds
+        self.blob_dir = os.path.join(root, 'blobs')
+        self.derived_dir = os.path.join(root, 'derived')
+        self.tmp_dir = os.path.join(root, 'tmp')
+        for path in (self.blob_dir, self.derived_dir, self.tmp_dir):
+            os.makedirs(path, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # Hashes in use by this process (analyses, queued prefetches) with their pin counts
+        self._pins = {}
+        # Identifies this process's rows in the pins table, which every process sharing the store reads
+        self.owner = uuid.uuid4().hex
+        self._conn = sqlite3.connect(os.path.join(root, 'index.sqlite3'), check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS blobs (
+                sha256 TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                content_type TEXT,
+                name TEXT,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        ''')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS artifacts (
+                sha256 TEXT NOT NULL,
+                name TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (sha256, name)
+            )
+        ''')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS pins (
+                sha256 TEXT NOT NULL,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (sha256, owner)
+            )
+        ''')
+
+    # Blobs
+
+    def blob_path(self, sha):
+        if not _SHA256.match(sha or ''):
+            raise ValueError(f"Not a SHA-256 hash: {sha!r}")
+        return os.path.join(self.blob_dir, sha[:2], sha)
+
+    def writer(self, content_type=None, name=None):
+        """A BlobWriter for streaming a blob into the store"""
+        return BlobWriter(self, content_type, name)
+
+    def put(self, fileobj, content_type=None, name=None):
+        """Store the contents of a binary file; returns (sha256, created)"""
+        with self.writer(content_type, name) as writer:
+            while True:
+                chunk = fileobj.read(COPY_CHUNK_BYTES)
+                if not chunk:
+                    break
+                writer.write(chunk)
+            return writer.commit()
+
+    def put_bytes(self, data, content_type=None, name=None):
+        with self.writer(content_type, name) as writer:
+            writer.write(data)
+            return writer.commit()
+
+    def _add_blob(self, sha, tmp_path, size, content_type, name):
+        path = self.blob_path(sha)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute('SELECT sha256 FROM blobs WHERE sha256 = ?', (sha,)).fetchone()
+            if row and os.path.exists(path):
+                os.unlink(tmp_path)
+                self._conn.execute('UPDATE blobs SET last_used = ? WHERE sha256 = ?', (now, sha))
+                return False
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+            self._conn.execute(
+                'INSERT OR REPLACE INTO blobs (sha256, size, content_type, name, created_at, last_used) '
+                'VALUES (?, ?, ?, ?, ?, ?)', (sha, size, content_type, name, now, now))
+            return True
+
+    def exists(self, sha):
+        return os.path.exists(self.blob_path(sha))
+
+    def info(self, sha):
+        """Index row of a blob, or None"""
+        row = self._conn.execute('SELECT * FROM blobs WHERE sha256 = ?', (sha,)).fetchone()
+        return dict(row) if row else None
+
+    def open(self, sha):
+        """Open a stored blob for reading and mark it as used"""
+        f = open(self.blob_path(sha), 'rb')
+        self.touch(sha)
+        return f
+
+    def touch(self, sha):
+        with self._lock:
+            self._conn.execute('UPDATE blobs SET last_used = ? WHERE sha256 = ?', (time.time(), sha))
+
+    # Derived artifacts
+
+    def artifact_path(self, sha, name):
+        if not _ARTIFACT_NAME.match(name):
+            raise ValueError(f"Invalid artifact name: {name!r}")
+        return os.path.join(self.derived_dir, self.blob_path(sha).rsplit(os.sep, 1)[-1], name)
+
+    def put_artifact(self, sha, name, data):
+        """Attach an artifact (bytes or str) to a blob; replaces an older one of the same name"""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        path = self.artifact_path(sha, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir, prefix='artifact-')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO artifacts (sha256, name, size, created_at) VALUES (?, ?, ?, ?)',
+                               (sha, name, len(data), time.time()))
+
+    def get_artifact(self, sha, name):
+        """Bytes of an artifact, or None when it was never derived"""
+        try:
+            with open(self.artifact_path(sha, name), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        self.touch(sha)
+        return data
+
+    def put_json(self, sha, name, value):
+        self.put_artifact(sha, name, json.dumps(value, ensure_ascii=False))
+
+    def get_json(self, sha, name):
+        data = self.get_artifact(sha, name)
+        return json.loads(data) if data is not None else None
+
+    def artifacts(self, sha):
+        """Names of the artifacts attached to a blob"""
+        return [row['name'] for row in
+                self._conn.execute('SELECT name FROM artifacts WHERE sha256 = ? ORDER BY name', (sha,))]
+
+    def stats(self):
+        blobs = self._conn.execute('SELECT COUNT(*) AS n, COALESCE(SUM(size), 0) AS bytes FROM blobs').fetchone()
+        artifacts = self._conn.execute('SELECT COUNT(*) AS n, COALESCE(SUM(size), 0) AS bytes FROM artifacts').fetchone()
+        return {"blobs": blobs['n'], "blobBytes": blobs['bytes'],
+                "artifacts": artifacts['n'], "artifactBytes": artifacts['bytes']}
+
+    # Eviction
+
+    def usage(self):
+        """Bytes of blobs plus artifacts according to the index"""
+        stats = self.stats()
+        return stats["blobBytes"] + stats["artifactBytes"]
+
+    def evict(self, sha):
+        """Remove a blob and everything derived from it; returns the bytes reclaimed"""
+        with self._lock:
+            return self._evict(sha)
+
+    def evict_unpinned(self, sha):
+        """Evict a blob unless a process holds a pin on it; returns the bytes reclaimed, or None when pinned"""
+        with self._lock:
+            # The write lock keeps other processes from pinning between the check and the delete
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                if self._conn.execute('SELECT 1 FROM pins WHERE sha256 = ? AND expires_at > ?',
+                                      (sha, time.time())).fetchone():
+                    return None
+                return self._evict(sha)
+            finally:
+                self._conn.execute('COMMIT')
+
+    def _evict(self, sha):
+        """Delete a blob's rows and files (caller holds the lock)"""
+        row = self._conn.execute(
+            'SELECT COALESCE((SELECT size FROM blobs WHERE sha256 = ?), 0) + '
+            'COALESCE((SELECT SUM(size) FROM artifacts WHERE sha256 = ?), 0) AS bytes', (sha, sha)).fetchone()
+        self._conn.execute('DELETE FROM blobs WHERE sha256 = ?', (sha,))
+        self._conn.execute('DELETE FROM artifacts WHERE sha256 = ?', (sha,))
+        try:
+            os.unlink(self.blob_path(sha))
+        except FileNotFoundError:
+            pass
+        shutil.rmtree(os.path.join(self.derived_dir, sha), ignore_errors=True)
+        return row['bytes']
+
+    # Pins
+
+    def pin(self, sha):
+        """Keep an upload from being evicted until the matching unpin(); pins nest
+
+        Pins are leased in the index, so they also hold off the compactor of another process.
+        """
+        with self._lock:
+            self._pins[sha] = self._pins.get(sha, 0) + 1
+            self._conn.execute('INSERT OR REPLACE INTO pins (sha256, owner, expires_at) VALUES (?, ?, ?)',
+                               (sha, self.owner, time.time() + self.pin_lease_seconds))
+
+    def unpin(self, sha):
+        with self._lock:
+            if self._pins.get(sha, 0) > 1:
+                self._pins[sha] -= 1
+            else:
+                self._pins.pop(sha, None)
+                self._conn.execute('DELETE FROM pins WHERE sha256 = ? AND owner = ?', (sha, self.owner))
+
+    @contextlib.contextmanager
+    def hold(self, sha):
+        """Pin an upload for the duration of a with block"""
+        self.pin(sha)
+        try:
+            yield
+        finally:
+            self.unpin(sha)
+
+    def compact(self, max_bytes=UPLOAD_STORE_MAX_BYTES, retention_seconds=UPLOAD_RETENTION_SECONDS, pinned=()):
+        """Evict expired uploads, then least recently used ones until usage fits max_bytes
+
+        Uploads whose hash is in `pinned` or held with pin() by any process sharing the store are
+        never evicted.
+        """
+        started = time.monotonic()
+        now = time.time()
+        pinned = set(pinned)
+        usage = self.usage()
+        stats = {"evicted": 0, "expired": 0, "reclaimedBytes": 0, "pinned": 0, "tmpFilesRemoved": 0}
+
+        # Artifacts of uploads that are gone sort first; they can never be used again
+        candidates = self._conn.execute(
+            'SELECT sha256, -1 AS last_used FROM artifacts WHERE sha256 NOT IN (SELECT sha256 FROM blobs) '
+            'UNION SELECT sha256, last_used FROM blobs ORDER BY last_used').fetchall()
+        for row in candidates:
+            sha, last_used = row['sha256'], row['last_used']
+            expired = last_used < 0 or bool(retention_seconds and now - last_used > retention_seconds)
+            if not expired and usage <= max_bytes:
+                break
+            reclaimed = None if sha in pinned else self.evict_unpinned(sha)
+            if reclaimed is None:
+                stats["pinned"] += 1
+                continue
+            usage -= reclaimed
+            stats["reclaimedBytes"] += reclaimed
+            stats["evicted"] += 1
+            stats["expired"] += 1 if expired else 0
+
+        for name in os.listdir(self.tmp_dir):
+            path = os.path.join(self.tmp_dir, name)
+            try:
+                if now - os.path.getmtime(path) > STALE_TMP_SECONDS:
+                    size = os.path.getsize(path)
+                    os.unlink(path)
+                    stats["reclaimedBytes"] += size
+                    stats["tmpFilesRemoved"] += 1
+            except FileNotFoundError:
+                pass
+
+        with self._lock:
+            self._conn.execute('DELETE FROM pins WHERE expires_at <= ?', (now,))
+        stats["usageBytes"] = usage
+        stats["maxBytes"] = max_bytes
+        stats["seconds"] = round(time.monotonic() - started, 3)
+        stats["finishedAt"] = now
+        return stats
+
+    # Migration
+
+    def import_directory(self, directory):
+        """Import an uploads/ directory written by the Node server; page renders become artifacts"""
+        result = {"files": 0, "bytes": 0, "stored": 0, "duplicates": 0, "duplicateBytes": 0, "pageRenders": 0}
+        names = sorted(os.listdir(directory))
+        hashes = {}
+        for name in names:
+            path = os.path.join(directory, name)
+            if not os.path.isfile(path) or _PAGE_RENDER.match(name):
+                continue
+            with open(path, 'rb') as f:
+                sha, created = self.put(f, name=name)
+            hashes[name] = sha
+            self._count_import(result, os.path.getsize(path), created)
+
+        for name in names:
+            match = _PAGE_RENDER.match(name)
+            if not match:
+                continue
+            path = os.path.join(directory, name)
+            if match.group('upload') not in hashes:
+                # Render of an upload that was already removed; keep it as a blob of its own
+                with open(path, 'rb') as f:
+                    _, created = self.put(f, content_type='image/png', name=name)
+                self._count_import(result, os.path.getsize(path), created)
+                continue
+            sha = hashes[match.group('upload')]
+            artifact = f"page-{match.group('page')}.png"
+            size = os.path.getsize(path)
+            result["files"] += 1
+            result["bytes"] += size
+            if artifact in self.artifacts(sha):
+                result["duplicates"] += 1
+                result["duplicateBytes"] += size
+                continue
+            with open(path, 'rb') as f:
+                self.put_artifact(sha, artifact, f.read())
+            result["pageRenders"] += 1
+        return result
+
+    @staticmethod
+    def _count_import(result, size, created):
+        result["files"] += 1
+        result["bytes"] += size
+        if created:
+            result["stored"] += 1
+        else:
+            result["duplicates"] += 1
+            result["duplicateBytes"] += size
+
+
+class UploadCompactor(threading.Thread):
+    """Runs compact() every interval in the background; pinned() returns hashes to keep"""
+
+    def __init__(self, store, pinned=lambda: (), interval=UPLOAD_COMPACT_INTERVAL_SECONDS):
+        super().__init__(name='upload-compactor', daemon=True)
+        self.store = store
+        self.pinned = pinned
+        self.interval = interval
+        self.last_run = None
+        self.wakeup = threading.Event()
+
+    def run(self):
+        while True:
+            try:
+                self.last_run = self.store.compact(pinned=self.pinned())
+                if self.last_run["reclaimedBytes"]:
+                    print(f"🧹 Upload store: evicted {self.last_run['evicted']} uploads, "
+                          f"reclaimed {self.last_run['reclaimedBytes']} bytes, "
+                          f"{self.last_run['usageBytes']} of {self.last_run['maxBytes']} bytes in use")
+            except Exception as e:
+                print(f"❌ Upload compaction error: {e}")
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+
+
+if __name__ == "__main__":
+    # python upload_store.py <uploads-dir> [store-dir]
+    source = sys.argv[1] if len(sys.argv) > 1 else 'uploads'
+    store = UploadStore(sys.argv[2] if len(sys.argv) > 2 else UPLOAD_STORE_DIR)
+    result = store.import_directory(source)
+    print(f"📦 Imported {result['files']} files ({result['bytes']} bytes) from {source}: "
+          f"{result['stored']} unique uploads, {result['pageRenders']} page renders, "
+          f"{result['duplicates']} duplicates ({result['duplicateBytes']} bytes saved)")
+    print(f"   Store: {json.dumps(store.stats())}")
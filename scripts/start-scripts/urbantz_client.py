@@ -0,0 +1,434 @@
+"""
+Urbantz API client with pooled keep-alive connections and concurrent exports
+"""
+
+import collections
+import email.utils
+import http.client
+import json
+import os
+import queue
+import random
+import threading
+import time
+import urllib.parse
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from delivery_validator import ANNOUNCE_VALIDATOR
+from export_store import idempotency_key
+
+URBANTZ_BASE_URL = os.environ.get('URBANTZ_BASE_URL', 'https://api.urbantz.com').rstrip('/')
+URBANTZ_API_KEY = os.environ.get('URBANTZ_API_KEY')
+# Task status lookup used for reconciliation; {taskId} is replaced by the exported task id
+URBANTZ_TASK_PATH = os.environ.get('URBANTZ_TASK_PATH', '/v2/task/{taskId}')
+
+# Starting number of announce calls in flight during a bulk export
+URBANTZ_EXPORT_CONCURRENCY = int(os.environ.get('URBANTZ_EXPORT_CONCURRENCY', '16'))
+URBANTZ_TIMEOUT = float(os.environ.get('URBANTZ_TIMEOUT', '30'))
+
+# Adaptive (AIMD) limit: grows by one per window of successes, halves on 429/5xx or latency spikes
+URBANTZ_EXPORT_ADAPTIVE = os.environ.get('URBANTZ_EXPORT_ADAPTIVE', '1') != '0'
+URBANTZ_EXPORT_MIN_CONCURRENCY = int(os.environ.get('URBANTZ_EXPORT_MIN_CONCURRENCY', '1'))
+URBANTZ_EXPORT_MAX_CONCURRENCY = int(os.environ.get('URBANTZ_EXPORT_MAX_CONCURRENCY', '64'))
+URBANTZ_EXPORT_MAX_RETRIES = int(os.environ.get('URBANTZ_EXPORT_MAX_RETRIES', '3'))
+# Calls held up by a Retry-After pause resume within this fraction of the pause after it ends;
+# backoff waits between retries are stretched by up to the same fraction
+URBANTZ_RETRY_JITTER = float(os.environ.get('URBANTZ_RETRY_JITTER', '0.25'))
+# Without Retry-After a failed call waits base * 2^attempt seconds (plus jitter, at most max) before its retry
+URBANTZ_RETRY_BASE_SECONDS = float(os.environ.get('URBANTZ_RETRY_BASE_SECONDS', '0.5'))
+URBANTZ_RETRY_MAX_SECONDS = float(os.environ.get('URBANTZ_RETRY_MAX_SECONDS', '30'))
+
+# Errors that mean a pooled keep-alive connection was closed by the server
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine,
+                           ConnectionResetError, BrokenPipeError)
+
+
+def is_configured():
+    """True when a real Urbantz API key is available"""
+    return bool(URBANTZ_API_KEY) and URBANTZ_API_KEY != 'your_actual_api_key_here'
+
+
+class UrbantzError(Exception):
+    """Non-2xx answer from the Urbantz API (header names are lower-cased)"""
+
+    def __init__(self, status, body, headers=None):
+        super().__init__(f"Urbantz {status}: {body[:500]}")
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+
+
+class AdaptiveLimiter:
+    """AIMD limit on in-flight requests, driven by observed latency and throttling
+
+    Every success adds 1/limit, so the limit grows by one per window of
+    successful calls. A 429, a 5xx or a latency far above the best observed
+    latency halves it, at most once per round-trip. Retry-After pauses all
+    new calls until the server is ready again; after the pause the limit starts
+    again from min_limit and doubles per round-trip up to the halved limit, and
+    the waiting calls resume at jittered moments instead of all at once.
+    """
+
+    def __init__(self, initial, min_limit=1, max_limit=64, decrease_factor=0.5, latency_tolerance=3.0,
+                 jitter=URBANTZ_RETRY_JITTER):
+        self.min_limit = min_limit
+        self.max_limit = max(max_limit, min_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.jitter = jitter
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.pause_seconds = 0.0
+        # Limit to ramp back up to after a pause
+        self.ramp_target = 0.0
+        self.latency_ewma = None
+        self.best_latency = None
+        self.last_decrease = 0.0
+        self.counters = {"completed": 0, "throttled": 0, "failed": 0, "decreases": 0}
+        self._completions = collections.deque()
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Block until a slot is free and no Retry-After pause is active"""
+        resume_at = 0.0
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if resume_at < self.paused_until:
+                    resume_at = self.paused_until + random.uniform(0, self.pause_seconds * self.jitter)
+                wait = resume_at - now
+                if wait <= 0 and self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                self._cond.wait(wait if wait > 0 else None)
+
+    def release(self, latency, outcome, retry_after=None):
+        """Record the outcome of a call: 'success', 'throttled' or 'failed'"""
+        now = time.monotonic()
+        with self._cond:
+            self.in_flight -= 1
+
+            if outcome == 'success':
+                self.counters["completed"] += 1
+                self._completions.append(now)
+                self._observe_latency(latency)
+                if self.best_latency and latency > self.best_latency * self.latency_tolerance:
+                    self._decrease(now)
+                elif self.limit < self.ramp_target:
+                    # Slow start after a pause: one slot per success doubles the limit every round-trip
+                    self.limit = min(self.ramp_target, self.limit + 1)
+                else:
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            elif outcome == 'throttled':
+                self.counters["throttled"] += 1
+                self._decrease(now)
+                if retry_after:
+                    if self.paused_until <= now:
+                        self.ramp_target = self.limit
+                    self.pause_seconds = retry_after
+                    self.paused_until = max(self.paused_until, now + retry_after)
+                    # Probe with a single call once the pause is over instead of the whole window
+                    self.limit = float(self.min_limit)
+            else:
+                self.counters["failed"] += 1
+
+            self._cond.notify_all()
+
+    def _observe_latency(self, latency):
+        self.latency_ewma = latency if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency
+        self.best_latency = self.latency_ewma if self.best_latency is None else min(self.best_latency, self.latency_ewma)
+
+    def _decrease(self, now):
+        # Many in-flight calls see the same congestion; cut only once per round-trip
+        if now - self.last_decrease < (self.latency_ewma or 0.1):
+            return
+        self.last_decrease = now
+        self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+        self.counters["decreases"] += 1
+
+    def stats(self, window=10.0):
+        """Current limit and throughput over the last `window` seconds"""
+        now = time.monotonic()
+        with self._cond:
+            while self._completions and now - self._completions[0] > window:
+                self._completions.popleft()
+            return dict(self.counters,
+                        limit=round(self.limit, 2),
+                        inFlight=self.in_flight,
+                        throughputPerSecond=round(len(self._completions) / window, 2),
+                        latencyMs=int(self.latency_ewma * 1000) if self.latency_ewma is not None else None,
+                        pausedForSeconds=round(max(0.0, self.paused_until - now), 2))
+
+
+def parse_retry_after(value):
+    """Retry-After as seconds, from either delta-seconds or an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def backoff_delay(attempt, base=URBANTZ_RETRY_BASE_SECONDS, cap=URBANTZ_RETRY_MAX_SECONDS,
+                  jitter=URBANTZ_RETRY_JITTER):
+    """Seconds to wait before retry number attempt + 1: exponential, jittered, capped"""
+    delay = base * 2 ** attempt
+    return min(cap, delay + random.uniform(0, delay * jitter))
+
+
+class ConnectionPool:
+    """Small pool of keep-alive HTTP(S) connections to a single host"""
+
+    def __init__(self, base_url, maxsize, timeout=URBANTZ_TIMEOUT):
+        parsed = urllib.parse.urlsplit(base_url)
+        self.scheme = parsed.scheme
+        self.host = parsed.hostname
+        self.port = parsed.port
+        self.base_path = parsed.path.rstrip('/')
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize)
+
+    def _new_connection(self):
+        if self.scheme == 'https':
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def request(self, method, path, body=None, headers=None):
+        """Send a request over a pooled connection and return (status, headers, body)"""
+        for attempt in range(2):
+            try:
+                conn, reused = self._idle.get_nowait(), True
+            except queue.Empty:
+                conn, reused = self._new_connection(), False
+
+            try:
+                conn.request(method, self.base_path + path, body=body, headers=headers or {})
+                response = conn.getresponse()
+                data = response.read()
+            except STALE_CONNECTION_ERRORS:
+                conn.close()
+                # A reused connection may have been closed by the server; retry once on a fresh one
+                if reused and attempt == 0:
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+
+            if response.will_close:
+                conn.close()
+            else:
+                try:
+                    self._idle.put_nowait(conn)
+                except queue.Full:
+                    conn.close()
+            return response.status, {k.lower(): v for k, v in response.getheaders()}, data
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class UrbantzClient:
+    """Announces deliveries to POST {URBANTZ_BASE_URL}/v2/announce"""
+
+    def __init__(self, base_url=None, api_key=None, concurrency=None, timeout=URBANTZ_TIMEOUT,
+                 adaptive=URBANTZ_EXPORT_ADAPTIVE, max_retries=URBANTZ_EXPORT_MAX_RETRIES, store=None,
+                 retry_base=URBANTZ_RETRY_BASE_SECONDS):
+        self.base_url = (base_url or URBANTZ_BASE_URL).rstrip('/')
+        # Optional ExportStore; when set, deliveries that were already exported are not announced again
+        self.store = store
+        self.api_key = api_key or URBANTZ_API_KEY
+        self.concurrency = concurrency or URBANTZ_EXPORT_CONCURRENCY
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        if adaptive:
+            self.limiter = AdaptiveLimiter(self.concurrency, URBANTZ_EXPORT_MIN_CONCURRENCY,
+                                           max(URBANTZ_EXPORT_MAX_CONCURRENCY, self.concurrency))
+        else:
+            self.limiter = AdaptiveLimiter(self.concurrency, self.concurrency, self.concurrency)
+        self.pool = ConnectionPool(self.base_url, self.limiter.max_limit, timeout)
+
+    def _call(self, method, path, payload=None, extra_headers=None, with_headers=False):
+        headers = {
+            'Content-Type': 'application/json',
+            'Accept': 'application/json',
+            'x-api-key': self.api_key
+        }
+        headers.update(extra_headers or {})
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8') if payload is not None else None
+        status, response_headers, data = self.pool.request(method, path, body, headers)
+        if status == 304 and with_headers:
+            return None, response_headers
+        if status < 200 or status >= 300:
+            raise UrbantzError(status, data.decode('utf-8', 'replace'), response_headers)
+        decoded = json.loads(data.decode('utf-8')) if data else {}
+        return (decoded, response_headers) if with_headers else decoded
+
+    def announce(self, delivery):
+        """Announce one delivery and return the decoded Urbantz response"""
+        return self._call('POST', '/v2/announce', announce_payload(delivery))
+
+    def export_deliveries(self, deliveries):
+        """Announce all deliveries concurrently; results keep the input order"""
+        results = {}
+        for index, result in self.iter_export(deliveries):
+            results[index] = result
+        return [results[i] for i in range(len(results))]
+
+    def iter_export(self, deliveries):
+        """Yield (index, result) pairs in completion order
+
+        deliveries may be any iterable; it is consumed lazily and only a window of
+        twice the maximum limit is held in memory. The number of calls actually in
+        flight is governed by the limiter.
+        """
+        return self.iter_concurrent(self.export_one, deliveries)
+
+    def iter_concurrent(self, fn, items):
+        """Run fn over items on the export threads and yield (index, fn(item)) as each finishes
+
+        When reading items fails, the items already submitted still finish and are
+        yielded before the error is raised, so the caller knows what was sent.
+        """
+        window = self.limiter.max_limit * 2
+        error = None
+        with ThreadPoolExecutor(max_workers=self.limiter.max_limit, thread_name_prefix='urbantz-export') as executor:
+            pending = set()
+            try:
+                for index, item in enumerate(items):
+                    pending.add(executor.submit(_indexed, fn, index, item))
+                    if len(pending) >= window:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            yield future.result()
+            except Exception as e:
+                error = e
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        if error is not None:
+            raise error
+
+    def limited_call(self, method, path, payload=None, extra_headers=None, with_headers=False):
+        """Call the API under the limiter, retrying 429/5xx and connection errors"""
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            started = time.monotonic()
+            try:
+                response = self._call(method, path, payload, extra_headers, with_headers)
+            except UrbantzError as e:
+                retryable = e.status == 429 or e.status >= 500
+                retry_after = parse_retry_after(e.headers.get('retry-after'))
+                self.limiter.release(time.monotonic() - started, 'throttled' if retryable else 'failed', retry_after)
+                if not retryable or attempt == self.max_retries:
+                    raise
+                # With Retry-After the limiter holds every call back; without it this call backs off on its own
+                if retry_after is None:
+                    time.sleep(backoff_delay(attempt, self.retry_base))
+            except (OSError, http.client.HTTPException):
+                self.limiter.release(time.monotonic() - started, 'throttled')
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(backoff_delay(attempt, self.retry_base))
+            except Exception:
+                self.limiter.release(time.monotonic() - started, 'failed')
+                raise
+            else:
+                self.limiter.release(time.monotonic() - started, 'success')
+                return response
+
+    def export_one(self, delivery):
+        """Announce one delivery and describe the outcome as an export result"""
+        customer_ref = delivery.get('customerRef', 'N/A') if isinstance(delivery, dict) else 'N/A'
+        error = validate_delivery(delivery)
+        if error:
+            return {"customerRef": customer_ref, "error": error, "status": "failed"}
+
+        key = idempotency_key(delivery)
+        if self.store:
+            existing = self.store.claim(key, delivery)
+            if existing and existing['status'] == 'exported':
+                return {"customerRef": customer_ref, "taskId": existing['task_id'], "status": "success",
+                        "idempotencyKey": key, "cached": True}
+            if existing:
+                return {"customerRef": customer_ref, "error": "export of this delivery is already in progress",
+                        "status": "failed", "idempotencyKey": key}
+
+        try:
+            response = self.limited_call('POST', '/v2/announce', announce_payload(delivery),
+                                         {'Idempotency-Key': key})
+            task_id = task_id_of(response)
+            if self.store:
+                self.store.complete(key, task_id)
+            return {"customerRef": customer_ref, "taskId": task_id, "status": "success", "idempotencyKey": key}
+        except Exception as e:
+            if self.store:
+                self.store.release(key)
+            result = {"customerRef": customer_ref, "error": str(e), "status": "failed", "idempotencyKey": key}
+            if isinstance(e, UrbantzError):
+                result["httpStatus"] = e.status
+            return result
+
+    def fetch_task(self, task_id, etag=None, last_modified=None):
+        """Conditional GET of one task
+
+        Returns (task, etag, last_modified); task is None when Urbantz answered
+        304 Not Modified, so the caller's copy is still current.
+        """
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        elif last_modified:
+            headers['If-Modified-Since'] = last_modified
+        path = URBANTZ_TASK_PATH.format(taskId=urllib.parse.quote(str(task_id), safe=''))
+        task, response_headers = self.limited_call('GET', path, extra_headers=headers, with_headers=True)
+        return task, response_headers.get('etag', etag), response_headers.get('last-modified', last_modified)
+
+    def metrics(self):
+        """Export limiter state for the metrics endpoint"""
+        return dict(self.limiter.stats(), baseUrl=self.base_url, maxRetries=self.max_retries)
+
+    def close(self):
+        self.pool.close()
+
+
+def _indexed(fn, index, item):
+    return index, fn(item)
+
+
+def validate_delivery(delivery):
+    """Check a delivery against the announce schema; returns an error message or None"""
+    errors = ANNOUNCE_VALIDATOR.errors(delivery)
+    return '; '.join(errors) if errors else None
+
+
+def announce_payload(delivery):
+    """Body for /v2/announce, built the same way as api/urbantz.js"""
+    return {
+        "customerRef": delivery.get('customerRef'),
+        "pickupAddress": None,
+        "deliveryAddress": delivery.get('deliveryAddress'),
+        "serviceDate": delivery.get('serviceDate'),
+        "timeWindowStart": delivery.get('timeWindowStart'),
+        "timeWindowEnd": delivery.get('timeWindowEnd'),
+        "items": delivery.get('items') or [],
+        "notes": delivery.get('notes')
+    }
+
+
+def task_id_of(response):
+    """Pick the task id out of an announce response"""
+    for key in ('taskId', 'id', '_id'):
+        if isinstance(response, dict) and response.get(key):
+            return response[key]
+    return None
@@ -0,0 +1,209 @@
+"""
+Watch-folder ingestion: every document dropped into an inbox directory is analyzed
+
+The inbox is polled, since the standard library has no portable file notification
+API. A file is picked up once its size and modification time have stayed the same
+for WATCH_SETTLE_SECONDS, so copies still in progress are left alone. It is moved
+to .processing/ and analyzed by a bounded pool of worker processes running the
+server's DocumentAnalyzer (PDF, .eml, CSV/XLSX and text files), then moved to
+done/ or failed/ with its analysis next to it as <name>.json. With --export the
+deliveries are queued for the Urbantz export worker.
+
+    python watch_folder.py inbox --workers 8 --export
+"""
+
+import argparse
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import time
+
+# Load environment variables from .env file
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
+
+# Local modules read their settings from the environment, so import after .env is loaded
+import document_analysis
+import urbantz_client
+from export_queue import ExportQueue, ExportWorker
+from export_store import ExportStore
+
+WATCH_DIR = os.environ.get('WATCH_DIR', 'inbox')
+WATCH_WORKERS = int(os.environ.get('WATCH_WORKERS', str(os.cpu_count() or 1)))
+WATCH_POLL_INTERVAL_SECONDS = float(os.environ.get('WATCH_POLL_INTERVAL', '2'))
+# A file must be unchanged this long before it is picked up
+WATCH_SETTLE_SECONDS = float(os.environ.get('WATCH_SETTLE_SECONDS', '2'))
+
+# Files handed to the pool ahead of the ones being analyzed, per worker; the rest wait in the inbox
+QUEUED_PER_WORKER = 2
+# Partial downloads and editor/Office lock files
+_IGNORED_SUFFIXES = ('.part', '.tmp', '.crdownload', '.partial')
+
+def analyze_file(path):
+    """Analysis of one file; runs in a worker process"""
+    started = time.monotonic()
+    try:
+        response, status = document_analysis.worker_analyzer.analyze_file(path)
+    except Exception as e:
+        response, status = {"success": False, "error": f"{type(e).__name__}: {e}"}, 500
+    return dict(response, status=status, seconds=round(time.monotonic() - started, 3))
+
+
+def _move(path, folder):
+    """Move a file into folder without overwriting a file of the same name"""
+    stem, ext = os.path.splitext(os.path.basename(path))
+    target = os.path.join(folder, stem + ext)
+    n = 1
+    while os.path.exists(target):
+        target = os.path.join(folder, f"{stem}-{n}{ext}")
+        n += 1
+    os.replace(path, target)
+    return target
+
+
+class FolderWatcher:
+    """Picks up settled files from an inbox and analyzes them in a process pool"""
+
+    def __init__(self, inbox=WATCH_DIR, workers=WATCH_WORKERS, export_queue=None,
+                 settle_seconds=WATCH_SETTLE_SECONDS, quiet=True):
+        self.inbox = inbox
+        self.workers = max(1, workers)
+        self.export_queue = export_queue
+        self.settle_seconds = settle_seconds
+        self.processing_dir = os.path.join(inbox, '.processing')
+        self.done_dir = os.path.join(inbox, 'done')
+        self.failed_dir = os.path.join(inbox, 'failed')
+        for folder in (self.processing_dir, self.done_dir, self.failed_dir):
+            os.makedirs(folder, exist_ok=True)
+        self.stats = {"processed": 0, "failed": 0, "deliveries": 0, "exportJobs": 0}
+        self._seen = {}
+        self._in_flight = {}
+
+        # Files that were being analyzed when the last run stopped go back into the inbox
+        for name in os.listdir(self.processing_dir):
+            _move(os.path.join(self.processing_dir, name), inbox)
+
+        # spawn: workers import the analysis modules themselves instead of inheriting this process
+        self.pool = concurrent.futures.ProcessPoolExecutor(
+            self.workers, mp_context=multiprocessing.get_context('spawn'),
+            initializer=document_analysis.init_worker, initargs=(quiet,))
+
+    def ready_files(self, now=None):
+        """Inbox files unchanged for settle_seconds, oldest first"""
+        now = time.time() if now is None else now
+        current, ready = {}, []
+        with os.scandir(self.inbox) as entries:
+            for entry in entries:
+                if (not entry.is_file() or entry.name.startswith(('.', '~$'))
+                        or entry.name.lower().endswith(_IGNORED_SUFFIXES)):
+                    continue
+                stat = entry.stat()
+                signature = (stat.st_size, stat.st_mtime)
+                seen = self._seen.get(entry.path)
+                since = seen[1] if seen and seen[0] == signature else now
+                current[entry.path] = (signature, since)
+                if now - since >= self.settle_seconds:
+                    ready.append((stat.st_mtime, entry.path))
+        self._seen = current
+        return [path for _, path in sorted(ready)]
+
+    def poll(self):
+        """Finish completed analyses and hand settled files to the pool; returns files still in flight"""
+        for future in [f for f in self._in_flight if f.done()]:
+            self._finish(self._in_flight.pop(future), future)
+
+        capacity = self.workers * QUEUED_PER_WORKER - len(self._in_flight)
+        for path in self.ready_files()[:max(0, capacity)]:
+            try:
+                moved = _move(path, self.processing_dir)
+            except FileNotFoundError:
+                continue
+            self._seen.pop(path, None)
+            self._in_flight[self.pool.submit(analyze_file, moved)] = moved
+        return len(self._in_flight)
+
+    def _finish(self, path, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            # A worker process died; the file is not retried automatically
+            result = {"success": False, "error": f"{type(e).__name__}: {e}", "status": 500}
+        name = os.path.basename(path)
+        deliveries = result.get("deliveries") or []
+
+        if result.get("success") and self.export_queue and deliveries:
+            result["exportJobId"] = self.export_queue.enqueue(deliveries, upload_id=result.get("uploadId"))
+            self.stats["exportJobs"] += 1
+
+        if result.get("success"):
+            target = _move(path, self.done_dir)
+            self.stats["processed"] += 1
+            self.stats["deliveries"] += len(deliveries)
+            print(f"✅ {name}: {len(deliveries)} deliveries ({result.get('kind')}, {result['seconds']}s)"
+                  + (f", export job {result['exportJobId']}" if result.get("exportJobId") else ""))
+        else:
+            target = _move(path, self.failed_dir)
+            self.stats["failed"] += 1
+            print(f"❌ {name}: {result.get('error')}")
+
+        with open(target + '.json', 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+    def run(self, poll_interval=WATCH_POLL_INTERVAL_SECONDS, once=False):
+        """Poll until interrupted, or with once=True until the inbox is empty"""
+        while True:
+            in_flight = self.poll()
+            if once and not in_flight and not self._seen:
+                return self.stats
+            if in_flight:
+                # Wake up as soon as a worker finishes instead of waiting for the next poll
+                concurrent.futures.wait(self._in_flight, timeout=poll_interval,
+                                        return_when=concurrent.futures.FIRST_COMPLETED)
+            else:
+                time.sleep(min(poll_interval, self.settle_seconds) if once else poll_interval)
+
+    def close(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze every document dropped into an inbox directory")
+    parser.add_argument('inbox', nargs='?', default=WATCH_DIR, help="directory to watch (default: WATCH_DIR)")
+    parser.add_argument('--workers', type=int, default=WATCH_WORKERS, help="worker processes")
+    parser.add_argument('--export', action='store_true', help="queue the deliveries of every file for Urbantz export")
+    parser.add_argument('--once', action='store_true', help="process the current inbox and exit")
+    parser.add_argument('--verbose', action='store_true', help="show the extraction logs of the workers")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.makedirs(args.inbox, exist_ok=True)
+
+    queue = None
+    if args.export:
+        queue = ExportQueue()
+        if urbantz_client.is_configured():
+            ExportWorker(queue, urbantz_client.UrbantzClient(store=ExportStore())).start()
+        else:
+            print("⚠️ URBANTZ_API_KEY not found; export jobs stay queued until the server exports them")
+
+    watcher = FolderWatcher(args.inbox, args.workers, export_queue=queue, quiet=not args.verbose)
+    print(f"👀 Watching {os.path.abspath(args.inbox)} with {watcher.workers} worker(s)"
+          + (", exporting results" if queue else ""))
+    try:
+        stats = watcher.run(once=args.once)
+        print(f"✨ {stats['processed']} file(s) processed, {stats['failed']} failed, "
+              f"{stats['deliveries']} deliveries, {stats['exportJobs']} export job(s)")
+    except KeyboardInterrupt:
+        print("\n👋 Watcher stopped by user; files being analyzed are picked up again on the next start")
+    finally:
+        watcher.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Test script for hedged analysis, progressive refinement jobs and prefetching
+"""
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts', 'start-scripts'))
+
+import analysis_jobs
+from analysis_jobs import ResultStore, Prefetcher, content_key, run_hedged, start_refinement_job
+
+
+def slow(result, delay):
+    """Return a function that answers after a delay"""
+    def fn():
+        time.sleep(delay)
+        return result
+    return fn
+
+
+def test_hedged_fast_llm():
+    """LLM within the deadline wins"""
+    print("🏁 Testing hedged run with a fast LLM...")
+    store = ResultStore()
+    deliveries, method, result_id = run_hedged(lambda: ["pattern"], slow(["ai"], 0.05), 1.0, store)
+    assert deliveries == ["ai"] and method == "ai_extraction" and result_id is None
+    assert store._results == {}, "no late result expected"
+    print("✅ AI result returned directly")
+
+
+def test_hedged_deadline_missed():
+    """LLM past the deadline yields a provisional result and a late result id"""
+    print("⏱️ Testing hedged run with a slow LLM...")
+    store = ResultStore()
+    started = time.monotonic()
+    deliveries, method, result_id = run_hedged(lambda: ["pattern"], slow(["ai"], 0.5), 0.1, store)
+    assert time.monotonic() - started < 0.4, "deadline not respected"
+    assert deliveries == ["pattern"] and method == "pattern_matching" and result_id
+    assert store.get(result_id)["status"] == "pending"
+    time.sleep(0.6)
+    late = store.get(result_id)
+    assert late["status"] == "done" and late["deliveries"] == ["ai"]
+    print("✅ Provisional result returned, late AI result fetched by id")
+
+
+def test_hedge_workers_busy():
+    """With every hedge worker taken the AI call goes to the background instead of eating the deadline"""
+    print("🚦 Testing hedged runs beyond the hedge workers...")
+    store = ResultStore()
+    runs = [None] * (analysis_jobs.HEDGE_WORKERS + 2)
+
+    def run(i):
+        runs[i] = run_hedged(lambda: ["pattern"], slow(["ai"], 0.3), 1.0, store)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(runs))]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+        time.sleep(0.01)
+    for thread in threads:
+        thread.join()
+
+    hedged, queued = runs[:analysis_jobs.HEDGE_WORKERS], runs[analysis_jobs.HEDGE_WORKERS:]
+    assert all(r == (["ai"], "ai_extraction", None) for r in hedged), hedged
+    assert all(r[:2] == (["pattern"], "pattern_matching") and r[2] for r in queued), queued
+    assert time.monotonic() - started < 0.9, "queued hedges waited for their deadline"
+    time.sleep(0.5)
+    assert all(store.get(r[2])["deliveries"] == ["ai"] for r in queued)
+    print(f"✅ {len(hedged)} hedged, {len(queued)} answered at once and finished in the background")
+
+
+def test_refinement_job():
+    """Jobs start with the fast result and pick up each finished stage"""
+    print("🔄 Testing progressive refinement job...")
+    store = ResultStore()
+    job_id = start_refinement_job(store, ["pattern"], "pattern_matching", [
+        ("ai_extraction", slow(["ai"], 0.1)),
+        ("broken", lambda: 1 / 0),
+    ])
+    job = store.get(job_id)
+    assert job["status"] == "refining" and job["deliveries"] == ["pattern"]
+
+    for _ in range(50):
+        job = store.get(job_id)
+        if job["status"] == "done":
+            break
+        time.sleep(0.05)
+
+    assert job["status"] == "done", job
+    assert job["deliveries"] == ["ai"] and job["method"] == "ai_extraction"
+    assert [s["status"] for s in job["stages"]] == ["done", "done", "failed"]
+    print("✅ Job refined by AI stage, failing stage recorded")
+
+
+def counted(result, delay=0.0):
+    """A prefetch function that counts its calls"""
+    calls = []
+    def fn():
+        calls.append(1)
+        time.sleep(delay)
+        return dict(result)
+    return fn, calls
+
+
+def test_prefetch_hit_and_join():
+    """A click after the prefetch reuses it; a click during it waits instead of starting over"""
+    print("🔮 Testing prefetch hits and joins...")
+    prefetcher = Prefetcher(ResultStore())
+    key = content_key('text', 'Levering ORD-1')
+    assert key == content_key('text', 'Levering ORD-1') != content_key('text', 'Levering ORD-2')
+
+    fn, calls = counted({"deliveries": ["ai"]}, delay=0.2)
+    result_id, started = prefetcher.submit(key, fn, uploadId='ab' * 32)
+    assert started and prefetcher.submit(key, fn) == (result_id, False)
+    time.sleep(0.05)
+    # The upload of a prefetch in progress is pinned against compaction
+    assert prefetcher.in_flight('uploadId') == {'ab' * 32}
+
+    started_at = time.monotonic()
+    result, outcome = prefetcher.take(key, fn)
+    assert outcome == 'joined' and result["deliveries"] == ["ai"] and result["resultId"] == result_id
+    assert time.monotonic() - started_at < 0.2
+    result, outcome = prefetcher.take(key, fn)
+    assert outcome == 'hit' and prefetcher.peek(key)["deliveries"] == ["ai"]
+    assert prefetcher.in_flight('uploadId') == set()
+    assert len(calls) == 1 and prefetcher.counts["hits"] == 2 and prefetcher.counts["joined"] == 1
+    print("✅ One analysis served the prefetch and both clicks")
+
+
+def test_prefetch_claimed_and_retried():
+    """A queued prefetch is taken over by the click; failed and partial results are redone"""
+    print("🔁 Testing prefetch takeover and retries...")
+    executor_gate = threading.Event()
+
+    class GatedExecutor:
+        def submit(self, fn, *args):
+            threading.Thread(target=lambda: (executor_gate.wait(), fn(*args)), daemon=True).start()
+
+    prefetcher = Prefetcher(ResultStore(), executor=GatedExecutor())
+    fn, calls = counted({"deliveries": ["ai"]})
+    prefetcher.submit('queued', fn)
+    result, outcome = prefetcher.take('queued', fn)
+    executor_gate.set()
+    time.sleep(0.05)
+    assert outcome == 'miss' and result["deliveries"] == ["ai"] and len(calls) == 1
+
+    partial, partial_calls = counted({"deliveries": ["pattern"], "status": 'partial'})
+    assert prefetcher.take('flaky', partial)[1] == 'miss'
+    assert prefetcher.take('flaky', partial)[1] == 'miss' and len(partial_calls) == 2
+
+    try:
+        prefetcher.take('broken', lambda: 1 / 0)
+        assert False, "expected ZeroDivisionError"
+    except ZeroDivisionError:
+        pass
+    assert prefetcher.take('broken', fn)[1] == 'miss'
+    assert prefetcher.take('broken', fn)[1] == 'hit'
+    print("✅ Work is never done twice, failures are not cached")
+
+
+if __name__ == "__main__":
+    print("🚀 Analysis Jobs Test")
+    print("=" * 50)
+
+    test_hedged_fast_llm()
+    test_hedged_deadline_missed()
+    test_hedge_workers_busy()
+    test_refinement_job()
+    test_prefetch_hit_and_join()
+    test_prefetch_claimed_and_retried()
+
+    print("\n✨ All tests completed!")
@@ -91,7 +91,7 @@ def test_api_connection():
         }
         
         req = urllib.request.Request(
-            'https://api.anthropic.com/v1/messages',
+            os.environ.get('ANTHROPIC_BASE_URL', 'https://api.anthropic.com').rstrip('/') + '/v1/messages',
             data=json.dumps(request_data).encode('utf-8'),
             headers={
                 'x-api-key': api_key,
@@ -188,7 +188,7 @@ Geef het antwoord terug als een JSON array van leveringen.
         print("🔄 Extracting delivery information...")
         
         req = urllib.request.Request(
-            'https://api.anthropic.com/v1/messages',
+            os.environ.get('ANTHROPIC_BASE_URL', 'https://api.anthropic.com').rstrip('/') + '/v1/messages',
             data=json.dumps(request_data).encode('utf-8'),
             headers={
                 'x-api-key': api_key,
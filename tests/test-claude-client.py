@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Test script for the Claude client: forced tool requests, tool output parsing and traffic replay
+"""
+
+import gzip
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import urllib.error
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts', 'start-scripts'))
+
+import claude_client
+
+DELIVERY = {"customerRef": "ORD-1", "deliveryAddress": {"line1": "Bruul 48, 2800 Mechelen"}}
+
+
+def tool_response(deliveries, name='record_deliveries', stop_reason='tool_use'):
+    """A Messages API response with one tool_use block"""
+    return {
+        "content": [{"type": "tool_use", "id": "toolu_1", "name": name, "input": {"deliveries": deliveries}}],
+        "stop_reason": stop_reason,
+        "usage": {"input_tokens": 100, "output_tokens": 50}
+    }
+
+
+def test_build_request():
+    """The request forces the record_deliveries tool"""
+    print("📝 Testing request body...")
+    body = claude_client.build_delivery_request("Leveringen:", model='claude-test', max_tokens=123)
+    assert body["model"] == 'claude-test' and body["max_tokens"] == 123
+    assert body["tools"] == [claude_client.DELIVERY_TOOL]
+    assert body["tool_choice"] == {"type": "tool", "name": "record_deliveries"}
+    assert body["messages"] == [{"role": "user", "content": "Leveringen:"}]
+    print("✅ Tool call forced")
+
+
+def test_parse_response():
+    """Only a record_deliveries call with a list counts as an answer"""
+    print("🔍 Testing response parsing...")
+    assert claude_client.parse_delivery_response(tool_response([DELIVERY])) == [DELIVERY]
+    assert claude_client.parse_delivery_response(tool_response([])) == []
+
+    text_only = {"content": [{"type": "text", "text": "[{\"customerRef\": \"ORD-1\"}]"}]}
+    assert claude_client.parse_delivery_response(text_only) is None
+    assert claude_client.parse_delivery_response({"content": None}) is None
+    assert claude_client.parse_delivery_response(tool_response([DELIVERY], name='other_tool')) is None
+    assert claude_client.parse_delivery_response(tool_response({"customerRef": "ORD-1"})) is None
+    assert claude_client.parse_delivery_response(tool_response("ORD-1")) is None
+
+    # A text block before the tool call is skipped
+    mixed = tool_response([DELIVERY])
+    mixed["content"].insert(0, {"type": "text", "text": "Ik vond 1 levering."})
+    assert claude_client.parse_delivery_response(mixed) == [DELIVERY]
+    print("✅ Missing tool calls, other tools and non-list deliveries rejected")
+
+
+def test_truncated_output():
+    """A tool call cut off at max_tokens is an error, not a short delivery list"""
+    print("✂️ Testing max_tokens truncation...")
+    original = claude_client.post_messages
+    try:
+        claude_client.post_messages = lambda body, api_key, timeout=30: tool_response([DELIVERY])
+        assert claude_client.extract_deliveries("prompt", "key") == [DELIVERY]
+
+        claude_client.post_messages = lambda body, api_key, timeout=30: tool_response([DELIVERY], stop_reason='max_tokens')
+        try:
+            claude_client.extract_deliveries("prompt", "key")
+            assert False, "expected TruncatedResponse"
+        except claude_client.TruncatedResponse as e:
+            assert "1 deliveries" in str(e)
+    finally:
+        claude_client.post_messages = original
+    print("✅ Truncated tool output raises")
+
+
+def test_record_and_replay():
+    """Calls recorded to a .jsonl.gz log are replayed by request, in turn, with their latency"""
+    print("📼 Testing traffic record and replay...")
+    path = os.path.join(tempfile.mkdtemp(), 'traffic.jsonl.gz')
+    first, second = claude_client.build_delivery_request("Document A"), claude_client.build_delivery_request("Document B")
+    answers = iter([tool_response([DELIVERY]), tool_response([DELIVERY, DELIVERY]), 'overloaded', tool_response([])])
+
+    def fake_post(url, request_data, api_key, timeout):
+        time.sleep(0.05)
+        answer = next(answers)
+        if answer == 'overloaded':
+            raise urllib.error.HTTPError(url, 529, 'Overloaded', {}, io.BytesIO(b'{"type": "error"}'))
+        return answer
+
+    saved = (claude_client.CLAUDE_TRAFFIC_MODE, claude_client.TRAFFIC_LOG, claude_client._post_messages,
+             claude_client.CLAUDE_REPLAY_LATENCY_SCALE)
+    try:
+        claude_client.CLAUDE_TRAFFIC_MODE, claude_client.TRAFFIC_LOG = 'record', claude_client.TrafficLog(path)
+        claude_client._post_messages = fake_post
+        assert len(claude_client.post_messages(first, 'key')["content"][0]["input"]["deliveries"]) == 1
+        assert len(claude_client.post_messages(first, 'key')["content"][0]["input"]["deliveries"]) == 2
+        try:
+            claude_client.post_messages(second, 'key')
+            assert False, "expected HTTPError"
+        except urllib.error.HTTPError as e:
+            # The recorded error body is still readable by the caller
+            assert e.code == 529 and json.loads(e.read()) == {"type": "error"}
+        claude_client.post_messages(second, 'key')
+
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            entries = [json.loads(line) for line in f]
+        assert [e["status"] for e in entries] == [200, 200, 529, 200]
+        assert entries[0]["key"] == entries[1]["key"] == claude_client.request_key(first)
+        assert "Document A" not in json.dumps(entries), "the prompt itself must not be stored"
+        assert entries[0]["latencyMs"] >= 50
+
+        # Replay without touching the network; the same request rotates through its recordings
+        claude_client.CLAUDE_TRAFFIC_MODE, claude_client.TRAFFIC_LOG = 'replay', claude_client.TrafficLog(path)
+        claude_client._post_messages = None
+        claude_client.CLAUDE_REPLAY_LATENCY_SCALE = 0
+        started = time.monotonic()
+        counts = [len(claude_client.post_messages(first, 'key')["content"][0]["input"]["deliveries"]) for _ in range(3)]
+        assert counts == [1, 2, 1] and time.monotonic() - started < 0.1
+        try:
+            claude_client.post_messages(second, 'key')
+            assert False, "expected replayed HTTPError"
+        except urllib.error.HTTPError as e:
+            assert e.code == 529 and json.loads(e.read()) == {"type": "error"}
+        assert claude_client.post_messages(second, 'key')["content"][0]["input"]["deliveries"] == []
+
+        claude_client.CLAUDE_REPLAY_LATENCY_SCALE = 1
+        started = time.monotonic()
+        claude_client.post_messages(first, 'key')
+        assert time.monotonic() - started >= 0.05, "recorded latency not replayed"
+
+        try:
+            claude_client.post_messages(claude_client.build_delivery_request("Document C"), 'key')
+            assert False, "expected LookupError"
+        except LookupError:
+            pass
+    finally:
+        (claude_client.CLAUDE_TRAFFIC_MODE, claude_client.TRAFFIC_LOG, claude_client._post_messages,
+         claude_client.CLAUDE_REPLAY_LATENCY_SCALE) = saved
+    print("✅ Responses, errors and latency replayed; unknown requests refused")
+
+
+if __name__ == "__main__":
+    print("🚀 Claude Client Test")
+    print("=" * 50)
+
+    test_build_request()
+    test_parse_response()
+    test_truncated_output()
+    test_record_and_replay()
+
+    print("\n✨ All tests completed!")
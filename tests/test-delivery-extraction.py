@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Test script for delivery extraction: pattern matching and the Claude fallback
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts', 'start-scripts'))
+
+import delivery_extraction
+
+TEXT = """Leveringen 31/10/2025
+REF: ORD-001
+Adres: Hoofdstraat 1, 1000 Brussel
+Tijd: 08:00 - 10:00
+REF: ORD-002
+Adres: Kerkstraat 5, 2000 Antwerpen
+Tijd: 09:00 - 11:00
+"""
+
+
+def test_patterns():
+    """Every REF: section becomes a delivery"""
+    print("🔍 Testing pattern extraction...")
+    deliveries = delivery_extraction.extract_deliveries_with_patterns(TEXT)
+    assert [d["customerRef"] for d in deliveries] == ["ORD-001", "ORD-002"], deliveries
+    assert deliveries[1]["deliveryAddress"]["line1"] == "Kerkstraat 5, 2000 Antwerpen"
+    assert (deliveries[1]["timeWindowStart"], deliveries[1]["timeWindowEnd"]) == ("09:00", "11:00")
+    print("✅ Two deliveries found")
+
+
+def test_claude_fallback():
+    """A Claude error falls back to patterns and says so in the result, call by call"""
+    print("🤖 Testing the Claude fallback flag...")
+    saved_key, saved_claude = os.environ.get('ANTHROPIC_API_KEY'), delivery_extraction.extract_deliveries_with_claude
+
+    def failing(text, api_key):
+        raise RuntimeError("overloaded")
+
+    try:
+        os.environ['ANTHROPIC_API_KEY'] = 'sk-ant-test'
+        delivery_extraction.extract_deliveries_with_claude = failing
+        result = delivery_extraction.extract_deliveries(TEXT)
+        assert result["claudeFailed"] and len(result["deliveries"]) == 2 and result["promptDiet"] is None
+
+        # The next call does not inherit the earlier failure
+        delivery_extraction.extract_deliveries_with_claude = lambda text, api_key: ([{"customerRef": "AI-1"}], None)
+        result = delivery_extraction.extract_deliveries(TEXT)
+        assert not result["claudeFailed"] and result["deliveries"] == [{"customerRef": "AI-1"}]
+
+        del os.environ['ANTHROPIC_API_KEY']
+        assert not delivery_extraction.extract_deliveries(TEXT)["claudeFailed"]
+    finally:
+        delivery_extraction.extract_deliveries_with_claude = saved_claude
+        if saved_key is not None:
+            os.environ['ANTHROPIC_API_KEY'] = saved_key
+        else:
+            os.environ.pop('ANTHROPIC_API_KEY', None)
+    print("✅ Fallback reported per call")
+
+
+if __name__ == "__main__":
+    print("🚀 Delivery Extraction Test")
+    print("=" * 50)
+
+    test_patterns()
+    test_claude_fallback()
+
+    print("\n✨ All tests completed!")
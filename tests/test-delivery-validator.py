@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Test script for the compiled announce schema validator
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts', 'start-scripts'))
+
+from delivery_validator import ANNOUNCE_VALIDATOR, DeliveryValidator, benchmark
+
+
+def delivery(ref, **fields):
+    return dict({"customerRef": ref, "deliveryAddress": {"line1": "Bruul 48, 2800 Mechelen"},
+                 "serviceDate": "2025-10-11", "timeWindowStart": "08:00", "timeWindowEnd": "10:00"}, **fields)
+
+
+def test_single_delivery():
+    """Spec fields and the api/urbantz.js format checks are all reported at once"""
+    print("🔎 Testing one delivery...")
+    assert ANNOUNCE_VALIDATOR.errors(delivery("ORD-1")) == []
+    assert ANNOUNCE_VALIDATOR.errors(delivery("ORD-1", notes=None)) == []
+
+    errors = ANNOUNCE_VALIDATOR.errors(delivery("", deliveryAddress={"line1": ""}, serviceDate="2025-13-01",
+                                                timeWindowEnd="10u", items=[{}, "doos"]))
+    assert errors == [
+        "customerRef: is required",
+        "deliveryAddress.line1: is required",
+        "serviceDate: must be a date in YYYY-MM-DD format",
+        "timeWindowEnd: must be a time in HH:MM format",
+        "items[1]: must be an object"
+    ], errors
+    assert ANNOUNCE_VALIDATOR.errors("ORD-1") == ["delivery: must be an object"]
+    print("✅ All problems reported with their path")
+
+
+def test_batch_report():
+    """A batch report counts every error and lists the invalid rows"""
+    print("📋 Testing batch report...")
+    deliveries = [delivery(f"ORD-{i}") for i in range(10)]
+    deliveries[3]["serviceDate"] = "11/10/2025"
+    deliveries[7]["serviceDate"] = "morgen"
+    del deliveries[7]["deliveryAddress"]
+
+    report = ANNOUNCE_VALIDATOR.validate_batch(iter(deliveries), max_rows=1)
+    assert (report["total"], report["valid"], report["invalid"]) == (10, 8, 2)
+    assert report["errorCounts"] == {"serviceDate: must be a date in YYYY-MM-DD format": 2,
+                                     "deliveryAddress: is required": 1}
+    assert [row["index"] for row in report["rows"]] == [3] and report["truncated"]
+    print("✅ 2 of 10 invalid, errors aggregated")
+
+
+def test_custom_schema():
+    """Enums, integers and nested arrays compile from any schema"""
+    print("🧰 Testing a custom schema...")
+    validator = DeliveryValidator({
+        "type": "object",
+        "properties": {
+            "priority": {"type": "string", "enum": ["low", "normal", "high"]},
+            "items": {"type": "array", "items": {"type": "object", "required": ["quantity"],
+                                                 "properties": {"quantity": {"type": "integer", "minimum": 1}}}}
+        }
+    })
+    errors = validator.errors({"priority": "urgent", "items": [{"quantity": 2}, {"quantity": True}, {"quantity": 0}, {}]})
+    assert errors == [
+        "priority: must be one of low, normal, high",
+        "items[1].quantity: must be an integer",
+        "items[2].quantity: must be at least 1",
+        "items[3].quantity: is required"
+    ], errors
+    print("✅ Custom schema enforced")
+
+
+def test_benchmark():
+    """100k deliveries validate within a few seconds"""
+    print("⏱️ Benchmarking 100k deliveries...")
+    elapsed = benchmark(100_000)
+    assert elapsed < 10, f"validation too slow: {elapsed:.1f}s"
+
+
+if __name__ == "__main__":
+    print("🚀 Delivery Validator Test")
+    print("=" * 50)
+
+    test_single_delivery()
+    test_batch_report()
+    test_custom_schema()
+    test_benchmark()
+
+    print("\n✨ All tests completed!")
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Test script for raw email (.eml) parsing
+"""
+
+import email.message
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts', 'start-scripts'))
+
+import email_ingest
+
+HTML_TABLE = """<html><head><style>td { padding: 4px }</style></head><body>
+<p>Beste,<br>Hieronder de leveringen voor morgen.</p>
+<table><tr><th>Ref</th><th>Klant</th><th>Adres</th><th>Tijdslot</th></tr>
+<tr><td>ORD-001</td><td>Bakkerij Jan</td><td>Hoofdstraat 1,<br>1000 Brussel</td><td>08:00&ndash;10:00</td></tr>
+<tr><td>ORD-002</td><td>Caf&eacute; Marie</td><td>Kerkstraat 5, 2000 Antwerpen</td><td>09:00&ndash;11:00</td></tr>
+</table><p>Groeten,<br>Planning</p></body></html>"""
+
+
+def build_email():
+    message = email.message.EmailMessage()
+    message['Subject'] = 'Leveringen 31 oktober'
+    message['From'] = 'planning@example.be'
+    message['To'] = 'ops@example.be'
+    message.set_content("Beste,\n\nZie tabel in de HTML-versie.\n")
+    message.add_alternative(HTML_TABLE, subtype='html')
+    message.add_attachment(b"%PDF-1.4\n%fake\n", maintype='application', subtype='octet-stream',
+                           filename='manifest.pdf')
+    message.add_attachment("Ref;Klant\nORD-9;Zuid\n", subtype='csv', filename='extra.csv')
+    message.add_attachment(b"\x89PNG\r\n", maintype='image', subtype='png', filename='logo.png')
+
+    forwarded = email.message.EmailMessage()
+    forwarded['Subject'] = 'Fw: spoedlevering'
+    forwarded.set_content("REF: ORD-777\nAdres: Bruul 48, 2800 Mechelen\n")
+    message.add_attachment(forwarded)
+    return message.as_bytes()
+
+
+def test_html_table_body():
+    """The HTML alternative wins when it has a table and keeps its rows"""
+    print("📧 Testing HTML table body...")
+    raw = build_email()
+    chunks = [raw[i:i + 100] for i in range(0, len(raw), 100)]
+    parts = email_ingest.split_message(email_ingest.parse_email(chunks))
+    assert parts["bodyFormat"] == 'html-table'
+    lines = parts["body"].splitlines()
+    assert "Ref | Klant | Adres | Tijdslot" in lines, lines
+    assert "ORD-001 | Bakkerij Jan | Hoofdstraat 1, 1000 Brussel | 08:00–10:00" in lines, lines
+    assert "ORD-002 | Café Marie | Kerkstraat 5, 2000 Antwerpen | 09:00–11:00" in lines
+    assert "td {" not in parts["body"]
+    assert parts["text"].startswith("Subject: Leveringen 31 oktober\nFrom: planning@example.be")
+    print("✅ Table rows rendered as 'cell | cell' lines")
+
+
+def test_attachments_routed():
+    """Attachments are decoded and classified by content"""
+    print("📎 Testing attachments...")
+    parts = email_ingest.split_message(email_ingest.parse_email([build_email()]))
+    kinds = [(a["fileName"], a["kind"]) for a in parts["attachments"]]
+    assert kinds == [('manifest.pdf', 'pdf'), ('extra.csv', 'csv'), ('logo.png', 'other'),
+                     ('forwarded.eml', 'email')], kinds
+    assert parts["attachments"][0]["data"] == b"%PDF-1.4\n%fake\n"
+
+    forwarded = email_ingest.split_message(email_ingest.parse_email([parts["attachments"][3]["data"]]))
+    assert forwarded["subject"] == 'Fw: spoedlevering' and "ORD-777" in forwarded["body"]
+    assert "ORD-777" not in parts["body"]
+    print("✅ PDF, CSV, image and forwarded email told apart")
+
+
+def test_plain_text_preferred_without_tables():
+    """Without a table the plain text part is used"""
+    print("📝 Testing plain body...")
+    message = email.message.EmailMessage()
+    message['Subject'] = 'Levering'
+    message.set_content("REF: ORD-5\nAdres: Veldstraat 1, 9000 Gent\n")
+    message.add_alternative("<p>REF: ORD-5<br>Adres: Veldstraat 1, 9000 Gent</p>", subtype='html')
+    parts = email_ingest.split_message(email_ingest.parse_email([message.as_bytes()]))
+    assert parts["bodyFormat"] == 'plain' and parts["attachments"] == []
+    assert email_ingest.looks_like_email(message.as_bytes()[:1024])
+    assert not email_ingest.looks_like_email(b"%PDF-1.7\n")
+    print("✅ Plain text body")
+
+
+if __name__ == "__main__":
+    print("🚀 Email Ingest Test")
+    print("=" * 50)
+
+    test_html_table_body()
+    test_attachments_routed()
+    test_plain_text_preferred_without_tables()
+
+    print("\n✨ All tests completed!")
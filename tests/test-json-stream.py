@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Test script for the incremental JSON decoder used for large export bodies
+"""
+
+import io
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts', 'start-scripts'))
+
+from json_stream import ArrayReader, BodyTooLarge, read_json
+
+
+def reader(text, chunk_size=7, max_bytes=1024 * 1024):
+    body = text.encode('utf-8')
+    return ArrayReader(io.BytesIO(body), len(body), max_bytes=max_bytes, chunk_size=chunk_size)
+
+
+def test_elements_across_chunks():
+    """Elements, numbers and multi-byte characters split over tiny chunks decode intact"""
+    print("🧩 Testing elements split across chunk boundaries...")
+    deliveries = [{"customerRef": f"ORD-{i}", "deliveryAddress": {"line1": f"Kerkstraat {i}, 2000 Antwerpen"},
+                   "notes": "Café – 2e verdieping"} for i in range(50)]
+    text = json.dumps(deliveries, ensure_ascii=False, indent=2)
+
+    assert list(reader(text)) == deliveries
+    assert list(reader(' [ 12345 , 6789,"x" ,[1, 2] ] \n', chunk_size=3)) == [12345, 6789, "x", [1, 2]]
+    assert list(reader('[]')) == []
+    print("✅ 50 deliveries and mixed values decoded")
+
+
+def test_lazy_consumption():
+    """The reader only pulls as much of the body as the next element needs"""
+    print("🐢 Testing lazy reads...")
+    body = json.dumps([{"customerRef": f"ORD-{i}", "pad": "x" * 100} for i in range(1000)]).encode('utf-8')
+    stream = io.BytesIO(body)
+    deliveries = ArrayReader(stream, len(body), chunk_size=512)
+
+    first = next(deliveries)
+    consumed = stream.tell()
+    assert first["customerRef"] == "ORD-0"
+    assert consumed <= 1024, consumed
+    assert sum(1 for _ in deliveries) == 999
+    print(f"✅ First delivery available after {consumed} of {len(body)} bytes")
+
+
+def test_invalid_bodies():
+    """Non-arrays, broken JSON and oversized bodies are rejected"""
+    print("🚫 Testing invalid bodies...")
+    for text in ['{"customerRef": "ORD-1"}', '', '[{"a": 1} {"b": 2}]', '[{"a": 1},]', '[1] 2', '[{"a": 1}']:
+        try:
+            list(reader(text))
+        except ValueError:
+            continue
+        raise AssertionError(f"accepted {text!r}")
+
+    try:
+        reader('[1, 2, 3]', max_bytes=4)
+    except BodyTooLarge:
+        pass
+    else:
+        raise AssertionError("oversized body accepted")
+
+    assert read_json(io.BytesIO(b'{"text": "REF: ORD-1"}'), 22) == {"text": "REF: ORD-1"}
+    print("✅ Invalid bodies rejected")
+
+
+if __name__ == "__main__":
+    print("🚀 JSON Stream Test")
+    print("=" * 50)
+
+    test_elements_across_chunks()
+    test_lazy_consumption()
+    test_invalid_bodies()
+
+    print("\n✨ All tests completed!")
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Test script for the offline mock of the Anthropic Messages API
+"""
+
+import importlib.util
+import json
+import os
+import sys
+import threading
+import urllib.request
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(__file__), '..', 'scripts', 'start-scripts')
+sys.path.insert(0, SCRIPTS_DIR)
+
+import claude_client
+
+_spec = importlib.util.spec_from_file_location('mock_anthropic', os.path.join(SCRIPTS_DIR, 'start-mock-anthropic.py'))
+mock_anthropic = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(mock_anthropic)
+
+DOCUMENT = """Leveringen 31/10/2025
+REF: ORD-001
+Adres: Hoofdstraat 1, 1000 Brussel
+Tijd: 08:00 - 10:00
+REF: ORD-002
+Adres: Kerkstraat 5, 2000 Antwerpen
+Tijd: 09:00 - 11:00
+"""
+
+
+def start_mock(*argv):
+    """Run the mock on a free port in a background thread"""
+    handler = type('Handler', (mock_anthropic.MockAnthropicHandler,), {})
+    handler.config = mock_anthropic.MockConfig(mock_anthropic.parse_args(list(argv)))
+    server = mock_anthropic.ThreadedHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, handler.config, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def prompt():
+    return f"Analyseer dit.\n{mock_anthropic.TEXT_MARKER}\n{DOCUMENT}\n=== OUTPUT FORMAT ===\nGebruik de tool."
+
+
+def post(base_url, body):
+    request = urllib.request.Request(f"{base_url}/v1/messages", data=json.dumps(body).encode('utf-8'),
+                                     headers={'x-api-key': 'sk-ant-mock', 'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=5) as response:
+        return response.headers.get('Content-Type'), response.read().decode('utf-8')
+
+
+def test_seeded_profiles():
+    """The same seed draws the same faults and latencies; the default seed is fixed"""
+    print("🎲 Testing seeded fault profiles...")
+
+    def draws(*argv):
+        config = mock_anthropic.MockConfig(mock_anthropic.parse_args(['--profile', 'flaky'] + list(argv)))
+        return [config.roll() for _ in range(200)]
+
+    assert draws('--seed', '7') == draws('--seed', '7')
+    assert draws('--seed', '7') != draws('--seed', '8')
+    assert draws() == draws(), "the default seed must be fixed"
+    outcomes = {outcome for outcome, _ in draws()}
+    assert outcomes == {'ok', 'error', 'rate_limited', 'truncated'}, outcomes
+    print("✅ Fault draws are reproducible")
+
+
+def test_tool_use_and_truncation():
+    """A forced tool call is answered with record_deliveries; truncation halves it"""
+    print("🧰 Testing tool_use responses...")
+    server, config, base_url = start_mock('--profile', 'instant', '--seed', '3')
+    try:
+        _, body = post(base_url, claude_client.build_delivery_request(prompt()))
+        message = json.loads(body)
+        block, = message["content"]
+        assert block["type"] == 'tool_use' and block["name"] == 'record_deliveries' and block["id"].startswith('toolu_')
+        assert message["stop_reason"] == 'tool_use' and message["usage"]["output_tokens"] > 0
+        deliveries = claude_client.parse_delivery_response(message)
+        assert [d["customerRef"] for d in deliveries] == ["ORD-001", "ORD-002"], deliveries
+        assert deliveries[0]["serviceDate"] == "2025-10-31"
+        assert (deliveries[1]["timeWindowStart"], deliveries[1]["timeWindowEnd"]) == ("09:00", "11:00")
+    finally:
+        server.shutdown()
+
+    server, config, base_url = start_mock('--profile', 'instant', '--truncate-rate', '1', '--seed', '3')
+    original = claude_client.ANTHROPIC_BASE_URL
+    claude_client.ANTHROPIC_BASE_URL = base_url
+    try:
+        _, body = post(base_url, claude_client.build_delivery_request(prompt()))
+        message = json.loads(body)
+        assert message["stop_reason"] == 'max_tokens'
+        assert len(message["content"][0]["input"]["deliveries"]) == 1
+        try:
+            claude_client.extract_deliveries(prompt(), 'sk-ant-mock')
+            assert False, "expected TruncatedResponse"
+        except claude_client.TruncatedResponse:
+            pass
+        assert config.stats["truncated"] == 2
+    finally:
+        claude_client.ANTHROPIC_BASE_URL = original
+        server.shutdown()
+    print("✅ Tool output shaped like the API, truncation reported as max_tokens")
+
+
+def test_streaming():
+    """stream=true sends the tool input as server-sent input_json_delta events"""
+    print("📡 Testing streaming...")
+    server, config, base_url = start_mock('--profile', 'instant', '--seed', '3')
+    try:
+        content_type, body = post(base_url, dict(claude_client.build_delivery_request(prompt()), stream=True))
+    finally:
+        server.shutdown()
+    assert content_type == 'text/event-stream'
+
+    events = []
+    for frame in body.strip().split('\n\n'):
+        name, data = frame.split('\n')
+        assert name.startswith('event: ') and data.startswith('data: ')
+        events.append((name[len('event: '):], json.loads(data[len('data: '):])))
+    names = [name for name, _ in events]
+    assert names[:2] == ['message_start', 'content_block_start'] and names[-3:] == [
+        'content_block_stop', 'message_delta', 'message_stop'], names
+    assert set(names[2:-3]) == {'content_block_delta'} and len(names) > 6
+
+    block = events[1][1]["content_block"]
+    assert block["type"] == 'tool_use' and block["name"] == 'record_deliveries'
+    partial = ''.join(data["delta"]["partial_json"] for name, data in events if name == 'content_block_delta')
+    assert [d["customerRef"] for d in json.loads(partial)["deliveries"]] == ["ORD-001", "ORD-002"]
+    assert events[-2][1]["delta"]["stop_reason"] == 'tool_use' and config.stats["streamed"] == 1
+    print(f"✅ {len(names)} events, tool input reassembled from the deltas")
+
+
+if __name__ == "__main__":
+    print("🚀 Mock Anthropic Test")
+    print("=" * 50)
+
+    test_seeded_profiles()
+    test_tool_use_and_truncation()
+    test_streaming()
+
+    print("\n✨ All tests completed!")
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Test script for the streaming multipart upload parser
+"""
+
+import hashlib
+import io
+import os
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts', 'start-scripts'))
+
+import multipart_upload
+from upload_store import UploadStore
+
+BOUNDARY = "----WebKitFormBoundary7MA4YWxkTrZu0gW"
+
+
+def is_pdf(head):
+    return head.startswith(b'%PDF')
+
+
+class TrickleStream(io.RawIOBase):
+    """Returns at most `step` bytes per read, like a slow socket"""
+
+    def __init__(self, data, step):
+        self.data = io.BytesIO(data)
+        self.step = step
+
+    def read(self, size=-1):
+        return self.data.read(min(self.step, size if size >= 0 else self.step))
+
+
+class GeneratedUpload(io.RawIOBase):
+    """A multipart body with a file of `size` bytes, produced while it is read"""
+
+    def __init__(self, size):
+        self.parts = [self._head(), None, f"\r\n--{BOUNDARY}--\r\n".encode()]
+        self.file_left = size
+        self.length = len(self.parts[0]) + size + len(self.parts[2])
+        self.consumed = 0
+
+    @staticmethod
+    def _head():
+        return (f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"scan.pdf\"\r\n"
+                "Content-Type: application/pdf\r\n\r\n%PDF-1.7\n").encode()
+
+    def read(self, size=-1):
+        if self.parts[0]:
+            out, self.parts[0] = self.parts[0][:size], self.parts[0][size:]
+        elif self.file_left > 0:
+            n = min(size, self.file_left)
+            self.file_left -= n
+            out = b'\x00' * n
+        else:
+            out, self.parts[2] = self.parts[2][:size], self.parts[2][size:]
+        self.consumed += len(out)
+        return out
+
+
+def multipart_body(*parts):
+    """parts: (name, filename or None, content type or None, bytes)"""
+    body = b"preamble\r\n"
+    for name, filename, content_type, data in parts:
+        disposition = f'form-data; name="{name}"' + (f'; filename="{filename}"' if filename else '')
+        body += f"--{BOUNDARY}\r\nContent-Disposition: {disposition}\r\n".encode()
+        if content_type:
+            body += f"Content-Type: {content_type}\r\n".encode()
+        body += b"\r\n" + data + b"\r\n"
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+
+def headers_for(body, content_type=f"multipart/form-data; boundary={BOUNDARY}"):
+    return {'Content-Type': content_type, 'Content-Length': str(len(body))}
+
+
+def test_parts_across_chunk_edges():
+    """Fields and the file survive reads that split the boundary anywhere"""
+    print("🧩 Testing parsing with tiny reads...")
+    # Content that looks like a boundary until its last byte
+    pdf = b"%PDF-1.7\n" + b"\r\n--" + BOUNDARY[:-1].encode() + b"X\r\n" + os.urandom(3000)
+    body = multipart_body(("mode", None, None, "snel – graag".encode()),
+                          ("file", "leveringen oktober.pdf", "application/pdf", pdf),
+                          ("extra", "foto.png", "image/png", b"\x89PNG"))
+    for step in (1, 7, 61, 4096):
+        store = UploadStore(tempfile.mkdtemp())
+        upload = multipart_upload.receive_upload(TrickleStream(body, step), headers_for(body), store, accept=is_pdf)
+        assert upload["sha256"] == hashlib.sha256(pdf).hexdigest(), step
+        assert upload["fileName"] == "leveringen oktober.pdf" and upload["contentType"] == "application/pdf"
+        assert upload["fields"] == {"mode": "snel – graag"}
+        assert store.stats()["blobs"] == 1
+    print("✅ Same result for 1, 7, 61 and 4096 byte reads")
+
+
+def test_raw_body():
+    """A bare PDF body is stored the same way"""
+    print("📄 Testing raw body upload...")
+    store = UploadStore(tempfile.mkdtemp())
+    pdf = b"%PDF-1.4\n" + os.urandom(100)
+    headers = dict(headers_for(pdf, 'application/pdf'), **{'X-File-Name': 'route.pdf'})
+    upload = multipart_upload.receive_upload(io.BytesIO(pdf), headers, store, accept=is_pdf)
+    assert (upload["fileName"], upload["size"]) == ("route.pdf", len(pdf))
+    with store.open(upload["sha256"]) as f:
+        assert f.read() == pdf
+    print("✅ Stored under its hash")
+
+
+def test_early_rejection():
+    """Oversized and non-PDF files are refused without reading the whole upload"""
+    print("🛑 Testing early rejection...")
+    store = UploadStore(tempfile.mkdtemp())
+
+    big = GeneratedUpload(200 * 1024 * 1024)
+    try:
+        multipart_upload.receive_upload(big, {'Content-Type': f"multipart/form-data; boundary={BOUNDARY}",
+                                              'Content-Length': str(big.length)}, store,
+                                        max_file_bytes=1024 * 1024, max_body_bytes=big.length)
+        assert False, "expected UploadTooLarge"
+    except multipart_upload.UploadTooLarge as e:
+        assert e.status == 413
+    assert big.consumed < 2 * 1024 * 1024, big.consumed
+
+    try:
+        multipart_upload.receive_upload(io.BytesIO(b""), {'Content-Length': str(10 ** 12)}, store)
+        assert False, "expected UploadTooLarge"
+    except multipart_upload.UploadTooLarge:
+        pass
+
+    body = multipart_body(("file", "foto.jpg", "image/jpeg", b"\xff\xd8\xff" + os.urandom(5000)))
+    try:
+        multipart_upload.receive_upload(io.BytesIO(body), headers_for(body), store, accept=is_pdf)
+        assert False, "expected UnsupportedUpload"
+    except multipart_upload.UnsupportedUpload as e:
+        assert e.status == 415
+
+    for body in (multipart_body(("mode", None, None, b"x")), multipart_body(("file", "a.pdf", None, b"%PDF"))[:-8]):
+        try:
+            multipart_upload.receive_upload(io.BytesIO(body), headers_for(body), store)
+            assert False, "expected UploadError"
+        except multipart_upload.UploadError as e:
+            assert e.status == 400
+
+    assert store.stats()["blobs"] == 0 and os.listdir(store.tmp_dir) == []
+    print(f"✅ 200 MB upload refused after {big.consumed // 1024} KB, nothing left behind")
+
+
+def test_bounded_memory():
+    """A 48 MB scan streams through with a small, constant memory footprint"""
+    print("💾 Testing memory use...")
+    store = UploadStore(tempfile.mkdtemp())
+    upload = GeneratedUpload(48 * 1024 * 1024)
+    tracemalloc.start()
+    result = multipart_upload.receive_upload(
+        upload, {'Content-Type': f"multipart/form-data; boundary={BOUNDARY}", 'Content-Length': str(upload.length)},
+        store, accept=is_pdf)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert result["size"] == len(b"%PDF-1.7\n") + 48 * 1024 * 1024
+    assert peak < 2 * 1024 * 1024, f"peak {peak} bytes"
+    print(f"✅ 48 MB stored with a peak of {peak // 1024} KB")
+
+
+if __name__ == "__main__":
+    print("🚀 Multipart Upload Test")
+    print("=" * 50)
+
+    test_parts_across_chunk_edges()
+    test_raw_body()
+    test_early_rejection()
+    test_bounded_memory()
+
+    print("\n✨ All tests completed!")
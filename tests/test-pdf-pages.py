@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Test script for page-parallel PDF manifest extraction
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts', 'start-scripts'))
+
+import pdf_pages
+
+HEADER = ["Overzicht Leveringen – 30 oktober 2025", "REF | Klant | Adres | Tijd"]
+
+
+def write_manifest(pages):
+    """Multi-page PDF with a classic xref table; each page is a list of table rows (lists of cells)"""
+    objects = {1: b"<< /Type /Catalog /Pages 2 0 R >>",
+               3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"}
+    kids = []
+    for i, rows in enumerate(pages):
+        ops = [b"BT /F1 10 Tf"]
+        for r, cells in enumerate(rows):
+            for c, cell in enumerate(cells):
+                text = cell.encode('cp1252').replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+                ops.append(b"1 0 0 1 %d %d Tm (%s) Tj" % (40 + 140 * c, 800 - 16 * r, text))
+        ops.append(b"ET")
+        content = zlib.compress(b"\n".join(ops))
+        page_num, content_num = 4 + 2 * i, 5 + 2 * i
+        objects[content_num] = b"<< /Filter /FlateDecode /Length %d >>\nstream\n" % len(content) + content + b"\nendstream"
+        objects[page_num] = b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents %d 0 R >>" % content_num
+        kids.append(b"%d 0 R" % page_num)
+    objects[2] = b"<< /Type /Pages /Count %d /Kids [%s] /Resources << /Font << /F1 3 0 R >> >> >>" % (
+        len(kids), b" ".join(kids))
+
+    fd, path = tempfile.mkstemp(suffix='.pdf')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = {}
+        for num in sorted(objects):
+            offsets[num] = f.tell()
+            f.write(b"%d 0 obj\n" % num + objects[num] + b"\nendobj\n")
+        xref = f.tell()
+        size = max(objects) + 1
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % size)
+        for num in range(1, size):
+            f.write(b"%010d 00000 n \n" % offsets[num])
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, xref))
+    return path
+
+
+def manifest_pages(page_count, rows_per_page=40):
+    """Pages with a repeated header and page number; the last row of every page is cut in half"""
+    pages, ref = [], 0
+    for p in range(page_count):
+        rows = [[line] for line in HEADER]
+        if p:
+            # Second half of the row cut off at the bottom of the previous page
+            rows.append(["", "", "2000 Antwerpen", f"{8 + ref % 8:02d}:00 – {10 + ref % 8:02d}:00"])
+        for _ in range(rows_per_page):
+            ref += 1
+            rows.append([f"ORD-ANT{ref:04d}", f"Klant {ref}", f"Straat {ref},", ""])
+            rows.append(["", "", "2000 Antwerpen", f"{8 + ref % 8:02d}:00 – {10 + ref % 8:02d}:00"])
+        rows.pop()
+        rows.append([f"Pagina {p + 1} van {page_count}"])
+        pages.append(rows)
+    return pages, ref
+
+
+def test_split_sections():
+    """A page splits into leading text and the deliveries that start on it"""
+    print("✂️ Testing section split...")
+    head, sections = pdf_pages.split_sections(
+        "Vervolg van vorige pagina\nREF: A-1\nKlant: X\nREF: A-2\nKlant: Y\nPagina 2 van 3")
+    assert head == "Vervolg van vorige pagina"
+    assert sections == ["REF: A-1\nKlant: X", "REF: A-2\nKlant: Y"], sections
+    print("✅ Head and 2 sections, page number dropped")
+
+
+def test_stitching_across_pages():
+    """Deliveries cut by a page break come back whole and in page order"""
+    print("🧵 Testing page break stitching...")
+    pages, total = manifest_pages(3, rows_per_page=5)
+    path = write_manifest(pages)
+    try:
+        result = pdf_pages.extract_manifest(path, workers=1)
+    finally:
+        os.unlink(path)
+
+    assert result["pageCount"] == 3
+    assert len(result["sections"]) == total, len(result["sections"])
+    assert [s.split(' | ')[0] for s in result["sections"]] == [f"ORD-ANT{i:04d}" for i in range(1, total + 1)]
+    cut = result["sections"][4]
+    assert cut.startswith("ORD-ANT0005 | Klant 5 | Straat 5,") and "2000 Antwerpen" in cut, cut
+    assert "Overzicht" not in cut and "Pagina" not in cut
+    assert result["text"].count(HEADER[1]) == 1
+    print(f"✅ {total} deliveries over 3 pages, cut rows rejoined")
+
+
+def test_parallel_matches_inline():
+    """The process pool gives the same result as extracting inline"""
+    print("⚙️ Testing process pool...")
+    pages, total = manifest_pages(40)
+    path = write_manifest(pages)
+    try:
+        started = time.monotonic()
+        inline = pdf_pages.extract_manifest(path, workers=1)
+        inline_seconds = time.monotonic() - started
+
+        pdf_pages.extract_manifest(path, workers=4)  # warm up the worker processes
+        started = time.monotonic()
+        parallel = pdf_pages.extract_manifest(path, workers=4)
+        parallel_seconds = time.monotonic() - started
+    finally:
+        os.unlink(path)
+        pdf_pages.shutdown()
+
+    assert parallel["sections"] == inline["sections"]
+    assert parallel["text"] == inline["text"]
+    assert len(parallel["sections"]) == total
+    print(f"✅ 40 pages: inline {inline_seconds:.2f}s, pool {parallel_seconds:.2f}s "
+          f"(slowest page {parallel['slowestPageSeconds']}s, {os.cpu_count()} CPU)")
+
+
+def test_concurrent_inline():
+    """Request threads extracting short PDFs inline do not share file handles"""
+    print("🧵 Testing concurrent inline extraction...")
+    paths = [write_manifest(manifest_pages(3, rows_per_page=5)[0]) for _ in range(4)]
+    errors, counts = [], []
+
+    def extract(path):
+        try:
+            for _ in range(5):
+                counts.append(len(pdf_pages.extract_manifest(path, workers=1)["sections"]))
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+
+    threads = [threading.Thread(target=extract, args=(paths[i % 4],)) for i in range(16)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        for path in paths:
+            os.unlink(path)
+
+    assert not errors, errors[:3]
+    assert counts == [15] * 80, set(counts)
+    print("✅ 16 threads, 80 extractions, no closed files")
+
+
+if __name__ == "__main__":
+    print("🚀 PDF Pages Test")
+    print("=" * 50)
+
+    test_split_sections()
+    test_stitching_across_pages()
+    test_parallel_matches_inline()
+    test_concurrent_inline()
+
+    print("\n✨ All tests completed!")
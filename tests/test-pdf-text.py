@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Test script for the pure-Python PDF text extractor
+"""
+
+import io
+import os
+import sys
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts', 'start-scripts'))
+
+import pdf_text
+
+UPLOADS_DIR = os.path.join(os.path.dirname(__file__), '..', 'uploads')
+# PDFium export with ASCII85 + Flate content streams and WinAnsi Helvetica
+PDFIUM_SAMPLE = os.path.join(UPLOADS_DIR, '0ff69a26b049442e1fd20cad50e1acda')
+# "Microsoft: Print To PDF" of a scan: a CID font but no real text
+SCANNED_SAMPLE = os.path.join(UPLOADS_DIR, 'c0de920050cc78202e7e2161c585d19c')
+
+
+def build_compressed_pdf(page_lines):
+    """PDF 1.5 with an xref stream, an object stream and a Type0 font with a ToUnicode CMap"""
+    cmap = (b"begincmap 1 begincodespacerange <0000> <FFFF> endcodespacerange\n"
+            b"1 beginbfrange <0020> <007E> <0020> endbfrange\n"
+            b"1 beginbfchar <0101> <20AC> endbfchar endcmap")
+    fonts = b"<< /F1 << /Type /Font /Subtype /Type0 /BaseFont /Arial /Encoding /Identity-H /ToUnicode 3 0 R " \
+            b"/DescendantFonts [<< /Type /Font /Subtype /CIDFontType2 /DW 600 >>] >> >>"
+    contents = []
+    for lines in page_lines:
+        ops = [b"BT /F1 10 Tf 14 TL 1 0 0 1 50 800 Tm"]
+        for line in lines:
+            cells = [''.join(f"{ord(c) if c != '€' else 0x101:04X}" for c in cell) for cell in line.split(' | ')]
+            ops.append(b" ".join(f"[<{cell}>] TJ 150 0 Td".encode() for cell in cells))
+            ops.append(f"{-150 * len(cells)} -14 Td".encode())
+        ops.append(b"ET")
+        contents.append(zlib.compress(b"\n".join(ops)))
+
+    # Catalog, page tree, CMap, object stream 4, then a content stream and page per page
+    n_pages = len(page_lines)
+    page_nums = [6 + 2 * i for i in range(n_pages)]
+    plain = {1: b"<< /Type /Catalog /Pages 2 0 R >>",
+             2: b"<< /Type /Pages /Count %d /Kids [%s] /Resources << /Font %s >> >>" % (
+                 n_pages, b" ".join(b"%d 0 R" % n for n in page_nums), fonts)}
+    for i, num in enumerate(page_nums):
+        plain[num] = b"<< /Type /Page /Parent 2 0 R /Contents %d 0 R >>" % (num - 1)
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.5\n%\xe2\xe3\xcf\xd3\n")
+    offsets = {}
+
+    def write_stream(num, attrs, data):
+        offsets[num] = out.tell()
+        out.write(b"%d 0 obj\n<< %s /Length %d >>\nstream\n" % (num, attrs, len(data)) + data + b"\nendstream\nendobj\n")
+
+    write_stream(3, b"/Filter /ASCIIHexDecode", cmap.hex().encode() + b">")
+    for i, num in enumerate(page_nums):
+        write_stream(num - 1, b"/Filter /FlateDecode", contents[i])
+
+    # Catalog, page tree and pages live in object stream 4
+    header, body = b"", b""
+    for num, obj in plain.items():
+        header += b"%d %d " % (num, len(body))
+        body += obj + b"\n"
+    write_stream(4, b"/Type /ObjStm /N %d /First %d /Filter /FlateDecode" % (len(plain), len(header)),
+                 zlib.compress(header + body))
+
+    size = max(page_nums) + 2
+    xref_num = size - 1
+    offsets[xref_num] = out.tell()
+    rows = []
+    stm_index = {num: i for i, num in enumerate(plain)}
+    for num in range(size):
+        if num in stm_index:
+            rows.append(bytes([2]) + (4).to_bytes(4, 'big') + bytes([stm_index[num]]))
+        elif num in offsets:
+            rows.append(bytes([1]) + offsets[num].to_bytes(4, 'big') + bytes([0]))
+        else:
+            rows.append(bytes([0, 0, 0, 0, 0, 255]))
+    # PNG "Up" predictor, as real writers use for xref streams
+    raw, previous = b"", bytes(6)
+    for row in rows:
+        raw += b"\x02" + bytes((a - b) & 0xFF for a, b in zip(row, previous))
+        previous = row
+    data = zlib.compress(raw)
+    out.write(b"%d 0 obj\n<< /Type /XRef /Size %d /W [1 4 1] /Root 1 0 R /Filter /FlateDecode "
+              b"/DecodeParms << /Predictor 12 /Columns 6 >> /Length %d >>\nstream\n" % (xref_num, size, len(data))
+              + data + b"\nendstream\nendobj\n")
+    out.write(b"startxref\n%d\n%%%%EOF\n" % offsets[xref_num])
+    out.seek(0)
+    return out
+
+
+def test_pdfium_sample():
+    """ASCII85 + Flate content streams come back as table rows"""
+    print("📄 Testing PDFium upload...")
+    if not os.path.exists(PDFIUM_SAMPLE):
+        print("⚠️ Sample upload not present, skipping")
+        return
+    with open(PDFIUM_SAMPLE, 'rb') as f:
+        pages = list(pdf_text.iter_page_texts(f))
+    lines = pages[0].splitlines()
+    assert len(pages) == 1
+    assert lines[0] == "Overzicht Leveringen – 30 oktober 2025", lines[0]
+    assert lines[1] == "REF | Klant | Adres | Tijd | Nummer", lines[1]
+    assert "ORD-BRU3002 | Café Meridian" in pages[0]
+    print(f"✅ {len(lines)} lines, accents and en dashes decoded")
+
+
+def test_scanned_pdf_has_no_text():
+    """A scan printed to PDF yields pages without text"""
+    print("🖨️ Testing scanned upload...")
+    if not os.path.exists(SCANNED_SAMPLE):
+        print("⚠️ Sample upload not present, skipping")
+        return
+    with open(SCANNED_SAMPLE, 'rb') as f:
+        assert pdf_text.extract_text(f) == ""
+    print("✅ No text layer detected")
+
+
+def test_compressed_xref_and_cid_font():
+    """Xref streams, object streams and ToUnicode CMaps are followed"""
+    print("🗜️ Testing PDF 1.5 compressed structure...")
+    pages = [["REF | Klant | Bedrag", "ORD-1 | Bakkerij Smet | € 12"], ["ORD-2 | Hotel Zuid | € 30"]]
+    pages_text = list(pdf_text.iter_page_texts(build_compressed_pdf(pages)))
+    assert pages_text == ["\n".join(lines) for lines in pages], pages_text
+    print("✅ 2 pages decoded through a CID font")
+
+
+def test_not_a_pdf():
+    """Other files are rejected with PDFError"""
+    print("🚫 Testing non-PDF input...")
+    try:
+        pdf_text.extract_text(io.BytesIO(b"\x89PNG\r\n\x1a\n"))
+        assert False, "expected PDFError"
+    except pdf_text.PDFError:
+        pass
+    print("✅ Rejected")
+
+
+def test_decompression_bomb():
+    """A Flate stream that inflates past MAX_STREAM_BYTES is refused instead of decoded"""
+    print("💣 Testing decompression limit...")
+    data = zlib.compress(b"\0" * (pdf_text.MAX_STREAM_BYTES + 1), 9)
+    try:
+        pdf_text.decode_stream_data(data, ['FlateDecode'], [])
+        assert False, "expected PDFError"
+    except pdf_text.PDFError:
+        pass
+    assert len(pdf_text.decode_stream_data(data[:len(data) // 2], ['FlateDecode'], [])) > 0
+    assert pdf_text.decode_stream_data(zlib.compress(b"BT ET"), ['FlateDecode'], []) == b"BT ET"
+    print(f"✅ {len(data)} compressed bytes refused")
+
+
+if __name__ == "__main__":
+    print("🚀 PDF Text Test")
+    print("=" * 50)
+
+    test_pdfium_sample()
+    test_scanned_pdf_has_no_text()
+    test_compressed_xref_and_cid_font()
+    test_not_a_pdf()
+    test_decompression_bomb()
+
+    print("\n✨ All tests completed!")
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Test script for the prompt diet that strips email boilerplate before the LLM
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts', 'start-scripts'))
+
+from prompt_diet import slim_text
+
+forwarded_email = """---------- Forwarded message ---------
+Van: Planning <planning@bdbike.be>
+Verzonden: maandag 10 oktober 2025 09:12
+Aan: ops@urbantz.be
+Onderwerp: Overzicht van 2 leveringen
+
+Hey,
+
+| Ref | Klant | Adres | Tijdslot |
+|-----|-------|-------|----------|
+| ORD-001 | Bakkerij Jan | Hoofdstraat 1, 1000 Brussel | 08:00–10:00 |
+Pagina 1 van 2
+| Ref | Klant | Adres | Tijdslot |
+|-----|-------|-------|----------|
+| ORD-002 | Café Marie | Kerkstraat 5, 2000 Antwerpen | 09:00–11:00 |
+
+Met vriendelijke groeten,
+**Mats Domus**
+
+Dit bericht is vertrouwelijk en uitsluitend bestemd voor de geadresseerde.
+
+Op 9 okt. 2025 om 10:00 schreef Jan <jan@bdbike.be>:
+> Kun je de lijst sturen?
+"""
+
+
+def test_forwarded_email():
+    """Boilerplate goes, every delivery row stays"""
+    print("✂️ Testing forwarded email with signature and quoted reply...")
+    slimmed, stats = slim_text(forwarded_email)
+
+    assert "ORD-001" in slimmed and "ORD-002" in slimmed
+    assert "Onderwerp: Overzicht van 2 leveringen" in slimmed
+    assert "Mats Domus" not in slimmed and "vertrouwelijk" not in slimmed
+    assert "Kun je de lijst sturen" not in slimmed and "Verzonden" not in slimmed
+    assert slimmed.count("| Ref | Klant") == 1
+    assert stats["tokensSaved"] > 0
+    print(f"✅ {stats['tokensSaved']} tokens saved ({stats['tokensBefore']} → {stats['tokensAfter']})")
+
+
+def test_quoted_delivery_kept():
+    """A reply on top of quoted delivery data keeps the data"""
+    print("💬 Testing reply with the deliveries only in the quote...")
+    slimmed, _ = slim_text("Zie hieronder.\n\nOp 9 okt. 2025 schreef Jan:\n> REF: ORD-9\n> Adres: Kerkstraat 5, 2000 Antwerpen\n")
+
+    assert "REF: ORD-9" in slimmed and "Kerkstraat 5" in slimmed
+    print("✅ Quoted delivery data kept")
+
+
+def test_time_window_labels_kept():
+    """ "Van:"/"Aan:" lines outside a mail header are delivery data"""
+    print("🕗 Testing Van/Tot time window lines...")
+    slimmed, stats = slim_text("REF: ORD-5\nAdres: Bruul 48, 2800 Mechelen\nVan: 08:00\nTot: 10:00\n"
+                               "Van: Brussel\nAan: Kerkstraat 5, 2000 Antwerpen\n")
+
+    assert "Van: 08:00" in slimmed and "Tot: 10:00" in slimmed
+    assert "Van: Brussel" in slimmed and "Aan: Kerkstraat 5" in slimmed
+    assert stats["removed"]["headerLines"] == 0
+
+    slimmed, _ = slim_text("Van: Jan Peeters\nVerzonden: maandag 10:14\nAan: Planning\nOnderwerp: Levering\n\n"
+                           "REF: ORD-6\nVan: 09:00\n")
+    assert "Jan Peeters" not in slimmed and "Verzonden" not in slimmed and "Aan: Planning" not in slimmed
+    assert "Onderwerp: Levering" in slimmed and "Van: 09:00" in slimmed
+    print("✅ Time windows kept, reply headers dropped")
+
+
+def test_quoted_blocks_decided_separately():
+    """A reply with a time above a quoted delivery keeps the delivery, not the chit-chat"""
+    print("💬 Testing reply above quoted delivery data...")
+    text = ("Graag morgen voor 10:00 leveren\n\nOp 9 okt. 2025 schreef Jan:\n"
+            "> REF: ORD-9\n> Adres: Kerkstraat 5, 2000 Antwerpen\n>\n> Groeten\n\n"
+            "Op 8 okt. 2025 schreef Marie:\n> Kun je de lijst sturen?\n")
+    slimmed, stats = slim_text(text)
+
+    assert "Graag morgen voor 10:00" in slimmed
+    assert "REF: ORD-9" in slimmed and "Kerkstraat 5" in slimmed and ">" not in slimmed
+    assert "Kun je de lijst sturen" not in slimmed and "schreef" not in slimmed
+    assert stats["removed"]["quotedLines"] == 3
+    print("✅ Quoted delivery kept, quoted question dropped")
+
+
+def test_sign_off_before_deliveries():
+    """A greeting followed by delivery data is not treated as a signature"""
+    print("👋 Testing greeting above the delivery list...")
+    slimmed, stats = slim_text("Groeten,\n\nREF: ORD-1\nAdres: Bruul 48, 2800 Mechelen\n")
+
+    assert "ORD-1" in slimmed and stats["removed"]["signatureLines"] == 0
+    print("✅ Deliveries after the greeting kept")
+
+
+if __name__ == "__main__":
+    print("🚀 Prompt Diet Test")
+    print("=" * 50)
+
+    test_forwarded_email()
+    test_quoted_delivery_kept()
+    test_time_window_labels_kept()
+    test_quoted_blocks_decided_separately()
+    test_sign_off_before_deliveries()
+
+    print("\n✨ All tests completed!")
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Test script for streaming CSV/XLSX delivery extraction
+"""
+
+import io
+import os
+import sys
+import tempfile
+import tracemalloc
+import zipfile
+from xml.sax.saxutils import escape
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts', 'start-scripts'))
+
+import spreadsheet_ingest
+
+MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+
+
+def build_xlsx(rows):
+    """A minimal workbook; str cells become shared strings, floats use a date style"""
+    shared, sheet_rows = [], []
+    for r, row in enumerate(rows, 1):
+        cells = []
+        for c, value in enumerate(row):
+            ref = f"{chr(65 + c)}{r}"
+            if value is None:
+                continue
+            if isinstance(value, str):
+                if value not in shared:
+                    shared.append(value)
+                cells.append(f'<c r="{ref}" t="s"><v>{shared.index(value)}</v></c>')
+            elif isinstance(value, float):
+                cells.append(f'<c r="{ref}" s="1"><v>{value}</v></c>')
+            else:
+                cells.append(f'<c r="{ref}"><v>{value}</v></c>')
+        sheet_rows.append(f'<row r="{r}">{"".join(cells)}</row>')
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('xl/workbook.xml', f'<workbook xmlns="{MAIN_NS}" xmlns:r="http://schemas.openxmlformats.org/'
+                         'officeDocument/2006/relationships"><sheets><sheet name="Leveringen" sheetId="1" r:id="rId1"/>'
+                         '</sheets></workbook>')
+        archive.writestr('xl/_rels/workbook.xml.rels', '<Relationships xmlns="http://schemas.openxmlformats.org/'
+                         'package/2006/relationships"><Relationship Id="rId1" Target="worksheets/data.xml"/>'
+                         '</Relationships>')
+        archive.writestr('xl/styles.xml', f'<styleSheet xmlns="{MAIN_NS}"><numFmts><numFmt numFmtId="164" '
+                         'formatCode="dd/mm/yyyy"/></numFmts><cellXfs><xf numFmtId="0"/><xf numFmtId="164"/>'
+                         '</cellXfs></styleSheet>')
+        archive.writestr('xl/sharedStrings.xml', f'<sst xmlns="{MAIN_NS}">' +
+                         ''.join(f'<si><t>{escape(s)}</t></si>' for s in shared) + '</sst>')
+        archive.writestr('xl/worksheets/data.xml', f'<worksheet xmlns="{MAIN_NS}"><sheetData>' +
+                         ''.join(sheet_rows) + '</sheetData></worksheet>')
+    buffer.seek(0)
+    return buffer
+
+
+def test_xlsx():
+    """Header below a title row, shared strings, dates and numeric postcodes"""
+    print("📊 Testing XLSX...")
+    workbook = build_xlsx([
+        ["Leveringen week 44"],
+        ["Ref", "Klant", "Adres", "Postcode", "Gemeente", "Datum", "Tijdslot", "Contact"],
+        ["ORD-001", "Bakkerij Jan", "Hoofdstraat 1", 1000, "Brussel", 45961.0, "08:00–10:00", "+32 2 123 45 67"],
+        [],
+        ["ORD-002", "Café Marie", "Kerkstraat 5", 2000, "Antwerpen", 45961.0, "9u00 - 11u00", None],
+    ])
+    assert spreadsheet_ingest.detect_format(workbook.getvalue()[:8], 'leveringen.xlsx') == 'xlsx'
+    deliveries, columns = spreadsheet_ingest.read_deliveries(workbook, 'xlsx')
+    assert columns["customerRef"] == "Ref" and columns["contact"] == "Contact"
+    assert [d["customerRef"] for d in deliveries] == ["ORD-001", "ORD-002"]
+    first, second = deliveries
+    assert first["deliveryAddress"] == {"line1": "Hoofdstraat 1, 1000 Brussel", "contactName": "Bakkerij Jan",
+                                        "contactPhone": "+32 2 123 45 67"}, first
+    assert first["serviceDate"] == "2025-10-31"
+    assert (first["timeWindowStart"], first["timeWindowEnd"]) == ("08:00", "10:00")
+    assert (second["timeWindowStart"], second["timeWindowEnd"]) == ("09:00", "11:00")
+    assert second["deliveryAddress"]["contactPhone"] == "+32 000 000 000"
+    print("✅ Two deliveries, title and empty rows skipped")
+
+
+def test_csv_dialects():
+    """Semicolon CSV in cp1252 as Excel saves it, and comma CSV with quotes"""
+    print("📄 Testing CSV...")
+    data = "Referentie;Naam;Leveradres;Leverdatum;Van;Tot;Aantal\r\nBXL2501;Fleur du Jour;Vlaanderenstraat 16, 9000 Gent;" \
+           "31/10/2025;10:00;13:00;3 colli\r\n".encode('cp1252')
+    (delivery,), _ = spreadsheet_ingest.read_deliveries(io.BytesIO(data), 'csv')
+    assert delivery["customerRef"] == "BXL2501" and delivery["serviceDate"] == "2025-10-31"
+    assert (delivery["timeWindowStart"], delivery["timeWindowEnd"]) == ("10:00", "13:00")
+    assert delivery["items"][0]["quantity"] == 3
+
+    data = b'\xef\xbb\xbfref,adres,tijdslot\nORD-9,"Bruul 48, 2800 Mechelen",14:00-16:00\n'
+    (delivery,), _ = spreadsheet_ingest.read_deliveries(io.BytesIO(data), 'csv')
+    assert delivery["deliveryAddress"]["line1"] == "Bruul 48, 2800 Mechelen"
+
+    try:
+        spreadsheet_ingest.read_deliveries(io.BytesIO(b"Beste,\nzie bijlage.\n"), 'csv')
+        assert False, "expected NoHeaderFound"
+    except spreadsheet_ingest.NoHeaderFound:
+        pass
+    try:
+        spreadsheet_ingest.read_deliveries(io.BytesIO(b"PK\x03\x04broken"), 'xlsx')
+        assert False, "expected SpreadsheetError"
+    except spreadsheet_ingest.SpreadsheetError:
+        pass
+    print("✅ Delimiter, encoding and quoting detected")
+
+
+def test_large_sheet_constant_memory():
+    """100k CSV rows and a large worksheet stream through without holding the file"""
+    print("💾 Testing 100k rows...")
+    path = os.path.join(tempfile.mkdtemp(), 'bulk.csv')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("Ref;Klant;Adres;Datum;Tijdslot;Contact\n")
+        for i in range(100_000):
+            f.write(f"ORD-{i};Klant {i};Straat {i}, 9000 Gent;2025-11-0{i % 9 + 1};08:00-10:00;+32 470 {i:06d}\n")
+
+    tracemalloc.start()
+    with open(path, 'rb') as f:
+        reader = spreadsheet_ingest.DeliveryReader(f, 'csv')
+        count = sum(1 for _ in reader)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert count == 100_000 and reader.skipped == 0
+    assert peak < 1024 * 1024, f"peak {peak} bytes"
+
+    # Worksheet rows are dropped from the XML tree once converted
+    workbook = build_xlsx([["Ref", "Adres", "Datum"]] +
+                          [[f"ORD-{i % 100}", "Bruul 48, 2800 Mechelen", 45961.0] for i in range(30_000)])
+    tracemalloc.start()
+    xlsx_count = sum(1 for _ in spreadsheet_ingest.DeliveryReader(workbook, 'xlsx'))
+    xlsx_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert xlsx_count == 30_000 and xlsx_peak < 1024 * 1024, f"peak {xlsx_peak} bytes"
+    print(f"✅ 100000 CSV deliveries with a peak of {peak // 1024} KB, 30000 XLSX rows with {xlsx_peak // 1024} KB")
+
+
+if __name__ == "__main__":
+    print("🚀 Spreadsheet Ingest Test")
+    print("=" * 50)
+
+    test_xlsx()
+    test_csv_dialects()
+    test_large_sheet_constant_memory()
+
+    print("\n✨ All tests completed!")
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Test script for the content-addressed upload store
+"""
+
+import hashlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts', 'start-scripts'))
+
+from upload_store import UploadStore
+
+
+def test_dedupe():
+    """The same bytes under different names are stored once"""
+    print("📦 Testing deduplication...")
+    store = UploadStore(tempfile.mkdtemp())
+    data = b"%PDF-1.4\n" + os.urandom(5000)
+
+    sha, created = store.put(io.BytesIO(data), 'application/pdf', 'leveringen.pdf')
+    again, created_again = store.put_bytes(data, 'application/pdf', 'kopie.pdf')
+    assert sha == again == hashlib.sha256(data).hexdigest()
+    assert created and not created_again
+    assert store.stats()["blobs"] == 1 and store.stats()["blobBytes"] == len(data)
+    with store.open(sha) as f:
+        assert f.read() == data
+    assert store.info(sha)["name"] == 'leveringen.pdf'
+    assert os.listdir(store.tmp_dir) == []
+    print("✅ One copy kept, temporary file removed")
+
+
+def test_artifacts():
+    """Derived artifacts hang off the blob hash"""
+    print("🧾 Testing derived artifacts...")
+    store = UploadStore(tempfile.mkdtemp())
+    sha, _ = store.put_bytes(b"%PDF-1.4 test")
+    assert store.get_json(sha, 'manifest.json') is None
+
+    store.put_json(sha, 'manifest.json', {"text": "Café", "pageCount": 1})
+    store.put_artifact(sha, 'page-1.png', b"\x89PNG")
+    assert store.get_json(sha, 'manifest.json') == {"text": "Café", "pageCount": 1}
+    assert store.artifacts(sha) == ['manifest.json', 'page-1.png']
+
+    for bad in ('../escape', '.hidden'):
+        try:
+            store.put_artifact(sha, bad, b"x")
+            assert False, f"{bad} accepted"
+        except ValueError:
+            pass
+    print("✅ Artifacts stored and names validated")
+
+
+def test_import_directory():
+    """An uploads/ folder with duplicate PDFs and page renders is folded into the store"""
+    print("🗂️ Testing uploads/ import...")
+    source = tempfile.mkdtemp()
+    pdf, render = b"%PDF-1.7 manifest", b"\x89PNG render"
+    for name in ('a1', 'b2', 'c3'):
+        with open(os.path.join(source, name), 'wb') as f:
+            f.write(pdf)
+        with open(os.path.join(source, f"{name}_page_1.png"), 'wb') as f:
+            f.write(render)
+    with open(os.path.join(source, 'gone_page_1.png'), 'wb') as f:
+        f.write(b"\x89PNG orphan")
+
+    store = UploadStore(tempfile.mkdtemp())
+    result = store.import_directory(source)
+    assert result["files"] == 7
+    assert (result["stored"], result["pageRenders"], result["duplicates"]) == (2, 1, 4), result
+    sha = hashlib.sha256(pdf).hexdigest()
+    assert store.get_artifact(sha, 'page-1.png') == render
+    print(f"✅ 7 files → {store.stats()['blobs']} blobs, {result['duplicateBytes']} bytes saved")
+
+
+def test_compaction():
+    """Over budget the least recently used uploads go first; pinned ones stay"""
+    print("🧹 Testing compaction...")
+    store = UploadStore(tempfile.mkdtemp())
+    hashes = []
+    for i in range(5):
+        sha, _ = store.put_bytes(bytes([i]) * 1000)
+        store.put_json(sha, 'manifest.json', {"page": i})
+        hashes.append(sha)
+    now = time.time()
+    with store._lock:
+        for i, sha in enumerate(hashes):
+            store._conn.execute('UPDATE blobs SET last_used = ? WHERE sha256 = ?', (now - 100 + i, sha))
+    store.get_artifact(hashes[1], 'manifest.json')  # used again, so most recent
+    store.put_artifact("f" * 64, 'manifest.json', b"{}")  # artifact without a blob
+    stale = os.path.join(store.tmp_dir, 'upload-crashed')
+    with open(stale, 'wb') as f:
+        f.write(b"x" * 500)
+    os.utime(stale, (now - 7200, now - 7200))
+
+    per_upload = 1000 + os.path.getsize(store.artifact_path(hashes[0], 'manifest.json'))
+    result = store.compact(max_bytes=3 * per_upload, retention_seconds=0, pinned={hashes[0]})
+    assert result["pinned"] == 1 and result["evicted"] == 3 and result["tmpFilesRemoved"] == 1, result
+    assert result["reclaimedBytes"] == 2 * per_upload + 2 + 500
+    remaining = {row["sha256"] for row in store._conn.execute("SELECT sha256 FROM blobs")}
+    assert remaining == {hashes[0], hashes[1], hashes[4]}, remaining
+    assert not store.exists(hashes[2]) and store.get_json(hashes[2], 'manifest.json') is None
+    assert result["usageBytes"] == store.usage() == 3 * per_upload
+
+    # Within budget only expired uploads are evicted, unless an analysis holds them
+    with store.hold(hashes[0]):
+        result = store.compact(max_bytes=10 ** 9, retention_seconds=98)
+        assert result["evicted"] == 0 and result["pinned"] == 1 and store.exists(hashes[0])
+    result = store.compact(max_bytes=10 ** 9, retention_seconds=98)
+    assert result["evicted"] == 1 and not store.exists(hashes[0])
+    print("✅ LRU eviction honours pins, held uploads, retention and the budget")
+
+
+def test_pins_across_processes():
+    """A hold taken by another process sharing the store keeps the compactor away until its lease ends"""
+    print("📌 Testing shared pins...")
+    root = tempfile.mkdtemp()
+    tool, server = UploadStore(root), UploadStore(root)
+    sha, _ = tool.put_bytes(b"manifest" * 100)
+
+    with tool.hold(sha), tool.hold(sha):
+        result = server.compact(max_bytes=0)
+        assert result["pinned"] == 1 and result["evicted"] == 0 and server.exists(sha), result
+    assert server.compact(max_bytes=0)["evicted"] == 1 and not tool.exists(sha)
+
+    # A tool that stopped without unpinning stops protecting its upload when the lease runs out
+    crashed = UploadStore(root, pin_lease_seconds=-1)
+    sha, _ = crashed.put_bytes(b"crashed" * 100)
+    crashed.pin(sha)
+    assert server.compact(max_bytes=0)["evicted"] == 1 and not server.exists(sha)
+    assert server._conn.execute("SELECT COUNT(*) FROM pins").fetchone()[0] == 0
+    print("✅ Holds are shared through the index and expire")
+
+
+if __name__ == "__main__":
+    print("🚀 Upload Store Test")
+    print("=" * 50)
+
+    test_dedupe()
+    test_artifacts()
+    test_import_directory()
+    test_compaction()
+    test_pins_across_processes()
+
+    print("\n✨ All tests completed!")
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Test script for the pooled Urbantz announce client against a local stub
+"""
+
+import http.server
+import json
+import os
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts', 'start-scripts'))
+
+from export_queue import ExportQueue, ExportWorker
+from export_store import ExportStore
+from urbantz_client import AdaptiveLimiter, UrbantzClient
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    """Minimal /v2/announce stub with keep-alive and 50ms latency"""
+    protocol_version = 'HTTP/1.1'
+    connections = set()
+    requests = 0
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with self.lock:
+            self.connections.add(self.client_address)
+            StubHandler.requests += 1
+        time.sleep(0.05)
+
+        if body['customerRef'].startswith('BAD'):
+            status, answer = 409, {"error": "duplicate"}
+        else:
+            status, answer = 200, {"taskId": f"TASK-{body['customerRef']}"}
+
+        data = json.dumps(answer).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class ThrottlingStubHandler(StubHandler):
+    """Answers 429 + Retry-After whenever more than 5 calls are in flight"""
+    in_flight = 0
+    rejected = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        with self.lock:
+            ThrottlingStubHandler.in_flight += 1
+            overloaded = ThrottlingStubHandler.in_flight > 5
+            if overloaded:
+                ThrottlingStubHandler.rejected += 1
+        time.sleep(0.02)
+        with self.lock:
+            ThrottlingStubHandler.in_flight -= 1
+
+        status, answer = (429, {"error": "slow down"}) if overloaded else (200, {"taskId": "TASK"})
+        data = json.dumps(answer).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        if overloaded:
+            self.send_header('Retry-After', '0.05')
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FlakyStubHandler(StubHandler):
+    """Answers 503 without Retry-After to the first two calls for each delivery"""
+    calls = {}
+
+    def do_POST(self):
+        ref = json.loads(self.rfile.read(int(self.headers['Content-Length'])))['customerRef']
+        with self.lock:
+            times = FlakyStubHandler.calls.setdefault(ref, [])
+            times.append(time.monotonic())
+            failing = len(times) <= 2
+
+        status, answer = (503, {"error": "unavailable"}) if failing else (200, {"taskId": f"TASK-{ref}"})
+        data = json.dumps(answer).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class StubServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+
+
+def delivery(ref):
+    return {"customerRef": ref, "deliveryAddress": {"line1": "Bruul 48, 2800 Mechelen"},
+            "serviceDate": "2025-10-11", "timeWindowStart": "08:00", "timeWindowEnd": "10:00"}
+
+
+def test_concurrent_export(base_url):
+    """100 deliveries at 10 in flight finish in ~10 round-trips over reused connections"""
+    print("📦 Testing concurrent export of 100 deliveries...")
+    client = UrbantzClient(base_url=base_url, api_key='test-key', concurrency=10, adaptive=False)
+    deliveries = [delivery(f"ORD-{i:03d}") for i in range(98)] + [delivery("BAD-1"), {"customerRef": "NOADDR"}]
+
+    started = time.monotonic()
+    results = client.export_deliveries(deliveries)
+    elapsed = time.monotonic() - started
+    client.close()
+
+    assert [r['customerRef'] for r in results] == [d['customerRef'] for d in deliveries]
+    assert all(r['status'] == 'success' and r['taskId'] == f"TASK-{r['customerRef']}" for r in results[:98])
+    assert results[98]['status'] == 'failed' and results[98]['httpStatus'] == 409
+    assert results[99]['status'] == 'failed' and 'deliveryAddress' in results[99]['error']
+    assert elapsed < 2.0, f"export too slow: {elapsed:.2f}s"
+    assert len(StubHandler.connections) <= 10, f"{len(StubHandler.connections)} connections opened"
+    print(f"✅ {len(results)} results in order in {elapsed:.2f}s over {len(StubHandler.connections)} connections")
+
+
+def test_malformed_tail(base_url):
+    """Deliveries submitted before a malformed part of the body are still reported"""
+    print("🧩 Testing export cut short by a malformed body...")
+    client = UrbantzClient(base_url=base_url, api_key='test-key', concurrency=10, adaptive=False)
+
+    def deliveries():
+        for i in range(15):
+            yield delivery(f"TAIL-{i:02d}")
+        raise ValueError("Expecting ',' delimiter")
+
+    seen = {}
+    try:
+        for index, result in client.iter_export(deliveries()):
+            seen[index] = result
+        assert False, "expected ValueError"
+    except ValueError:
+        pass
+    client.close()
+
+    assert sorted(seen) == list(range(15)) and all(r['status'] == 'success' for r in seen.values()), seen
+    print("✅ 15 results yielded before the error")
+
+
+def test_idempotent_export(base_url):
+    """Re-exporting the same batch answers from the store without remote calls"""
+    print("🔁 Testing idempotent re-export...")
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ExportStore(os.path.join(tmp, 'exports.sqlite3'))
+        client = UrbantzClient(base_url=base_url, api_key='test-key', store=store)
+        deliveries = [delivery(f"IDEM-{i}") for i in range(20)]
+
+        first = client.export_deliveries(deliveries)
+        calls_before = StubHandler.requests
+        second = client.export_deliveries(deliveries)
+        client.close()
+        store.close()
+
+    assert StubHandler.requests == calls_before, "retry hit the API again"
+    assert all(r.get('cached') for r in second)
+    assert [r['taskId'] for r in first] == [r['taskId'] for r in second]
+    print("✅ Second export served from the store with the original task ids")
+
+
+def test_export_queue(base_url):
+    """Queued batches are drained in the background and survive a restart"""
+    print("🗄️ Testing durable export queue...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'exports.sqlite3')
+
+        # An item being exported by a live process
+        live = ExportQueue(path)
+        other_job = live.enqueue([delivery("LIVE-1")])
+        assert len(live.claim(10)) == 1
+
+        # A batch left 'running' by a crashed process is picked up again once its lease runs out
+        crashed = ExportQueue(path, lease_seconds=0.1)
+        job_id = crashed.enqueue([delivery(f"QUEUE-{i}") for i in range(30)] + [{"customerRef": "NOADDR"}],
+                                 upload_id="ab" * 32)
+        assert crashed.pending_upload_ids() == {"ab" * 32}
+        crashed.claim(10)
+        crashed._conn.close()
+
+        # Opening the queue elsewhere (a spawned worker process) leaves live claims alone
+        assert ExportQueue(path).recover_expired() == 0
+        time.sleep(0.1)
+
+        queue = ExportQueue(path)
+        client = UrbantzClient(base_url=base_url, api_key='test-key')
+        ExportWorker(queue, client).start()
+
+        for _ in range(100):
+            status = queue.status(job_id)
+            if status['status'] == 'done':
+                break
+            time.sleep(0.05)
+        client.close()
+        # The source upload is no longer pinned once the job is done
+        assert queue.pending_upload_ids() == set()
+        # The live claim outlasted the restart and is finished by its owner only
+        assert queue.status(other_job)['results'][0]['status'] == 'running'
+        live.finish(other_job, 0, {"status": "success", "taskId": "TASK-LIVE-1"})
+        assert queue.status(other_job)['status'] == 'done'
+
+    assert status['status'] == 'done', status
+    assert status['successful'] == 30 and status['failed'] == 1 and status['pending'] == 0
+    assert status['results'][30]['error'] == 'deliveryAddress: is required; serviceDate: is required'
+    print(f"✅ Job finished after restart: {status['successful']} exported, {status['failed']} rejected")
+
+
+def test_adaptive_limit(base_url):
+    """The limit backs off under 429s and every delivery still gets through"""
+    print("📉 Testing AIMD back-off against a stub that allows 5 in flight...")
+    client = UrbantzClient(base_url=base_url, api_key='test-key', concurrency=20, max_retries=10)
+    results = client.export_deliveries([delivery(f"ORD-{i:03d}") for i in range(200)])
+    metrics = client.metrics()
+    client.close()
+
+    assert all(r['status'] == 'success' for r in results), [r for r in results if r['status'] != 'success'][:3]
+    assert metrics['decreases'] > 0 and metrics['limit'] < 20, metrics
+    print(f"✅ All delivered; limit settled at {metrics['limit']} after {metrics['throttled']} throttled calls "
+          f"({ThrottlingStubHandler.rejected} rejected by the stub)")
+
+
+def test_backoff_without_retry_after(base_url):
+    """5xx answers without Retry-After are retried after growing waits, not right away"""
+    print("⏳ Testing exponential backoff...")
+    client = UrbantzClient(base_url=base_url, api_key='test-key', concurrency=4, retry_base=0.05)
+    results = client.export_deliveries([delivery(f"ORD-{i}") for i in range(4)])
+    client.close()
+
+    assert all(r['status'] == 'success' for r in results), results
+    for ref, times in FlakyStubHandler.calls.items():
+        gaps = [b - a for a, b in zip(times, times[1:])]
+        assert len(gaps) == 2 and gaps[0] >= 0.05 and gaps[1] >= 0.1, (ref, gaps)
+    print(f"✅ Retried after {', '.join(f'{b - a:.2f}s' for a, b in zip(times, times[1:]))}")
+
+
+def test_pause_recovery():
+    """After Retry-After the limiter probes with one call, ramps up, and spreads waiters out"""
+    print("⏸️ Testing recovery from a Retry-After pause...")
+    limiter = AdaptiveLimiter(8, 1, 16)
+    for _ in range(8):
+        limiter.acquire()
+    limiter.release(0.01, 'throttled', retry_after=0.05)
+    for _ in range(7):
+        limiter.release(0.01, 'failed')
+    assert limiter.limit == 1 and limiter.ramp_target == 4
+
+    time.sleep(0.05)
+    limits = []
+    for _ in range(4):
+        limiter.acquire()
+        limiter.release(0.01, 'success')
+        limits.append(limiter.limit)
+    assert limits == [2, 3, 4, 4.25], limits
+
+    # A fixed limit keeps its size, but the waiters do not all wake at the same instant
+    limiter = AdaptiveLimiter(8, 8, 8, jitter=1.0)
+    for _ in range(8):
+        limiter.acquire()
+    limiter.release(0.01, 'throttled', retry_after=0.1)
+    resume = time.monotonic() + 0.1
+    for _ in range(7):
+        limiter.release(0.01, 'failed')
+    woke = []
+
+    def waiter():
+        limiter.acquire()
+        woke.append(time.monotonic())
+
+    threads = [threading.Thread(target=waiter) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert min(woke) >= resume - 0.005 and max(woke) - min(woke) > 0.02, [round(t - resume, 3) for t in woke]
+    print(f"✅ Probe at limit 1, ramp {limits}, waiters spread over {max(woke) - min(woke):.3f}s")
+
+
+if __name__ == "__main__":
+    print("🚀 Urbantz Client Test")
+    print("=" * 50)
+
+    with StubServer(("127.0.0.1", 0), StubHandler) as stub:
+        threading.Thread(target=stub.serve_forever, daemon=True).start()
+        test_concurrent_export(f"http://127.0.0.1:{stub.server_address[1]}")
+        test_malformed_tail(f"http://127.0.0.1:{stub.server_address[1]}")
+        test_idempotent_export(f"http://127.0.0.1:{stub.server_address[1]}")
+        test_export_queue(f"http://127.0.0.1:{stub.server_address[1]}")
+        stub.shutdown()
+
+    with StubServer(("127.0.0.1", 0), ThrottlingStubHandler) as stub:
+        threading.Thread(target=stub.serve_forever, daemon=True).start()
+        test_adaptive_limit(f"http://127.0.0.1:{stub.server_address[1]}")
+        stub.shutdown()
+
+    with StubServer(("127.0.0.1", 0), FlakyStubHandler) as stub:
+        threading.Thread(target=stub.serve_forever, daemon=True).start()
+        test_backoff_without_retry_after(f"http://127.0.0.1:{stub.server_address[1]}")
+        stub.shutdown()
+
+    test_pause_recovery()
+
+    print("\n✨ All tests completed!")
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Test script for the local Urbantz API stub, driven through UrbantzClient
+"""
+
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(__file__), '..', 'scripts', 'start-scripts')
+sys.path.insert(0, SCRIPTS_DIR)
+
+from export_store import ExportStore
+from task_reconciler import reconcile
+from urbantz_client import UrbantzClient
+
+_spec = importlib.util.spec_from_file_location('urbantz_stub', os.path.join(SCRIPTS_DIR, 'start-urbantz-stub.py'))
+urbantz_stub = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(urbantz_stub)
+
+
+def start_stub(*argv):
+    """Run the stub on a free port in a background thread"""
+    handler = type('Handler', (urbantz_stub.UrbantzStubHandler,), {})
+    handler.config = urbantz_stub.StubConfig(urbantz_stub.parse_args(list(argv)))
+    server = urbantz_stub.ThreadedHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, handler.config, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def delivery(ref):
+    return {"customerRef": ref, "deliveryAddress": {"line1": "Bruul 48, 2800 Mechelen"},
+            "serviceDate": "2025-10-11", "timeWindowStart": "08:00", "timeWindowEnd": "10:00"}
+
+
+def test_lost_responses_are_safe():
+    """Announces whose response got lost are retried with the same key and not duplicated"""
+    print("👻 Testing lost responses and duplicate detection...")
+    record = os.path.join(tempfile.mkdtemp(), 'received.jsonl')
+    server, config, base_url = start_stub('--profile', 'instant', '--lost-response-rate', '0.3',
+                                          '--seed', '7', '--record', record)
+    client = UrbantzClient(base_url=base_url, api_key='stub', concurrency=8, max_retries=5)
+    deliveries = [delivery(f"ORD-{i:03d}") for i in range(60)]
+
+    results = client.export_deliveries(deliveries)
+    assert all(r['status'] == 'success' for r in results), [r for r in results if r['status'] != 'success']
+    assert len({r['taskId'] for r in results}) == 60
+    assert config.stats['lostResponses'] > 0 and config.stats['replayed'] == config.stats['lostResponses']
+    assert len(config.tasks) == 60, "a retried announce created a second task"
+
+    # Another address gives another idempotency key, but the customerRef is already announced
+    moved = dict(deliveries[0], deliveryAddress={"line1": "Kerkstraat 5, 2000 Antwerpen"})
+    again = UrbantzClient(base_url=base_url, api_key='stub').export_one(moved)
+    assert again['status'] == 'failed' and again['httpStatus'] == 409
+
+    with urllib.request.urlopen(urllib.request.Request(f"{base_url}/v2/task/{results[0]['taskId']}",
+                                                       headers={'x-api-key': 'stub'})) as response:
+        assert json.loads(response.read())['customerRef'] == "ORD-000"
+    with open(record, encoding='utf-8') as f:
+        assert len(f.readlines()) == config.stats['requests']
+
+    client.close()
+    server.shutdown()
+    print(f"✅ {config.stats['lostResponses']} lost responses recovered, {config.stats['conflicts']} conflict detected")
+
+
+def test_rate_limited_throughput():
+    """A 200 req/s token bucket is respected through Retry-After"""
+    print("🚦 Testing throughput against a 200 req/s limit...")
+    server, config, base_url = start_stub('--latency', 'fixed:20', '--max-rps', '200')
+    client = UrbantzClient(base_url=base_url, api_key='stub', concurrency=16, max_retries=3,
+                           store=ExportStore(os.path.join(tempfile.mkdtemp(), 'exports.sqlite3')))
+
+    started = time.monotonic()
+    results = client.export_deliveries([delivery(f"RPS-{i:03d}") for i in range(400)])
+    elapsed = time.monotonic() - started
+
+    assert all(r['status'] == 'success' for r in results)
+    # A burst of 200, then one token every 5 ms
+    assert elapsed >= 0.95, f"400 announces at 200 req/s took only {elapsed:.2f}s"
+    client.close()
+    server.shutdown()
+    print(f"✅ 400 announces in {elapsed:.2f}s ({400 / elapsed:.0f}/s), {config.stats['rateLimited']} throttled")
+
+
+def test_reconciliation():
+    """Repeated passes use If-None-Match and only write tasks whose status changed"""
+    print("🔄 Testing task status reconciliation...")
+    server, config, base_url = start_stub('--profile', 'instant', '--status-change-rate', '0.2', '--seed', '3')
+    store = ExportStore(os.path.join(tempfile.mkdtemp(), 'exports.sqlite3'))
+    client = UrbantzClient(base_url=base_url, api_key='stub', concurrency=8, store=store)
+    results = client.export_deliveries([delivery(f"REC-{i:03d}") for i in range(100)])
+    assert all(r['status'] == 'success' for r in results)
+
+    first = reconcile(client, store, batch_size=30)
+    assert first['checked'] == 100 and first['changed'] == 100 and first['failed'] == 0
+
+    changes_before = config.stats['statusChanges']
+    second = reconcile(client, store, batch_size=30)
+    changed_remotely = config.stats['statusChanges'] - changes_before
+    assert second['changed'] == changed_remotely, (second, changed_remotely)
+    assert second['unchanged'] == second['checked'] - changed_remotely
+    assert config.stats['notModified'] == second['unchanged']
+
+    for result in results:
+        row = store.get(result['idempotencyKey'])
+        assert row['remote_status'] == config.tasks[result['taskId']]['status']
+
+    client.close()
+    server.shutdown()
+    print(f"✅ Second pass: {second['checked']} checked, {second['changed']} changed, "
+          f"{second['unchanged']} answered 304")
+
+
+if __name__ == "__main__":
+    print("🚀 Urbantz Stub Test")
+    print("=" * 50)
+
+    test_lost_responses_are_safe()
+    test_rate_limited_throughput()
+    test_reconciliation()
+
+    print("\n✨ All tests completed!")
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Test script for the watch-folder ingestion daemon
+"""
+
+import email.message
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts', 'start-scripts'))
+
+# Pattern extraction only, with throwaway stores; the workers inherit this environment
+os.environ.pop('ANTHROPIC_API_KEY', None)
+os.environ['UPLOAD_STORE_DIR'] = tempfile.mkdtemp()
+
+from export_queue import ExportQueue
+from watch_folder import FolderWatcher
+
+
+def write(folder, name, data):
+    path = os.path.join(folder, name)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def fill_inbox(inbox):
+    message = email.message.EmailMessage()
+    message['Subject'] = 'Levering'
+    message.set_content("REF: ORD-300\nAdres: Veldstraat 1, 9000 Gent\n")
+    write(inbox, 'mail.eml', message.as_bytes())
+    write(inbox, 'notitie.txt', "REF: ORD-200\nAdres: Bruul 48, 2800 Mechelen\nTijd: 10:00 - 12:00\n".encode())
+    write(inbox, 'lijst.csv', b"Ref;Klant;Adres\nORD-101;Jan;Hoofdstraat 1, 1000 Brussel\n"
+                              b"ORD-102;Marie;Kerkstraat 5, 2000 Antwerpen\n")
+    write(inbox, 'logo.png', b"\x89PNG\r\n\x1a\n" + b"\x00" * 100)
+    write(inbox, 'bezig.pdf.part', b"%PDF-1.4 half")
+
+
+def test_inbox_processed():
+    """Supported files land in done/, others in failed/, each with its analysis"""
+    print("👀 Testing inbox processing...")
+    inbox = tempfile.mkdtemp()
+    fill_inbox(inbox)
+    queue = ExportQueue(os.path.join(tempfile.mkdtemp(), 'queue.sqlite3'))
+    watcher = FolderWatcher(inbox, workers=2, export_queue=queue, settle_seconds=0)
+    try:
+        stats = watcher.run(poll_interval=0.1, once=True)
+    finally:
+        watcher.close()
+
+    assert stats == {"processed": 3, "failed": 1, "deliveries": 4, "exportJobs": 3}, stats
+    assert sorted(os.listdir(watcher.done_dir)) == ['lijst.csv', 'lijst.csv.json', 'mail.eml', 'mail.eml.json',
+                                                    'notitie.txt', 'notitie.txt.json']
+    assert sorted(os.listdir(watcher.failed_dir)) == ['logo.png', 'logo.png.json']
+    assert os.listdir(inbox).count('bezig.pdf.part') == 1 and os.listdir(watcher.processing_dir) == []
+
+    with open(os.path.join(watcher.done_dir, 'lijst.csv.json'), encoding='utf-8') as f:
+        result = json.load(f)
+    assert result["kind"] == 'csv' and result["method"] == 'column_mapping' and result["deliveryCount"] == 2
+    assert queue.status(result["exportJobId"])["pending"] == 2
+    assert result["uploadId"] in queue.pending_upload_ids()
+    print("✅ 3 files analyzed, 4 deliveries queued, the image refused, the partial copy left alone")
+
+
+def test_settle_and_recovery():
+    """Files still being written wait; files left in .processing/ are picked up again"""
+    print("⏳ Testing settle time and crash recovery...")
+    inbox = tempfile.mkdtemp()
+    os.makedirs(os.path.join(inbox, '.processing'))
+    write(os.path.join(inbox, '.processing'), 'onderbroken.txt', b"REF: ORD-900\nAdres: Markt 1, 9000 Gent\n")
+    watcher = FolderWatcher(inbox, workers=1, settle_seconds=60)
+    try:
+        assert os.listdir(watcher.processing_dir) == [] and 'onderbroken.txt' in os.listdir(inbox)
+        assert watcher.ready_files() == []
+        assert watcher.ready_files(now=time.time() + 61) == [os.path.join(inbox, 'onderbroken.txt')]
+
+        # A file that grows starts its settle time over
+        path = os.path.join(inbox, 'onderbroken.txt')
+        with open(path, 'ab') as f:
+            f.write(b"Tijd: 08:00 - 10:00\n")
+        os.utime(path, (time.time() + 5, time.time() + 5))
+        assert watcher.ready_files(now=time.time() + 62) == []
+    finally:
+        watcher.close()
+    print("✅ Unsettled files wait, interrupted files return to the inbox")
+
+
+if __name__ == "__main__":
+    print("🚀 Watch Folder Test")
+    print("=" * 50)
+
+    test_inbox_processed()
+    test_settle_and_recovery()
+
+    print("\n✨ All tests completed!")